@@ -0,0 +1,90 @@
+# benchmarks/auth_login.py
+"""
+Login throughput vs. event-loop responsiveness.
+
+"inline" verifies bcrypt on the event loop (what an async login without offloading does);
+"pool-N" uses PasswordHasher with N worker processes. While logins run, a probe task that
+stands in for other endpoints wakes every 10 ms and records how late it was scheduled.
+
+    python -m benchmarks.auth_login [--logins 64 --rounds 12 --workers 1,2,4]
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import numpy as np
+from passlib.context import CryptContext
+
+from edge_server.services.password_hasher import PasswordHasher
+from edge_server.utils import security
+
+
+async def _probe(stop: asyncio.Event, lags: list, interval: float = 0.01):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - start - interval)
+
+
+async def _run(verify, password: str, hashed: str, logins: int, concurrency: int):
+    stop, lags = asyncio.Event(), []
+    probe = asyncio.create_task(_probe(stop, lags))
+    await asyncio.sleep(0.05)
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            ok, _ = await verify(password, hashed)
+            assert ok
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await probe
+    lag_ms = np.array(lags or [0.0]) * 1000
+    return logins / elapsed, float(np.percentile(lag_ms, 50)), float(np.percentile(lag_ms, 99)), float(lag_ms.max())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--workers", default=",".join(str(1 << i) for i in range(8) if 1 << i <= (os.cpu_count() or 1)))
+    args = parser.parse_args()
+
+    # the worker processes import utils.security, so the cost has to be set through the environment
+    os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    security.pwd_context.update(bcrypt__rounds=args.rounds)
+    password = "correct horse battery staple"
+    hashed = CryptContext(schemes=["bcrypt"], bcrypt__rounds=args.rounds).hash(password)
+    print(f"{args.logins} logins, bcrypt cost {args.rounds}, {os.cpu_count()} CPU(s)")
+    print(f"  {'mode':10} {'logins/s':>9} {'probe p50':>10} {'p99':>9} {'max':>9}")
+
+    async def inline(p, h):
+        return security.verify_and_update(p, h)
+
+    rate, p50, p99, worst = asyncio.run(_run(inline, password, hashed, args.logins, args.concurrency))
+    print(f"  {'inline':10} {rate:9.1f} {p50:8.1f}ms {p99:7.1f}ms {worst:7.1f}ms")
+
+    for workers in (int(w) for w in args.workers.split(",")):
+        hasher = PasswordHasher(workers, max_pending=args.concurrency, timeout=60)
+
+        async def pooled():
+            hasher.start()
+            # warm the pool so process start-up is not measured
+            await asyncio.gather(*(hasher.verify_and_update(password, hashed) for _ in range(workers)))
+            try:
+                return await _run(hasher.verify_and_update, password, hashed, args.logins, args.concurrency)
+            finally:
+                hasher.stop()
+
+        rate, p50, p99, worst = asyncio.run(pooled())
+        print(f"  {'pool-' + str(workers):10} {rate:9.1f} {p50:8.1f}ms {p99:7.1f}ms {worst:7.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# benchmarks/command_queue.py
+"""
+Operator command round trips under load: N simulated vehicles (drone/sitl_stub.py) streaming
+position at R Hz into one MavlinkAdapter, while every mission gets a burst of commands and an
+occasional emergency RTL. Prints the dispatcher's enqueue->send and send->ACK histograms.
+
+    python -m benchmarks.command_queue [--vehicles 20 --hz 10 --commands 50]
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from edge_server.drone import sitl_stub
+from edge_server.drone.adapter import drone_manager_singleton
+from edge_server.drone.mav_control import MavlinkAdapter
+from edge_server.services.command_queue import CommandDispatcher
+
+PORT = 14599
+NORMAL_COMMANDS = (("pause", None), ("continue", None), ("speed", {"speed": 8}), ("arm", None))
+
+
+async def run(vehicles: int, hz: float, commands: int, emergency_every: int):
+    adapter = MavlinkAdapter(f"udpin:127.0.0.1:{PORT}", position_hz=hz)
+    drone_manager_singleton.adapter = adapter
+    await adapter.open()
+    sims = [sitl_stub.SimVehicle(i + 1) for i in range(vehicles)]
+    tasks = [asyncio.create_task(sitl_stub.run_vehicle(v, ("127.0.0.1", PORT))) for v in sims]
+    while len(adapter.vehicles) < vehicles:
+        await asyncio.sleep(0.05)
+    # attach mission i to vehicle i without going through mission upload
+    for sysid, v in adapter.vehicles.items():
+        v.mission_id = sysid
+    await asyncio.sleep(0.5)  # let the requested stream rates kick in
+
+    dispatcher = CommandDispatcher(timeout=1.0, retries=3, max_queue=commands + 1)
+    rng = random.Random(0)
+    submitted = []
+    start = time.perf_counter()
+    for i in range(commands):
+        for mission_id in range(1, vehicles + 1):
+            if emergency_every and i and i % emergency_every == 0 and rng.random() < 0.5:
+                submitted.append(dispatcher.submit(mission_id, "rtl"))
+            else:
+                submitted.append(dispatcher.submit(mission_id, *rng.choice(NORMAL_COMMANDS)))
+        await asyncio.sleep(0)
+    for cmd in submitted:
+        await dispatcher.wait(cmd, 30)
+    wall = time.perf_counter() - start
+    stats = dispatcher.stats()
+    received = sum(p.decoded for p in adapter._parsers.values())
+
+    await dispatcher.stop()
+    await adapter.close()
+    for t in tasks:
+        t.cancel()
+    return wall, len(submitted), stats, received
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vehicles", type=int, default=20)
+    parser.add_argument("--hz", type=float, default=10)
+    parser.add_argument("--commands", type=int, default=50, help="commands per mission")
+    parser.add_argument("--emergency-every", type=int, default=10)
+    args = parser.parse_args()
+
+    wall, n, stats, received = asyncio.run(run(args.vehicles, args.hz, args.commands, args.emergency_every))
+    print(f"{args.vehicles} vehicles @ {args.hz:g} Hz, {n:,} commands in {wall:.2f} s ({n / wall:,.0f}/s), "
+          f"{received:,} MAVLink messages decoded")
+    print(f"  states: {stats['states']}")
+    for name in ("queue_latency", "ack_latency", "total_latency"):
+        h = stats[name]
+        print(f"  {name:<14} mean {h['mean_ms']:8.2f} ms  p50 {h['p50_ms']:g}  p90 {h['p90_ms']:g}  "
+              f"p99 {h['p99_ms']:g}  max {h['max_ms']:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
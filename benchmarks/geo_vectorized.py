@@ -0,0 +1,64 @@
+# benchmarks/geo_vectorized.py
+"""
+utils.geo (NumPy) vs. the scalar utils.gps.haversine on consecutive track points.
+
+    python -m benchmarks.geo_vectorized [--sizes 1000 100000 1000000]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from edge_server.utils import geo, gps
+
+
+def _best(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def track(n, seed=0):
+    rnd = np.random.default_rng(seed)
+    lat = 48.2 + np.cumsum(rnd.normal(0, 1e-5, n))
+    lon = 16.37 + np.cumsum(rnd.normal(0, 1e-5, n))
+    return lat, lon
+
+
+def run(n, repeat):
+    lat, lon = track(n)
+    lat_l, lon_l = lat.tolist(), lon.tolist()
+
+    def scalar():
+        return [gps.haversine(lat_l[i], lon_l[i], lat_l[i + 1], lon_l[i + 1]) for i in range(n - 1)]
+
+    scalar_t = _best(scalar, 1 if n >= 1_000_000 else repeat)
+    results = [
+        ("haversine (scalar loop)", scalar_t),
+        ("consecutive_distances", _best(lambda: geo.consecutive_distances(lat, lon), repeat)),
+        ("path_length", _best(lambda: geo.path_length(lat, lon), repeat)),
+        ("consecutive_bearings", _best(lambda: geo.consecutive_bearings(lat, lon), repeat)),
+        ("segment_distance", _best(lambda: geo.segment_distance(lat, lon, 48.2, 16.37, 48.21, 16.38), repeat)),
+        ("destination_point", _best(lambda: geo.destination_point(lat, lon, 45.0, 100.0), repeat)),
+        ("LocalENU.forward", _best(lambda: geo.LocalENU(48.2, 16.37).forward(lat, lon), repeat)),
+    ]
+    assert np.allclose(scalar()[:100], geo.consecutive_distances(lat, lon)[:100])
+    print(f"n = {n:,}")
+    for name, t in results:
+        print(f"  {name:<26} {t * 1000:10.3f} ms   {scalar_t / t:8.1f}x vs scalar")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    for n in args.sizes:
+        run(n, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# benchmarks/inference.py
+"""
+Detection engine throughput: C concurrent "cameras" each submit F raw frames as fast as the
+engine accepts them, once with batching off (max batch 1) and once with micro-batching.
+Uses the model-free mock backend unless --model points at a YOLO .onnx file.
+
+    python -m benchmarks.inference [--cameras 8 --frames 40 --width 1280 --height 720]
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from edge_server.ai.detect import InferenceEngine
+
+
+def make_frames(n: int, width: int, height: int):
+    rng = np.random.default_rng(0)
+    frames = []
+    for _ in range(n):
+        img = rng.integers(0, 90, (height, width, 3), dtype=np.uint8)
+        y, x = rng.integers(0, height - 80), rng.integers(0, width - 80)
+        img[y:y + 80, x:x + 80] = 250  # one bright "object"
+        frames.append(img.tobytes())
+    return frames
+
+
+async def camera(engine: InferenceEngine, frames, width: int, height: int, count: int):
+    boxes = 0
+    for i in range(count):
+        boxes += len(await engine.detect(frames[i % len(frames)], width, height))
+    return boxes
+
+
+async def run(args, max_batch: int):
+    engine = InferenceEngine(
+        backend="onnx" if args.model else "mock", model_path=args.model, input_size=args.size,
+        workers=args.workers, threads=args.threads, max_batch=max_batch, max_latency_ms=args.latency_ms,
+        max_frame_bytes=args.width * args.height * 3,
+    )
+    engine.start()
+    frames = make_frames(8, args.width, args.height)
+    await engine.detect(frames[0], args.width, args.height)  # start the workers
+    start = time.perf_counter()
+    boxes = await asyncio.gather(*(camera(engine, frames, args.width, args.height, args.frames)
+                                   for _ in range(args.cameras)))
+    wall = time.perf_counter() - start
+    stats = engine.stats()
+    await engine.stop()
+    return wall, sum(boxes), stats
+
+
+def report(label: str, n: int, wall: float, boxes: int, stats: dict):
+    print(f"{label}: {n:,} frames in {wall:.2f} s ({n / wall:,.1f} fps), {boxes:,} boxes, "
+          f"mean batch {stats['mean_batch']}, sizes {stats['batch_sizes']}")
+    for name in ("queue_wait", "preprocess_batch", "inference_batch", "end_to_end"):
+        h = stats[name]
+        print(f"  {name:<16} mean {h['mean_ms']:8.2f} ms  p50 {h['p50_ms']:g}  p90 {h['p90_ms']:g}  "
+              f"p99 {h['p99_ms']:g}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cameras", type=int, default=8)
+    parser.add_argument("--frames", type=int, default=40, help="frames per camera")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--size", type=int, default=640, help="model input size")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=15)
+    parser.add_argument("--model", default="", help="YOLO .onnx model (default: mock backend)")
+    args = parser.parse_args()
+
+    n = args.cameras * args.frames
+    for label, max_batch in (("unbatched", 1), (f"batch <= {args.max_batch}", args.max_batch)):
+        wall, boxes, stats = asyncio.run(run(args, max_batch))
+        report(label, n, wall, boxes, stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# benchmarks/journey_serialization.py
+"""
+GET /journeys/ response building: ORM + dicts + response_model validation (previous code)
+vs. the shared column-tuple serializer with orjson (api/serializers.py).
+
+    python -m benchmarks.journey_serialization [--journeys 300 --waypoints 100]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import parse_obj_as
+from sqlalchemy import create_engine
+from sqlalchemy.orm import selectinload, sessionmaker
+
+from edge_server.api import serializers
+from edge_server.database import schemas
+from edge_server.database.init_db import init_db
+from edge_server.database.models import Journey, User, Waypoint
+
+
+def populate(db, journeys: int, waypoints: int) -> int:
+    user = User(email="bench@example.com", hashed_password="x")
+    db.add(user)
+    db.flush()
+    rnd = random.Random(1)
+    for j in range(journeys):
+        journey = Journey(name=f"journey {j}", description="bench", owner_id=user.id)
+        db.add(journey)
+        db.flush()
+        db.execute(Waypoint.__table__.insert(), [
+            {"journey_id": journey.id, "seq": i, "lat": 48.2 + rnd.random() / 100, "lon": 16.37 + rnd.random() / 100,
+             "alt": 30.0}
+            for i in range(waypoints)
+        ])
+    db.commit()
+    return user.id
+
+
+def legacy(db, owner_id: int) -> bytes:
+    """The list_journeys implementation this replaced, plus FastAPI's validation and encoding."""
+    qs = db.query(Journey).filter(Journey.owner_id == owner_id).options(selectinload(Journey.waypoints)).all()
+    out = []
+    for j in qs:
+        waypoints_out = []
+        for idx, wp in enumerate(sorted(j.waypoints, key=lambda w: getattr(w, "seq", getattr(w, "sequence", 0)))):
+            seq_value = getattr(wp, "seq", None)
+            if seq_value is None:
+                seq_value = getattr(wp, "sequence", idx)
+            waypoints_out.append({"id": wp.id, "seq": seq_value, "lat": wp.lat, "lon": wp.lon,
+                                  "alt": getattr(wp, "alt", None)})
+        out.append({"id": j.id, "name": j.name, "description": j.description, "owner_id": j.owner_id,
+                    "created_at": j.created_at, "waypoints": waypoints_out})
+    validated = parse_obj_as(List[schemas.JourneyOut], out)
+    return json.dumps(jsonable_encoder(validated)).encode()
+
+
+def shared(db, owner_id: int) -> bytes:
+    rows = serializers.list_journey_rows(db, owner_id)
+    return serializers.json_response(serializers.journey_payloads(db, rows)).body
+
+
+def _time(fn, Session, owner_id, repeat):
+    best = float("inf")
+    size = 0
+    for _ in range(repeat):
+        db = Session()  # fresh session: no identity-map reuse between runs
+        start = time.perf_counter()
+        size = len(fn(db, owner_id))
+        best = min(best, time.perf_counter() - start)
+        db.close()
+    return best, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--journeys", type=int, default=300)
+    parser.add_argument("--waypoints", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "journeys_bench.db")
+    engine = create_engine(f"sqlite:///{path}")
+    init_db(engine)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    owner_id = populate(db, args.journeys, args.waypoints)
+    db.close()
+    try:
+        print(f"{args.journeys} journeys x {args.waypoints} waypoints")
+        old, old_size = _time(legacy, Session, owner_id, args.repeat)
+        new, new_size = _time(shared, Session, owner_id, args.repeat)
+        print(f"  ORM + response_model    {old * 1000:9.1f} ms  ({old_size:,} bytes)")
+        print(f"  column tuples + orjson  {new * 1000:9.1f} ms  ({new_size:,} bytes)  {old / new:5.1f}x faster")
+    finally:
+        engine.dispose()
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+# benchmarks/spatial_index.py
+"""
+Viewport and radius queries over a large detections table: R*Tree vs. full table scan.
+
+    python -m benchmarks.spatial_index --rows 10000000
+
+The database is built in a temporary file (several GB at 10M rows) and removed afterwards
+unless --db is given.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from edge_server.database import crud
+from edge_server.database.init_db import init_db
+
+CENTER_LAT, CENTER_LON = 48.2, 16.37
+SPREAD_DEG = 0.5  # ~55 km x 37 km area around Vienna
+
+
+def populate(path: str, rows: int, missions: int, chunk: int = 100_000):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    rnd = random.Random(42)
+    done = 0
+    start = time.perf_counter()
+    while done < rows:
+        n = min(chunk, rows - done)
+        batch = [
+            (rnd.randint(1, missions),
+             CENTER_LAT + rnd.uniform(-SPREAD_DEG, SPREAD_DEG),
+             CENTER_LON + rnd.uniform(-SPREAD_DEG, SPREAD_DEG),
+             "plastic" if rnd.random() < 0.8 else "other",
+             rnd.random())
+            for _ in range(n)
+        ]
+        conn.executemany(
+            "INSERT INTO detections (mission_id, lat, lon, label, score, created_at) "
+            "VALUES (?, ?, ?, ?, ?, datetime('now'))",
+            batch,
+        )
+        conn.commit()
+        done += n
+    conn.close()
+    print(f"loaded {rows:,} rows in {time.perf_counter() - start:.1f}s")
+
+
+def _timed(fn, n):
+    times = []
+    result = None
+    for _ in range(n):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return times, result
+
+
+def _report(name, times):
+    times = sorted(times)
+    p95 = times[min(len(times) - 1, int(len(times) * 0.95))]
+    print(f"{name:<34} n={len(times):<4} mean={statistics.mean(times) * 1000:9.2f} ms  p95={p95 * 1000:9.2f} ms")
+
+
+def run(path: str, queries: int, scan_queries: int, viewport_m: float, radius_m: float):
+    engine = create_engine(f"sqlite:///{path}")
+    db = sessionmaker(bind=engine)()
+    rnd = random.Random(7)
+    half = viewport_m / 2 / 111320.0
+
+    def viewport():
+        lat = CENTER_LAT + rnd.uniform(-SPREAD_DEG, SPREAD_DEG)
+        lon = CENTER_LON + rnd.uniform(-SPREAD_DEG, SPREAD_DEG)
+        return lat - half, lon - half * 1.5, lat + half, lon + half * 1.5
+
+    boxes = [viewport() for _ in range(queries)]
+    it = iter(boxes)
+    times, rows = _timed(lambda: crud.get_detections_in_bbox(db, *next(it), limit=100000), queries)
+    _report(f"bbox {viewport_m:.0f} m (R*Tree)", times)
+    print(f"  last viewport returned {len(rows)} rows")
+
+    it = iter(boxes)
+    times, _ = _timed(lambda: crud.get_detections_in_bbox(db, *next(it), mission_id=1, label="plastic"), queries)
+    _report("bbox + mission/label (R*Tree)", times)
+
+    centers = [(CENTER_LAT + rnd.uniform(-SPREAD_DEG, SPREAD_DEG), CENTER_LON + rnd.uniform(-SPREAD_DEG, SPREAD_DEG))
+               for _ in range(queries)]
+    it = iter(centers)
+    times, _ = _timed(lambda: crud.get_detections_near(db, *next(it), radius_m), queries)
+    _report(f"radius {radius_m:.0f} m (R*Tree + haversine)", times)
+
+    raw = sqlite3.connect(path)
+    it = iter(boxes)
+
+    def scan():
+        a, b, c, d = next(it)
+        return raw.execute(
+            "SELECT * FROM detections WHERE lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?", (a, c, b, d)
+        ).fetchall()
+
+    times, _ = _timed(scan, scan_queries)
+    _report(f"bbox {viewport_m:.0f} m (full scan)", times)
+    raw.close()
+    db.close()
+    engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--missions", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--scan-queries", type=int, default=5)
+    parser.add_argument("--viewport-m", type=float, default=1000)
+    parser.add_argument("--radius-m", type=float, default=200)
+    parser.add_argument("--db", help="reuse/keep this database file instead of a temporary one")
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), "detections_bench.db")
+    if not os.path.exists(path):
+        init_db(create_engine(f"sqlite:///{path}"))
+        populate(path, args.rows, args.missions)
+    try:
+        run(path, args.queries, args.scan_queries, args.viewport_m, args.radius_m)
+    finally:
+        if not args.db:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# benchmarks/telemetry_store.py
+"""
+Telemetry ingest at N drones x R Hz, replayed faster than real time against a temporary SQLite
+database with the background writer running, then range queries at each resolution.
+
+    python -m benchmarks.telemetry_store [--drones 48 --hz 50 --minutes 10]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import numpy as np
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from edge_server.database.init_db import init_db
+from edge_server.database.models import TelemetryChunk
+from edge_server.services.telemetry_store import RAW, ROLLUPS, TelemetryStore
+
+
+async def ingest(store: TelemetryStore, drones: int, hz: int, seconds: int, t0: float) -> float:
+    rng = np.random.default_rng(0)
+    busy = 0.0
+    ticks = seconds * hz
+    for tick in range(ticks):
+        t = t0 + tick / hz
+        start = time.perf_counter()
+        for mission_id in range(1, drones + 1):
+            store.append(mission_id, t, {"lat": 48.2 + rng.random() * 1e-3, "lon": 16.37, "alt": 30.0, "battery": 80})
+        busy += time.perf_counter() - start
+        if tick % hz == 0:
+            await asyncio.sleep(0)  # let the writer run once per simulated second
+    return busy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--drones", type=int, default=48)
+    parser.add_argument("--hz", type=int, default=50)
+    parser.add_argument("--minutes", type=float, default=10)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "telemetry_bench.db")
+    engine = create_engine(f"sqlite:///{path}")
+    init_db(engine)
+    Session = sessionmaker(bind=engine)
+    seconds = int(args.minutes * 60)
+    t0 = 1_700_000_000.0
+
+    async def run():
+        store = TelemetryStore(flush_interval_ms=100, session_factory=Session)
+        store.start()
+        start = time.perf_counter()
+        busy = await ingest(store, args.drones, args.hz, seconds, t0)
+        await store.stop()
+        return store, busy, time.perf_counter() - start
+
+    store, busy, wall = asyncio.run(run())
+    samples = args.drones * args.hz * seconds
+    db = Session()
+    chunks, size = db.execute(select(func.count(), func.sum(func.length(TelemetryChunk.data)))).one()
+    print(f"{args.drones} drones x {args.hz} Hz x {seconds} s = {samples:,} samples")
+    print(f"  append: {busy / samples * 1e6:.2f} us/sample, {samples / wall:,.0f} samples/s incl. writer "
+          f"({samples / wall / (args.drones * args.hz):.0f}x real time)")
+    print(f"  stored: {chunks:,} chunks, {size / 1e6:.1f} MB; flush {store.flush_time.as_dict()}")
+    for res in (RAW,) + ROLLUPS:
+        start = time.perf_counter()
+        cols = store.query(db, 1, t0, t0 + seconds, res)
+        print(f"  query whole mission @ {res or 'raw':>3}: {cols.shape[1]:7,} rows in {(time.perf_counter() - start) * 1000:7.2f} ms")
+    start = time.perf_counter()
+    res = store.pick_resolution(db, 1, t0, t0 + seconds, 2000)
+    cols = store.query(db, 1, t0, t0 + seconds, res)
+    print(f"  auto (max 2000 points): {res} s, {cols.shape[1]} rows in {(time.perf_counter() - start) * 1000:.2f} ms")
+    db.close()
+    engine.dispose()
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,465 @@
+# edge_server/ai/detect.py
+# CPU detection pipeline:
+#   detect() copies the frame once into a shared-memory slot and queues it;
+#   the batcher groups queued frames into one batch (up to max_batch, or whatever has
+#   arrived when the oldest frame reaches max_latency_ms) as soon as a worker is free;
+#   a worker process views the slots in place, letterboxes them into one NCHW tensor,
+#   runs the detector on the whole batch and returns boxes in frame pixels.
+# Workers are spawned processes, so neither preprocessing nor inference holds the API's GIL.
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import shared_memory
+from typing import Callable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from edge_server.ai.preprocess import FORMATS, Normalizer, batch_tensor, frame_bytes, frame_view, preprocess_into
+from edge_server.config import settings
+from edge_server.services.mission_control import mission_control
+from edge_server.services.telemetry_hub import telemetry_hub
+from edge_server.services.telemetry_store import telemetry_store
+from edge_server.utils.logger import logger
+from edge_server.utils.metrics import Histogram
+
+BACKENDS = ("none", "mock", "onnx")
+
+
+class Box(NamedTuple):
+    label: str
+    score: float
+    x1: float
+    y1: float
+    x2: float
+    y2: float
+
+
+class EngineBusy(Exception):
+    """Raised when no frame slot became free within the submit timeout."""
+
+
+# detectors (constructed inside the worker processes)
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float, max_det: int = 100) -> np.ndarray:
+    """Greedy non-maximum suppression; indexes of the kept boxes, best first."""
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1).clip(0) * (y2 - y1).clip(0)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size and len(keep) < max_det:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = (np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest])).clip(0)
+        h = (np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest])).clip(0)
+        inter = w * h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.asarray(keep, dtype=np.intp)
+
+
+def decode_yolo(pred: np.ndarray, num_classes: int, score_threshold: float, iou_threshold: float):
+    """
+    One image of YOLO output -> (boxes xyxy, scores, class ids) in model input pixels.
+    Accepts the v5 layout (anchors, 5 + classes) and the v8 layout (4 + classes, anchors).
+    """
+    if pred.shape[0] < pred.shape[1]:
+        pred = pred.T
+    if pred.shape[1] == 5 + num_classes:
+        cls = pred[:, 5:] * pred[:, 4:5]
+    else:
+        cls = pred[:, 4:4 + num_classes]
+    class_ids = cls.argmax(axis=1)
+    scores = cls[np.arange(len(cls)), class_ids]
+    mask = scores >= score_threshold
+    xywh, scores, class_ids = pred[mask, :4], scores[mask], class_ids[mask]
+    boxes = np.empty_like(xywh)
+    boxes[:, :2] = xywh[:, :2] - xywh[:, 2:] / 2
+    boxes[:, 2:] = xywh[:, :2] + xywh[:, 2:] / 2
+    # per-class NMS in one pass: shift each class into its own coordinate range
+    keep = nms(boxes + class_ids[:, None] * 4096.0, scores, iou_threshold)
+    return boxes[keep], scores[keep], class_ids[keep]
+
+
+class Detector:
+    """Runs on an (n, 3, S, S) float32 batch; returns (boxes, scores, class ids) per image."""
+    mean = (0.0, 0.0, 0.0)
+    std = (1.0, 1.0, 1.0)
+
+    def __init__(self, labels: Sequence[str], input_size: int, score_threshold: float, iou_threshold: float):
+        self.labels = list(labels)
+        self.input_size = input_size
+        self.score_threshold = score_threshold
+        self.iou_threshold = iou_threshold
+
+    def __call__(self, batch: np.ndarray) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        raise NotImplementedError
+
+
+class OnnxDetector(Detector):
+    """YOLO-style ONNX model on the CPU execution provider."""
+
+    def __init__(self, model_path: str, labels: Sequence[str], input_size: int, score_threshold: float,
+                 iou_threshold: float, threads: int = 1):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise RuntimeError("DETECTOR_BACKEND=onnx needs onnxruntime (pip install onnxruntime)")
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = threads
+        opts.inter_op_num_threads = 1
+        opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, opts, providers=["CPUExecutionProvider"])
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        shape = inp.shape
+        if isinstance(shape[-1], int):
+            input_size = shape[-1]
+        # models exported with a fixed batch dimension are fed one image at a time
+        self.fixed_batch = shape[0] if isinstance(shape[0], int) else None
+        super().__init__(labels, input_size, score_threshold, iou_threshold)
+
+    def __call__(self, batch):
+        if self.fixed_batch == 1 and len(batch) > 1:
+            preds = np.concatenate([self.session.run(None, {self.input_name: batch[i:i + 1]})[0]
+                                    for i in range(len(batch))])
+        else:
+            preds = self.session.run(None, {self.input_name: batch})[0]
+        return [decode_yolo(p, len(self.labels), self.score_threshold, self.iou_threshold) for p in preds]
+
+
+class MockDetector(Detector):
+    """
+    Model-free stand-in for tests and benchmarks: reports bright 32x32 cells of the input as
+    detections. Cheap, deterministic, and exercises the same batching and post-processing.
+    """
+    cell = 32
+
+    def __call__(self, batch):
+        n, _, s, _ = batch.shape
+        k = s // self.cell
+        cells = batch.mean(axis=1)[:, :k * self.cell, :k * self.cell].reshape(n, k, self.cell, k, self.cell)
+        cells = cells.mean(axis=(2, 4))
+        out = []
+        for img in cells:
+            ys, xs = np.nonzero(img >= max(self.score_threshold, 0.5))
+            scores = img[ys, xs].clip(0, 1).astype(np.float32)
+            boxes = np.stack([xs, ys, xs + 1, ys + 1], axis=1).astype(np.float32) * self.cell
+            keep = nms(boxes, scores, self.iou_threshold)
+            out.append((boxes[keep], scores[keep], np.zeros(len(keep), dtype=np.intp)))
+        return out
+
+
+def make_detector(backend: str, model_path: str, labels: Sequence[str], input_size: int, score_threshold: float,
+                  iou_threshold: float, threads: int) -> Detector:
+    if backend == "onnx":
+        if not model_path:
+            raise RuntimeError("DETECTOR_BACKEND=onnx needs DETECTOR_MODEL (path to an .onnx file)")
+        return OnnxDetector(model_path, labels, input_size, score_threshold, iou_threshold, threads)
+    if backend == "mock":
+        return MockDetector(labels, input_size, score_threshold, iou_threshold)
+    raise ValueError(f"unknown DETECTOR_BACKEND {backend!r}, expected one of {BACKENDS}")
+
+
+# worker process side
+
+_worker: dict = {}
+
+
+def _init_worker(backend, model_path, labels, input_size, score_threshold, iou_threshold, threads, shm_name,
+                 slot_bytes, max_batch):
+    # spawned workers share the parent's resource tracker, which unlinks the segment in stop()
+    shm = shared_memory.SharedMemory(name=shm_name)
+    detector = make_detector(backend, model_path, labels, input_size, score_threshold, iou_threshold, threads)
+    _worker.update(
+        shm=shm, slot_bytes=slot_bytes, detector=detector,
+        norm=Normalizer(detector.mean, detector.std),
+        tensor=batch_tensor(max_batch, detector.input_size),
+    )
+
+
+def _run_batch(items: List[Tuple[int, int, int, str]]):
+    """items: (slot, width, height, fmt). Returns per-frame box tuples and (preprocess_s, inference_s)."""
+    w = _worker
+    start = time.perf_counter()
+    tensor = batch_tensor(len(items), w["detector"].input_size, w["tensor"])
+    infos = []
+    for i, (slot, width, height, fmt) in enumerate(items):
+        off = slot * w["slot_bytes"]
+        frame = frame_view(w["shm"].buf[off:off + frame_bytes(width, height, fmt)], width, height, fmt)
+        infos.append(preprocess_into(frame, tensor[i], w["norm"], fmt))
+        del frame  # release the view on the shared buffer
+    prep = time.perf_counter()
+    results = w["detector"](tensor)
+    done = time.perf_counter()
+    labels = w["detector"].labels
+    out = []
+    for info, (boxes, scores, class_ids) in zip(infos, results):
+        boxes = info.to_frame(boxes.astype(np.float32, copy=False)) if len(boxes) else boxes
+        out.append([(labels[c] if c < len(labels) else str(c), float(s), *map(float, b))
+                    for b, s, c in zip(boxes, scores, class_ids)])
+    return out, (prep - start, done - prep)
+
+
+# event loop side
+
+class _Pending:
+    __slots__ = ("slot", "width", "height", "fmt", "future", "enqueued")
+
+    def __init__(self, slot, width, height, fmt, future):
+        self.slot = slot
+        self.width = width
+        self.height = height
+        self.fmt = fmt
+        self.future = future
+        self.enqueued = time.perf_counter()
+
+
+class InferenceEngine:
+    def __init__(self, backend: str = "none", model_path: str = "", labels: Sequence[str] = ("plastic",),
+                 input_size: int = 640, workers: int = 1, threads: int = 1, max_batch: int = 8,
+                 max_latency_ms: float = 15.0, score_threshold: float = 0.35, iou_threshold: float = 0.45,
+                 max_frame_bytes: int = 1920 * 1080 * 3, submit_timeout: float = 2.0, slots: int = 0):
+        """slots: frames held in shared memory at once (0 = max_batch * (workers + 1))."""
+        if backend not in BACKENDS:
+            raise ValueError(f"unknown DETECTOR_BACKEND {backend!r}, expected one of {BACKENDS}")
+        self.backend = backend
+        self.model_path = model_path
+        self.labels = list(labels)
+        self.input_size = input_size
+        self.workers = max(1, workers)
+        self.threads = max(1, threads)
+        # enough slots for every worker's batch plus one batch filling up, unless capped
+        self.slots = max(1, max_batch) * (self.workers + 1) if slots <= 0 else slots
+        self.max_batch = max(1, min(max_batch, self.slots))
+        self.max_latency = max_latency_ms / 1000
+        self.score_threshold = score_threshold
+        self.iou_threshold = iou_threshold
+        self.slot_bytes = max_frame_bytes
+        self.submit_timeout = submit_timeout
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        self._free: List[int] = []
+        self._slot_sem: Optional[asyncio.Semaphore] = None
+        self._idle_workers: Optional[asyncio.Semaphore] = None
+        self._queue: List[_Pending] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.frames = 0
+        self.batches = 0
+        self.rejected = 0
+        self.failed = 0
+        self.untagged = 0
+        self.batch_sizes = [0] * (self.max_batch + 1)
+        self.queue_wait = Histogram()
+        self.preprocess = Histogram()
+        self.inference = Histogram()
+        self.end_to_end = Histogram()
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend != "none"
+
+    def start(self):
+        if not self.enabled or self._pool is not None:
+            return
+        self._shm = shared_memory.SharedMemory(create=True, size=self.slots * self.slot_bytes)
+        self._free = list(range(self.slots))
+        self._slot_sem = asyncio.Semaphore(self.slots)
+        self._idle_workers = asyncio.Semaphore(self.workers)
+        self._wake = asyncio.Event()
+        # spawn: forking a process that already runs an event loop and threads is unsafe
+        self._pool = ProcessPoolExecutor(
+            self.workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker,
+            initargs=(self.backend, self.model_path, self.labels, self.input_size, self.score_threshold,
+                      self.iou_threshold, self.threads, self._shm.name, self.slot_bytes, self.max_batch),
+        )
+        self._task = asyncio.get_event_loop().create_task(self._batcher())
+        logger.info("Inference engine started (%s, %s worker(s), batch <= %s, %s ms, %s frame slots = %.0f MB)",
+                    self.backend, self.workers, self.max_batch, self.max_latency * 1000, self.slots,
+                    self.slots * self.slot_bytes / 2 ** 20)
+
+    async def stop(self):
+        if self._pool is None:
+            return
+        self._task.cancel()
+        for p in self._queue:
+            if not p.future.done():
+                p.future.set_exception(RuntimeError("inference engine stopped"))
+        self._queue.clear()
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        self._pool = None
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
+
+    async def detect(self, buf, width: int, height: int, fmt: str = "rgb24") -> List[Box]:
+        """Boxes (frame pixels) for one raw frame. Raises EngineBusy when all frame slots stay taken."""
+        if self._pool is None:
+            raise RuntimeError("inference engine is not running (DETECTOR_BACKEND=none?)")
+        if fmt not in FORMATS:
+            raise ValueError(f"unsupported pixel format {fmt!r}, expected one of {sorted(FORMATS)}")
+        n = frame_bytes(width, height, fmt)
+        if n > self.slot_bytes:
+            raise ValueError(f"frame of {n} bytes exceeds DETECTOR_FRAME_MAX_BYTES={self.slot_bytes}")
+        src = memoryview(buf).cast("B")
+        if src.nbytes < n:
+            raise ValueError(f"frame buffer holds {src.nbytes} bytes, {width}x{height} {fmt} needs {n}")
+        try:
+            await asyncio.wait_for(self._slot_sem.acquire(), self.submit_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise EngineBusy()
+        slot = self._free.pop()
+        try:
+            off = slot * self.slot_bytes
+            self._shm.buf[off:off + n] = src[:n]
+        except BaseException:
+            self._release(slot)
+            raise
+        # from here the batcher owns the slot: a caller that goes away (cancelled, timed out)
+        # must not free it while a worker may still be reading the frame
+        pending = _Pending(slot, width, height, fmt, asyncio.get_running_loop().create_future())
+        self._queue.append(pending)
+        self._wake.set()
+        boxes = await pending.future
+        self.end_to_end.observe(time.perf_counter() - pending.enqueued)
+        return [Box(*b) for b in boxes]
+
+    def _release(self, slot: int):
+        self._free.append(slot)
+        self._slot_sem.release()
+
+    async def _wait_for_frames(self, timeout: Optional[float]):
+        self._wake.clear()
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            while not self._queue:
+                await self._wait_for_frames(None)
+            # frames that arrive while every worker is busy simply join the next batch
+            await self._idle_workers.acquire()
+            deadline = self._queue[0].enqueued + self.max_latency if self._queue else 0
+            while self._queue and len(self._queue) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                await self._wait_for_frames(remaining)
+            batch, self._queue = self._queue[:self.max_batch], self._queue[self.max_batch:]
+            for p in batch:
+                if p.future.done():  # callers that went away before their frame was sent
+                    self._release(p.slot)
+            batch = [p for p in batch if not p.future.done()]
+            if not batch:
+                self._idle_workers.release()
+                continue
+            loop.create_task(self._run(batch))
+
+    async def _run(self, batch: List[_Pending]):
+        start = time.perf_counter()
+        for p in batch:
+            self.queue_wait.observe(start - p.enqueued)
+        try:
+            results, (prep, infer) = await asyncio.get_running_loop().run_in_executor(
+                self._pool, _run_batch, [(p.slot, p.width, p.height, p.fmt) for p in batch])
+        except Exception as e:
+            self.failed += len(batch)
+            logger.exception("Inference batch of %s frames failed", len(batch))
+            for p in batch:
+                if not p.future.done():
+                    p.future.set_exception(e)
+            return
+        finally:
+            # the workers are done with these frames
+            for p in batch:
+                self._release(p.slot)
+            self._idle_workers.release()
+        self.frames += len(batch)
+        self.batches += 1
+        self.batch_sizes[len(batch)] += 1
+        self.preprocess.observe(prep)
+        self.inference.observe(infer)
+        for p, boxes in zip(batch, results):
+            if not p.future.done():
+                p.future.set_result(boxes)
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "workers": self.workers,
+            "max_batch": self.max_batch,
+            "slots": self.slots,
+            "max_latency_ms": self.max_latency * 1000,
+            "queued": len(self._queue),
+            "frames": self.frames,
+            "batches": self.batches,
+            "mean_batch": round(self.frames / self.batches, 2) if self.batches else 0.0,
+            "batch_sizes": {str(n): c for n, c in enumerate(self.batch_sizes) if c},
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "untagged": self.untagged,
+            "queue_wait": self.queue_wait.as_dict(),
+            "preprocess_batch": self.preprocess.as_dict(),
+            "inference_batch": self.inference.as_dict(),
+            "end_to_end": self.end_to_end.as_dict(),
+        }
+
+
+async def detect_and_record(mission_id: int, buf, width: int, height: int, fmt: str = "rgb24",
+                            t: Optional[float] = None, locate: Optional[Callable[[float], Optional[tuple]]] = None) -> dict:
+    """
+    Run one frame of a live mission through the engine, tag the boxes with the drone position
+    at capture time t (interpolated from recent telemetry, or locate(t)) and store / broadcast
+    them like the adapters' own detections. Boxes are dropped when no position fix is close enough to t.
+    """
+    t = time.time() if t is None else t
+    boxes = await inference_engine.detect(buf, width, height, fmt)
+    if not boxes:
+        return {"detections": 0, "untagged": 0}
+    position = telemetry_store.position_at(mission_id, t) if locate is None else locate(t)
+    if position is None:
+        inference_engine.untagged += len(boxes)
+        return {"detections": 0, "untagged": len(boxes)}
+    lat, lon, _ = position
+    created_at = datetime.utcfromtimestamp(t)
+    rows = [{"mission_id": mission_id, "lat": lat, "lon": lon, "label": b.label, "score": round(b.score, 3),
+             "created_at": created_at} for b in boxes]
+    # stored (and de-duplicated) by the worker running the mission
+    await mission_control.submit_detections(rows, timeout=settings.DETECTION_SUBMIT_TIMEOUT)
+    for det, box in zip(rows, boxes):
+        telemetry_hub.publish(mission_id, {
+            "type": "detection",
+            "lat": lat,
+            "lon": lon,
+            "label": det["label"],
+            "score": det["score"],
+            "bbox": [round(v, 1) for v in box[2:]],
+            "timestamp": created_at.isoformat()
+        })
+    return {"detections": len(rows), "untagged": 0}
+
+
+inference_engine = InferenceEngine(
+    backend=settings.DETECTOR_BACKEND,
+    model_path=settings.DETECTOR_MODEL,
+    labels=[s.strip() for s in settings.DETECTOR_LABELS.split(",") if s.strip()],
+    input_size=settings.DETECTOR_INPUT_SIZE,
+    workers=settings.DETECTOR_WORKERS,
+    threads=settings.DETECTOR_THREADS,
+    max_batch=settings.DETECTOR_MAX_BATCH,
+    max_latency_ms=settings.DETECTOR_MAX_LATENCY_MS,
+    score_threshold=settings.DETECTOR_SCORE,
+    iou_threshold=settings.DETECTOR_IOU,
+    max_frame_bytes=settings.DETECTOR_FRAME_MAX_BYTES,
+    submit_timeout=settings.DETECTOR_SUBMIT_TIMEOUT,
+    # the host-wide cap is shared by the uvicorn workers, each running its own engine
+    slots=max(1, settings.DETECTOR_HOST_SLOTS // settings.WEB_CONCURRENCY) if settings.DETECTOR_HOST_SLOTS > 0 else 0,
+)
@@ -0,0 +1,144 @@
+# edge_server/ai/preprocess.py
+# Frame -> model input. Frames arrive as raw pixel buffers (bytes, bytearray, memoryview,
+# shared memory); they are viewed in place with np.frombuffer, resized with cached index /
+# weight tables and written straight into a slot of the preallocated NCHW batch tensor.
+from functools import lru_cache
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+
+# optional JPEG decoders, tried in this order
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# pixel format -> (channels, channel order as RGB indexes)
+FORMATS = {
+    "rgb24": (3, (0, 1, 2)),
+    "bgr24": (3, (2, 1, 0)),
+    "gray8": (1, (0, 0, 0)),
+}
+PAD_VALUE = 114  # letterbox border, as in the YOLO training pipelines
+
+
+class Letterbox(NamedTuple):
+    """How a frame was fitted into the square model input; maps boxes back to frame pixels."""
+    scale: float
+    pad_x: int
+    pad_y: int
+    width: int
+    height: int
+
+    def to_frame(self, boxes: np.ndarray) -> np.ndarray:
+        """(n, 4) x1, y1, x2, y2 in model input pixels -> frame pixels, clipped to the frame."""
+        out = np.empty_like(boxes)
+        out[:, [0, 2]] = (boxes[:, [0, 2]] - self.pad_x) / self.scale
+        out[:, [1, 3]] = (boxes[:, [1, 3]] - self.pad_y) / self.scale
+        np.clip(out[:, [0, 2]], 0, self.width, out=out[:, [0, 2]])
+        np.clip(out[:, [1, 3]], 0, self.height, out=out[:, [1, 3]])
+        return out
+
+
+def frame_bytes(width: int, height: int, fmt: str = "rgb24") -> int:
+    return width * height * FORMATS[fmt][0]
+
+
+def frame_view(buf, width: int, height: int, fmt: str = "rgb24") -> np.ndarray:
+    """(h, w, c) uint8 view of a raw frame buffer; no copy."""
+    channels = FORMATS[fmt][0]
+    n = width * height * channels
+    arr = np.frombuffer(buf, dtype=np.uint8, count=n)
+    if arr.size != n:
+        raise ValueError(f"frame buffer holds {arr.size} bytes, {width}x{height} {fmt} needs {n}")
+    return arr.reshape(height, width, channels)
+
+
+def jpeg_supported() -> bool:
+    return cv2 is not None or Image is not None
+
+
+def decode_jpeg(data) -> Tuple[np.ndarray, str]:
+    """Encoded image -> ((h, w, 3) uint8 array, pixel format). Needs opencv-python or Pillow."""
+    if cv2 is not None:
+        img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            raise ValueError("not a decodable image")
+        return img, "bgr24"
+    if Image is not None:
+        from io import BytesIO
+        try:
+            with Image.open(BytesIO(data)) as im:
+                return np.asarray(im.convert("RGB")), "rgb24"
+        except OSError as e:
+            raise ValueError(f"not a decodable image: {e}")
+    raise RuntimeError("JPEG frames need opencv-python or Pillow installed")
+
+
+def letterbox(width: int, height: int, size: int) -> Letterbox:
+    scale = min(size / width, size / height)
+    nw, nh = max(1, round(width * scale)), max(1, round(height * scale))
+    return Letterbox(scale, (size - nw) // 2, (size - nh) // 2, width, height)
+
+
+@lru_cache(maxsize=32)
+def _axis(src: int, dst: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Bilinear source indexes and weights for one axis (half-pixel centres)."""
+    pos = (np.arange(dst, dtype=np.float32) + 0.5) * (src / dst) - 0.5
+    np.clip(pos, 0, src - 1, out=pos)
+    i0 = pos.astype(np.intp)
+    i1 = np.minimum(i0 + 1, src - 1)
+    return i0, i1, (pos - i0).astype(np.float32)
+
+
+def resize(img: np.ndarray, width: int, height: int) -> np.ndarray:
+    """Bilinear resize of (h, w, c) uint8 to float32 (height, width, c)."""
+    h, w = img.shape[:2]
+    y0, y1, wy = _axis(h, height)
+    x0, x1, wx = _axis(w, width)
+    top = img[y0].astype(np.float32)
+    bottom = img[y1].astype(np.float32)
+    rows = top + (bottom - top) * wy[:, None, None]
+    left, right = rows[:, x0], rows[:, x1]
+    return left + (right - left) * wx[None, :, None]
+
+
+class Normalizer:
+    """Per-channel (x / 255 - mean) / std folded into one multiply-add."""
+
+    def __init__(self, mean=(0.0, 0.0, 0.0), std=(1.0, 1.0, 1.0)):
+        std = np.asarray(std, dtype=np.float32)
+        self.scale = (1.0 / (255.0 * std)).astype(np.float32)
+        self.offset = (-np.asarray(mean, dtype=np.float32) / std).astype(np.float32)
+        self.pad = (PAD_VALUE * self.scale + self.offset).astype(np.float32)
+
+
+def preprocess_into(frame: np.ndarray, out: np.ndarray, norm: Normalizer, fmt: str = "rgb24") -> Letterbox:
+    """
+    Letterbox `frame` (h, w, c uint8) into `out`, one (3, S, S) float32 slot of the batch tensor.
+    Only the resized region is computed; the border is filled with the pad value.
+    """
+    size = out.shape[-1]
+    h, w = frame.shape[:2]
+    box = letterbox(w, h, size)
+    nw, nh = round(w * box.scale), round(h * box.scale)
+    resized = resize(frame, nw, nh)
+    order = FORMATS[fmt][1]
+    for c in range(3):
+        dst = out[c]
+        dst.fill(norm.pad[c])
+        region = dst[box.pad_y:box.pad_y + nh, box.pad_x:box.pad_x + nw]
+        np.multiply(resized[:, :, order[c] if resized.shape[2] == 3 else 0], norm.scale[c], out=region)
+        region += norm.offset[c]
+    return box
+
+
+def batch_tensor(n: int, size: int, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """(n, 3, size, size) float32, reusing `out` when it is large enough."""
+    if out is not None and out.shape[0] >= n and out.shape[-1] == size:
+        return out[:n]
+    return np.empty((n, 3, size, size), dtype=np.float32)
@@ -1,24 +1,47 @@
 # edge_server/api/deps.py
-from fastapi import Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from edge_server.database.db import get_db
+from typing import Optional
+
+from fastapi import Depends, HTTPException, WebSocket, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.security import OAuth2PasswordBearer
+from edge_server.config import settings
+from edge_server.database.db import SessionLocal, get_db, get_read_db  # noqa: F401  (get_read_db re-exported)
 from edge_server.database import crud
+from edge_server.services.auth_cache import Principal, auth_cache
 from edge_server.utils.security import decode_token
 
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login", auto_error=False)
+
 def get_db_dep():
-    db = next(get_db())
-    try:
-        yield db
-    finally:
-        db.close()
+    # delegate so get_db's own cleanup runs (next() left its generator suspended)
+    yield from get_db()
 
-def get_current_user(token: str = Depends(lambda: None), db: Session = Depends(get_db_dep)):
+def get_current_user(token: str = Depends(oauth2_scheme)) -> Principal:
+    # Hot path: a cached token skips both signature verification and the user lookup.
     if not token:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    principal = auth_cache.get(token)
+    if principal is not None:
+        return principal
     payload = decode_token(token)
-    if payload is None:
+    if payload is None or payload.get("sub") is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    user = crud.get_user(db, int(payload.get("sub")))
-    if not user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
-    return user
+    # a session is only opened on a cache miss
+    with SessionLocal() as db:
+        user = crud.get_user(db, int(payload["sub"]))
+        if not user:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+        principal = Principal(id=user.id, email=user.email)
+    auth_cache.put(token, principal, payload.get("exp"))
+    return principal
+
+async def get_websocket_user(websocket: WebSocket) -> Optional[Principal]:
+    # Browsers cannot set headers on a WebSocket, so the bearer token may also come as ?token=.
+    token = websocket.query_params.get("token")
+    if not token:
+        scheme, _, credentials = websocket.headers.get("authorization", "").partition(" ")
+        token = credentials if scheme.lower() == "bearer" else None
+    try:
+        return await run_in_threadpool(get_current_user, token)
+    except HTTPException:
+        return None
@@ -1,22 +1,56 @@
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
+from edge_server.api.deps import get_current_user
 from edge_server.database import crud, schemas
 from edge_server.database.db import get_db
-from edge_server.utils.security import verify_password, create_access_token
+from edge_server.services.auth_cache import auth_cache
+from edge_server.services.password_hasher import HasherBusy, password_hasher
+from edge_server.utils.security import create_access_token
 
 router = APIRouter()
 
+def _busy():
+    return HTTPException(status_code=503, detail="Authentication is busy, try again", headers={"Retry-After": "1"})
+
+# bcrypt runs in the password hasher's process pool and the (short) DB calls in the
+# threadpool, so a burst of logins does not stall other requests on this worker.
 @router.post("/signup", response_model=schemas.UserOut)
-def signup(user_in: schemas.UserCreate, db: Session = Depends(get_db)):
-    if crud.get_user_by_email(db, user_in.email):
+async def signup(user_in: schemas.UserCreate, db: Session = Depends(get_db)):
+    if await run_in_threadpool(crud.get_user_by_email, db, user_in.email):
+        raise HTTPException(status_code=400, detail="Email already registered")
+    try:
+        hashed = await password_hasher.hash(user_in.password)
+    except HasherBusy:
+        raise _busy()
+    try:
+        return await run_in_threadpool(crud.create_user, db, user_in, hashed)
+    except IntegrityError:
         raise HTTPException(status_code=400, detail="Email already registered")
-    return crud.create_user(db, user_in)
 
 @router.post("/login")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = crud.get_user_by_email(db, form_data.username)
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+    user = await run_in_threadpool(crud.get_user_by_email, db, form_data.username)
+    try:
+        valid, new_hash = await password_hasher.verify_and_update(
+            form_data.password, user.hashed_password if user else None
+        )
+    except HasherBusy:
+        raise _busy()
+    if not user or not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    if new_hash:
+        # cost parameters changed since this hash was made
+        await run_in_threadpool(crud.update_user_password_hash, db, user, new_hash)
     token = create_access_token({"sub": str(user.id)})
     return {"access_token": token, "token_type": "bearer"}
+
+@router.get("/cache/stats")
+def auth_cache_stats(current_user=Depends(get_current_user)):
+    return auth_cache.stats()
+
+@router.get("/hasher/stats")
+def password_hasher_stats(current_user=Depends(get_current_user)):
+    return password_hasher.stats()
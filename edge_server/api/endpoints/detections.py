@@ -1,10 +1,170 @@
-from fastapi import APIRouter, Depends
+import asyncio
+from datetime import datetime, timezone
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from edge_server.ai.detect import inference_engine
+from edge_server.config import settings
 from edge_server.database import crud, schemas
-from edge_server.api.deps import get_db_dep, get_current_user
+from edge_server.api.deps import get_db_dep, get_current_user, get_read_db
+from edge_server.services import detection_export
+from edge_server.services.broker import BrokerError
+from edge_server.services.cluster import ClusterError
+from edge_server.services.detection_tiles import bin_grid, bin_tiles, tile_bounds, tile_cache, tiles_out
+from edge_server.services.detection_writer import DetectionWriteError, detection_writer
+from edge_server.services.mission_control import mission_control
 
 router = APIRouter()
 
 @router.post("/", response_model=schemas.DetectionOut)
-def create_detection(det_in: schemas.DetectionCreate, db: Session = Depends(get_db_dep), current_user=Depends(get_current_user)):
-    return crud.create_detection(db, det_in)
+async def create_detection(det_in: schemas.DetectionCreate, db: Session = Depends(get_db_dep),
+                           current_user=Depends(get_current_user)):
+    """
+    One detection, de-duplicated like /batch: a repeat of a recent object only updates that
+    object. Returns the object's stored row once committed.
+    """
+    try:
+        key = await mission_control.write_detection(dict(det_in.dict(), created_at=datetime.utcnow()),
+                                                    timeout=settings.DETECTION_SUBMIT_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Detection buffer full, retry later")
+    except (DetectionWriteError, ClusterError, BrokerError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return await run_in_threadpool(crud.get_detection_by_track_key, db, key)
+
+@router.post("/batch", response_model=schemas.DetectionBatchOut, status_code=status.HTTP_202_ACCEPTED)
+async def create_detections_batch(dets_in: List[schemas.DetectionCreate], current_user=Depends(get_current_user)):
+    now = datetime.utcnow()
+    rows = [dict(d.dict(), created_at=now) for d in dets_in]
+    try:
+        await mission_control.submit_detections(rows, timeout=settings.DETECTION_SUBMIT_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Detection buffer full, retry later")
+    except (ClusterError, BrokerError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"accepted": len(rows)}
+
+@router.get("/writer/stats")
+def detection_writer_stats(current_user=Depends(get_current_user)):
+    return detection_writer.stats()
+
+@router.get("/engine/stats")
+def inference_engine_stats(current_user=Depends(get_current_user)):
+    return inference_engine.stats()
+
+def _naive_utc(dt: Optional[datetime]) -> Optional[datetime]:
+    if dt is None or dt.tzinfo is None:
+        return dt
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+@router.get("/export")
+async def export_detections(dataset: str = Query(detection_export.DETECTIONS, regex="^(detections|telemetry)$"),
+                            format: str = Query(detection_export.CSV_GZ, regex=r"^(csv\.gz|parquet|arrow)$"),
+                            mission_id: Optional[int] = None, since: Optional[datetime] = None,
+                            until: Optional[datetime] = None, label: Optional[str] = None,
+                            db: Session = Depends(get_read_db), current_user=Depends(get_current_user)):
+    """
+    Detections (or, with dataset=telemetry, a mission's recorded samples) of a mission and/or
+    time range as gzip CSV, Parquet or an Arrow IPC stream, written in EXPORT_BATCH_ROWS record
+    batches while a server-side cursor reads the rows. Per-label statistics are collected in the
+    same pass: GET /detections/export/{X-Export-Id}/summary once the download has finished.
+    """
+    if dataset == detection_export.TELEMETRY and mission_id is None:
+        raise HTTPException(status_code=400, detail="dataset=telemetry needs a mission_id")
+    since, until = _naive_utc(since), _naive_utc(until)
+    try:
+        if dataset == detection_export.DETECTIONS:
+            export = detection_export.Export(dataset, format, settings.EXPORT_BATCH_ROWS)
+            query = detection_export.detections_query(mission_id, since, until, label)
+        else:
+            epoch = [None if v is None else v.replace(tzinfo=timezone.utc).timestamp() for v in (since, until)]
+            export = detection_export.Export(dataset, format, settings.EXPORT_BATCH_ROWS, *epoch)
+            query = detection_export.telemetry_query(mission_id, *epoch)
+    except detection_export.ExportError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    export_id = detection_export.export_registry.begin(export)
+    name = dataset if mission_id is None else f"{dataset}-mission-{mission_id}"
+    return StreamingResponse(
+        detection_export.stream(db, query, export, export_id), media_type=detection_export.MEDIA_TYPES[format],
+        headers={"X-Export-Id": export_id, "Content-Disposition": f'attachment; filename="{name}.{format}"'},
+    )
+
+@router.get("/export/{export_id}/summary")
+def export_summary(export_id: str, current_user=Depends(get_current_user)):
+    """Row count, sizes and per-label statistics of an export (state "running" until it ends)."""
+    report = detection_export.export_registry.get(export_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Export not found")
+    return report
+
+# Map queries below use the read-only pool, so they do not queue behind the writers; they are
+# sync endpoints so that the queries and the response serialization run in the threadpool.
+@router.get("/bbox", response_model=List[schemas.DetectionOut])
+def detections_in_bbox(
+    min_lat: float = Query(..., ge=-90, le=90), min_lon: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90), max_lon: float = Query(..., ge=-180, le=180),
+    mission_id: Optional[int] = None, label: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=10000),
+    db: Session = Depends(get_read_db), current_user=Depends(get_current_user),
+):
+    if min_lat > max_lat or min_lon > max_lon:
+        raise HTTPException(status_code=400, detail="min_lat/min_lon must not exceed max_lat/max_lon")
+    return crud.get_detections_in_bbox(db, min_lat, min_lon, max_lat, max_lon,
+                                       mission_id=mission_id, label=label, limit=limit)
+
+@router.get("/near", response_model=List[schemas.DetectionNearOut])
+def detections_near(
+    lat: float = Query(..., ge=-90, le=90), lon: float = Query(..., ge=-180, le=180),
+    radius_m: float = Query(200, gt=0, le=50000),
+    mission_id: Optional[int] = None, label: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=10000),
+    db: Session = Depends(get_read_db), current_user=Depends(get_current_user),
+):
+    hits = crud.get_detections_near(db, lat, lon, radius_m, mission_id=mission_id, label=label, limit=limit)
+    return [dict(schemas.DetectionOut.from_orm(det).dict(), distance_m=d) for det, d in hits]
+
+@router.get("/tiles", response_model=schemas.DetectionTilesOut)
+def detection_tiles(
+    z: int = Query(..., ge=0, le=22), mission_id: Optional[int] = None,
+    since: Optional[datetime] = None, until: Optional[datetime] = None,
+    min_lat: Optional[float] = Query(None, ge=-90, le=90), min_lon: Optional[float] = Query(None, ge=-180, le=180),
+    max_lat: Optional[float] = Query(None, ge=-90, le=90), max_lon: Optional[float] = Query(None, ge=-180, le=180),
+    db: Session = Depends(get_read_db), current_user=Depends(get_current_user),
+):
+    """Tiles at zoom z, limited to those covering min_lat/min_lon/max_lat/max_lon when given (the viewport)."""
+    box = (min_lat, min_lon, max_lat, max_lon)
+    bounds = None
+    if any(v is not None for v in box):
+        if any(v is None for v in box):
+            raise HTTPException(status_code=400, detail="min_lat, min_lon, max_lat and max_lon go together")
+        if min_lat > max_lat or min_lon > max_lon:
+            raise HTTPException(status_code=400, detail="min_lat/min_lon must not exceed max_lat/max_lon")
+        bounds = tile_bounds(z, *box)
+    since, until = _naive_utc(since), _naive_utc(until)
+    # whole-mission aggregates are cached and updated as detections arrive; time windows are binned on demand
+    if since is not None or until is not None:
+        lat, lon, score = crud.get_detection_points(db, mission_id, since, until)
+        tiles = tiles_out(z, bin_tiles(lat, lon, score, z), bounds)
+    else:
+        tiles = tile_cache.get(mission_id, z, bounds)
+        if tiles is None:
+            with tile_cache.building(mission_id) as build:
+                lat, lon, score = crud.get_detection_points(db, mission_id)
+                bins = bin_tiles(lat, lon, score, z)
+                # rendered before put(): once cached, bins are updated under the cache's lock
+                tiles = tiles_out(z, bins, bounds)
+                tile_cache.put(mission_id, z, bins, build)
+    return {"z": z, "mission_id": mission_id, "tiles": tiles}
+
+@router.get("/grid", response_model=schemas.DetectionGridOut)
+def detection_grid(
+    cell_m: float = Query(100, ge=1, le=100000), mission_id: Optional[int] = None,
+    since: Optional[datetime] = None, until: Optional[datetime] = None,
+    db: Session = Depends(get_read_db), current_user=Depends(get_current_user),
+):
+    since, until = _naive_utc(since), _naive_utc(until)
+    lat, lon, score = crud.get_detection_points(db, mission_id, since, until)
+    cells = bin_grid(lat, lon, score, cell_m)
+    return {"cell_m": cell_m, "mission_id": mission_id, "cells": cells}
@@ -1,19 +1,91 @@
 # edge_server/api/endpoints/drone_control.py
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import Dict
 
+from edge_server.api import serializers
 from edge_server.api.deps import get_db_dep, get_current_user
-from edge_server.drone.adapter import drone_manager_singleton
+from edge_server.config import settings
 from edge_server.database import crud
+from edge_server.services.broker import BrokerError
+from edge_server.services.cluster import ClusterError, cluster
+from edge_server.services.command_queue import FINAL, CommandQueueFull
+from edge_server.services.mission_control import mission_control
 
 router = APIRouter()
 
+
+def _get_mission_or_404(db: Session, mission_id: int):
+    m = crud.get_mission(db, mission_id)
+    if not m:
+        raise HTTPException(status_code=404, detail="Mission not found")
+    return m
+
+
+@router.post("/{mission_id}/start")
+async def start_mission(mission_id: int, db: Session = Depends(get_db_dep), current_user = Depends(get_current_user)):
+    await run_in_threadpool(_get_mission_or_404, db, mission_id)
+    try:
+        worker = await mission_control.start_mission(mission_id)
+    except (ClusterError, BrokerError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    await run_in_threadpool(crud.set_mission_status, db, mission_id, "running")
+    return {"detail": "Mission started", "worker": worker}
+
+
+@router.post("/{mission_id}/stop")
+async def stop_mission(mission_id: int, db: Session = Depends(get_db_dep), current_user = Depends(get_current_user)):
+    await run_in_threadpool(_get_mission_or_404, db, mission_id)
+    try:
+        await mission_control.stop_mission(mission_id)
+    except (ClusterError, BrokerError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    await run_in_threadpool(crud.set_mission_status, db, mission_id, "stopped")
+    return {"detail": "Mission stopped"}
+
+
 @router.post("/{mission_id}/command")
-def send_command(mission_id: int, body: Dict, db: Session = Depends(get_db_dep), current_user = Depends(get_current_user)):
+async def send_command(mission_id: int, body: Dict, wait: float = Query(0, ge=0, le=settings.COMMAND_WAIT_MAX),
+                       current_user = Depends(get_current_user)):
+    """
+    Queue an operator command. Returns 202 with the command id right away, or with ?wait=<seconds>
+    the final state (acked/rejected/timeout/failed/preempted) once the vehicle has answered.
+    """
     cmd = body.get("command")
     if not cmd:
         raise HTTPException(status_code=400, detail="Missing command")
-    # For now, we just forward to manager (mock)
-    drone_manager_singleton.send_command(mission_id, cmd, params=body.get("params"))
-    return {"detail": "Command forwarded"}
+    try:
+        result = await mission_control.submit_command(mission_id, cmd, body.get("params"), wait)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except CommandQueueFull:
+        raise HTTPException(status_code=429, detail="Too many queued commands for this mission")
+    except (ClusterError, BrokerError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return serializers.json_response(result, status_code=200 if result["state"] in FINAL else 202)
+
+
+@router.get("/commands/stats")
+async def command_stats(current_user = Depends(get_current_user)):
+    try:
+        return await mission_control.command_stats()
+    except (ClusterError, BrokerError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+@router.get("/{mission_id}/commands/{command_id}")
+async def get_command(mission_id: int, command_id: int, wait: float = Query(0, ge=0, le=settings.COMMAND_WAIT_MAX),
+                      current_user = Depends(get_current_user)):
+    try:
+        result = await mission_control.get_command(mission_id, command_id, wait)
+    except (ClusterError, BrokerError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Command not found")
+    return serializers.json_response(result, status_code=200 if result["state"] in FINAL else 202)
+
+
+@router.get("/cluster/stats")
+def cluster_stats(current_user = Depends(get_current_user)):
+    return cluster.stats()
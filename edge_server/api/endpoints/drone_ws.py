@@ -1,16 +1,324 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+import asyncio
+import json
+from datetime import datetime, timezone
+from typing import Optional, Set
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket, WebSocketDisconnect, status
+from fastapi.concurrency import run_in_threadpool
+from edge_server.ai.detect import inference_engine
+from edge_server.ai.preprocess import frame_bytes, jpeg_supported
+from edge_server.api.deps import get_current_user, get_websocket_user
+from edge_server.database import crud
+from edge_server.services import mission_replay
+from edge_server.services.cluster import cluster
+from edge_server.services.frame_ingest import JPEG, FrameStream, IngestBusy, frame_ingest
+from edge_server.services.telemetry_hub import telemetry_hub, Subscriber
+from edge_server.utils import wire
 from edge_server.utils.logger import logger
 
 router = APIRouter()
 
+
+async def _pump(websocket: WebSocket, sub: Subscriber, binary: bool):
+    while True:
+        frame = await sub.get()
+        if binary:
+            await websocket.send_bytes(frame.binary)
+        else:
+            await websocket.send_text(frame.text)
+        sub.delivered(frame)
+
+
+def _pump_done(task: asyncio.Task):
+    # the receive loop keeps the socket open, so a failed sender would otherwise go unnoticed
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"WebSocket sender {task.get_name()} failed", exc_info=task.exception())
+
+
+def _wire_format(websocket: WebSocket) -> Optional[bool]:
+    """True for ?format=binary (see utils/wire.py), False for json (the default), None if unknown."""
+    return {"json": False, "binary": True}.get(websocket.query_params.get("format", "json"))
+
+
+async def _authorize(websocket: WebSocket, mission_id: int) -> bool:
+    """Accepted sockets only: close with 4401 without a valid token, 4404 for an unknown mission."""
+    if await get_websocket_user(websocket) is None:
+        await websocket.close(code=4401, reason="Not authenticated")
+        return False
+    if not await run_in_threadpool(mission_replay.in_read_session, crud.get_mission, mission_id):
+        await websocket.close(code=4404, reason="Mission not found")
+        return False
+    return True
+
+
 @router.websocket("/ws/{mission_id}")
 async def mission_ws(websocket: WebSocket, mission_id: int):
+    """
+    Live mission stream: JSON text messages, or binary ones (utils/wire.py) with ?format=binary.
+    The bearer token goes in ?token= or the Authorization header.
+    """
     await websocket.accept()
+    if not await _authorize(websocket, mission_id):
+        return
+    binary = _wire_format(websocket)
+    if binary is None:
+        await websocket.close(code=1008, reason="format must be json or binary")
+        return
     logger.info(f"WebSocket connected for mission {mission_id}")
+    sub = telemetry_hub.subscribe(mission_id)
+    sender = asyncio.create_task(_pump(websocket, sub, binary), name=f"mission-{mission_id}")
+    sender.add_done_callback(_pump_done)
     try:
         while True:
             data = await websocket.receive_text()
-            logger.info(f"Received from drone: {data}")
-            await websocket.send_text(f"Echo: {data}")
+            logger.info(f"Received from client: {data}")
     except WebSocketDisconnect:
         logger.info("WebSocket disconnected")
+    finally:
+        sender.cancel()
+        telemetry_hub.unsubscribe(sub)
+
+
+def _check_frames(fmt: str, width: Optional[int], height: Optional[int]) -> Optional[str]:
+    """Why frames of this format cannot be ingested right now, or None."""
+    if not inference_engine.enabled:
+        return "Detection is disabled (DETECTOR_BACKEND=none)"
+    if fmt == JPEG and not jpeg_supported():
+        return "JPEG frames need opencv-python or Pillow on the server; send raw rgb24/bgr24/gray8"
+    try:
+        frame_ingest.check(fmt, width, height)
+    except ValueError as e:
+        return str(e)
+    return None
+
+
+@router.websocket("/ws/{mission_id}/frames")
+async def mission_frames_ws(websocket: WebSocket, mission_id: int):
+    """
+    Camera frames from the drone: one binary message per frame, in the format given by the query
+    (format=jpeg|rgb24|bgr24|gray8, width and height for raw formats). Text messages
+    {"format": .., "width": .., "height": ..} change it; {"t": <time>} sets the capture time of
+    the next frame (default: arrival). Frames arriving faster than detection keeps up are skipped.
+    The bearer token goes in ?token= or the Authorization header.
+    """
+    await websocket.accept()
+    if not await _authorize(websocket, mission_id):
+        return
+    q = websocket.query_params
+    try:
+        fmt, width, height = q.get("format", JPEG), int(q.get("width", 0)), int(q.get("height", 0))
+    except ValueError:
+        await websocket.close(code=1008, reason="width and height must be integers")
+        return
+    problem = _check_frames(fmt, width, height)
+    if problem is not None:
+        await websocket.close(code=1008 if inference_engine.enabled else 1013, reason=problem)
+        return
+    stream = frame_ingest.open(mission_id, track_remote=cluster.distributed)
+    t = None
+    try:
+        while True:
+            msg = await websocket.receive()
+            if msg["type"] == "websocket.disconnect":
+                break
+            if msg.get("bytes") is not None:
+                data = msg["bytes"]
+                if fmt != JPEG and len(data) != frame_bytes(width, height, fmt):
+                    await websocket.send_text(json.dumps({"type": "error", "detail": (
+                        f"frame of {len(data)} bytes, {width}x{height} {fmt} needs {frame_bytes(width, height, fmt)}")}))
+                    continue
+                stream.put(data, width, height, fmt, t)
+                t = None
+                continue
+            try:
+                ctl = json.loads(msg.get("text") or "{}")
+                new = ctl.get("format", fmt), int(ctl.get("width", width)), int(ctl.get("height", height))
+                problem = _check_frames(*new)
+                if problem is not None:
+                    raise ValueError(problem)
+                fmt, width, height = new
+                if "t" in ctl:
+                    t = _parse_time(ctl["t"])
+            except (ValueError, TypeError, AttributeError) as e:
+                await websocket.send_text(json.dumps({"type": "error", "detail": str(e)}))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        frame_ingest.release(stream)
+
+
+async def _read_frames(request: Request, stream: FrameStream, fmt: str, width: int, height: int,
+                       t: Optional[float]) -> int:
+    """Assemble the (chunked) body into ring slots: back-to-back raw frames, or one encoded image."""
+    size = frame_bytes(width, height, fmt) if fmt != JPEG else stream.slot_bytes
+    slot, filled, frames = stream.take_slot(), 0, 0
+    try:
+        async for chunk in request.stream():
+            view = memoryview(chunk)
+            while view:
+                take = min(len(view), size - filled)
+                if take == 0:
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                        detail=f"Image exceeds DETECTOR_FRAME_MAX_BYTES={stream.slot_bytes}")
+                slot[filled:filled + take] = view[:take]
+                filled += take
+                view = view[take:]
+                if fmt != JPEG and filled == size:
+                    stream.put(slot[:size], width, height, fmt, t if frames == 0 else None, slot=slot)
+                    frames += 1
+                    slot, filled = stream.take_slot(), 0
+        if fmt == JPEG and filled:
+            stream.put(slot[:filled], width, height, fmt, t, slot=slot)
+            slot, frames = None, 1
+        elif filled:
+            raise HTTPException(status_code=400, detail=f"Body ends with a partial frame ({filled} of {size} bytes)")
+    finally:
+        if slot is not None:
+            stream.release_slot(slot)
+    return frames
+
+
+@router.post("/{mission_id}/frames", status_code=status.HTTP_202_ACCEPTED)
+async def ingest_frames(request: Request, mission_id: int, format: str = JPEG, width: Optional[int] = None,
+                        height: Optional[int] = None, t: Optional[str] = Query(None, description="capture time of the (first) frame"),
+                        current_user=Depends(get_current_user)):
+    """
+    Push frames over HTTP (chunked transfer works): one encoded image, or any number of raw
+    frames back to back, e.g. a camera's rawvideo pipe. Frames are assembled straight into the
+    mission's ring buffers; ones detection cannot keep up with are skipped.
+    """
+    if not await run_in_threadpool(mission_replay.in_read_session, crud.get_mission, mission_id):
+        raise HTTPException(status_code=404, detail="Mission not found")
+    problem = _check_frames(format, width, height)
+    if problem is not None:
+        code = 503 if not inference_engine.enabled else 415 if format == JPEG else 400
+        raise HTTPException(status_code=code, detail=problem)
+    try:
+        capture_time = _parse_time(t)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    stream = frame_ingest.open(mission_id, track_remote=cluster.distributed)
+    try:
+        frames = await _read_frames(request, stream, format, width or 0, height or 0, capture_time)
+    except IngestBusy:
+        raise HTTPException(status_code=429, detail="Too many concurrent frame uploads for this mission")
+    finally:
+        frame_ingest.release(stream)
+    if not frames:
+        raise HTTPException(status_code=400, detail="Empty body")
+    return {"accepted": frames}
+
+
+@router.get("/{mission_id}/frames/stats")
+def mission_frame_stats(mission_id: int, current_user=Depends(get_current_user)):
+    stats = frame_ingest.stats(mission_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="No frames received for this mission")
+    return stats
+
+
+def _parse_time(value) -> Optional[float]:
+    """Epoch seconds or an ISO timestamp (naive = UTC)."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        dt = datetime.fromisoformat(value)
+        return (dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)).timestamp()
+
+
+# close() calls scheduled from done-callbacks; referenced here until they finish
+_closing: Set[asyncio.Task] = set()
+
+
+def _player_done(websocket: WebSocket, mission_id: int):
+    """Done-callback for a replay task: log a failure and close the socket with 1011."""
+    def done(task: asyncio.Task):
+        if task.cancelled() or task.exception() is None:
+            return
+        logger.error(f"Replay of mission {mission_id} failed", exc_info=task.exception())
+        closing = asyncio.ensure_future(_close_quietly(websocket, 1011, "Replay failed"))
+        _closing.add(closing)
+        closing.add_done_callback(_closing.discard)
+    return done
+
+
+async def _close_quietly(websocket: WebSocket, code: int, reason: str):
+    try:
+        await websocket.close(code=code, reason=reason)
+    except Exception:
+        pass  # the client is already gone
+
+
+async def _replay_to(websocket: WebSocket, mission_id: int, state: dict):
+    binary = state["binary"]
+    async for t, event in mission_replay.replay(mission_id, state["since"], state["until"], state["speed"]):
+        if binary:
+            await websocket.send_bytes(wire.encode(event))
+        else:
+            await websocket.send_text(orjson.dumps(event).decode())
+        # resume point for speed changes / pause
+        state["since"] = t + 1e-6
+    end = {"type": "replay_end", "mission_id": mission_id}
+    if binary:
+        await websocket.send_bytes(wire.encode(end))
+    else:
+        await websocket.send_text(json.dumps(end))
+
+
+@router.websocket("/{mission_id}/replay")
+async def mission_replay_ws(websocket: WebSocket, mission_id: int):
+    """
+    Replay over WebSocket. Query: since, until (epoch or ISO), speed (1, 10, ..., max),
+    format (json or binary). Client messages: {"seek": <time>}, {"speed": <factor|"max">},
+    {"pause": true|false}. The bearer token goes in ?token= or the Authorization header.
+    """
+    await websocket.accept()
+    if not await _authorize(websocket, mission_id):
+        return
+    q = websocket.query_params
+    try:
+        binary = _wire_format(websocket)
+        if binary is None:
+            raise ValueError("format must be json or binary")
+        state = {"since": _parse_time(q.get("since")), "until": _parse_time(q.get("until")),
+                 "speed": mission_replay.parse_speed(q.get("speed", "1")), "paused": False, "binary": binary}
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+    on_done = _player_done(websocket, mission_id)
+    player = asyncio.create_task(_replay_to(websocket, mission_id, state))
+    player.add_done_callback(on_done)
+    try:
+        while True:
+            try:
+                msg = json.loads(await websocket.receive_text())
+                if "seek" in msg:
+                    state["since"] = _parse_time(msg["seek"])
+                if "speed" in msg:
+                    state["speed"] = mission_replay.parse_speed(str(msg["speed"]))
+                if "pause" in msg:
+                    state["paused"] = bool(msg["pause"])
+            except (ValueError, TypeError) as e:
+                await websocket.send_text(json.dumps({"type": "error", "detail": str(e)}))
+                continue
+            # restart from the (new) position; the old reader is dropped with its batches
+            player.cancel()
+            if not state["paused"]:
+                player = asyncio.create_task(_replay_to(websocket, mission_id, state))
+                player.add_done_callback(on_done)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        player.cancel()
+
+
+@router.get("/{mission_id}/stream/stats")
+def mission_stream_stats(mission_id: int, current_user=Depends(get_current_user)):
+    stats = telemetry_hub.stats(mission_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="No stream for this mission")
+    return stats
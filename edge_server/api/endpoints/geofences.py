@@ -0,0 +1,65 @@
+# edge_server/api/endpoints/geofences.py
+import json
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Response, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+
+from edge_server.api.deps import get_db_dep, get_current_user
+from edge_server.database import crud, schemas
+from edge_server.services.geofence import KINDS, NO_FLY, GeofenceError, geofence, parse_zones
+from edge_server.utils import simplify
+
+router = APIRouter()
+
+
+@router.post("/", status_code=status.HTTP_201_CREATED)
+async def create_geofences(geojson: Dict = Body(...), kind: str = Query(NO_FLY, regex=f"^({'|'.join(KINDS)})$"),
+                           mission_id: Optional[int] = None, name: Optional[str] = None,
+                           db: Session = Depends(get_db_dep), current_user=Depends(get_current_user)):
+    """
+    Add zones from a GeoJSON FeatureCollection, Feature or (Multi)Polygon. Feature properties
+    kind, name, mission_id, floor_m and ceiling_m override the query defaults.
+    """
+    try:
+        rows = parse_zones(geojson, kind, mission_id, name)
+    except GeofenceError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    ids = await run_in_threadpool(crud.create_geofences, db, rows)
+    await geofence.changed()
+    return {"created": ids}
+
+
+@router.get("/")
+def list_geofences(db: Session = Depends(get_db_dep), current_user=Depends(get_current_user)):
+    """Stored zones as a GeoJSON FeatureCollection."""
+    return {"type": "FeatureCollection", "features": [
+        {"type": "Feature", "id": z.id, "geometry": json.loads(z.geometry),
+         "properties": {"name": z.name, "kind": z.kind, "mission_id": z.mission_id,
+                        "floor_m": z.floor_m, "ceiling_m": z.ceiling_m}}
+        for z in crud.get_geofences(db)
+    ]}
+
+
+@router.delete("/{zone_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_geofence(zone_id: int, db: Session = Depends(get_db_dep), current_user=Depends(get_current_user)):
+    if not await run_in_threadpool(crud.delete_geofence, db, zone_id):
+        raise HTTPException(status_code=404, detail="Geofence not found")
+    await geofence.changed()
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@router.post("/check")
+def check_path(points: List[schemas.WaypointBase], mission_id: Optional[int] = None,
+               current_user=Depends(get_current_user)):
+    """Breaches of a path (ordered by seq), as creating a journey from it would report them."""
+    points = sorted(points, key=lambda p: p.seq)
+    breaches = geofence.check_path([p.lat for p in points], [p.lon for p in points],
+                                   simplify.alt_array([p.alt for p in points]), mission_id)
+    return {"ok": not breaches, "breaches": breaches}
+
+
+@router.get("/stats")
+def geofence_stats(current_user=Depends(get_current_user)):
+    return geofence.stats()
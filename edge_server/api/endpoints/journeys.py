@@ -1,149 +1,192 @@
 # edge_server/api/endpoints/journeys.py
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session, selectinload
-from typing import List, Dict, Any
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from typing import List, Optional
 from datetime import datetime
+import numpy as np
 
-from edge_server.api.deps import get_db_dep, get_current_user
-from edge_server.database import schemas
+from edge_server.api import serializers
+from edge_server.api.deps import get_db_dep, get_current_user, get_read_db
+from edge_server.config import settings
+from edge_server.database import crud, schemas
 from edge_server.database.models import Journey, Waypoint
-from edge_server.utils.logger import logger
+from edge_server.drone import journey_planner
+from edge_server.services import journey_io
+from edge_server.services.geofence import geofence
+from edge_server.utils import geo, polyline, simplify
 
 router = APIRouter()
 
 
-def _waypoint_column_name():
-    """
-    Return the column name used for waypoint sequence in the current models.
-    Tries 'seq' first, then 'sequence'. Falls back to 'seq'.
-    """
-    if hasattr(Waypoint, "seq"):
-        return "seq"
-    if hasattr(Waypoint, "sequence"):
-        return "sequence"
-    return "seq"
-
-
 @router.post("/", response_model=schemas.JourneyOut, status_code=status.HTTP_201_CREATED)
-def create_journey(payload: schemas.JourneyCreate, db: Session = Depends(get_db_dep), current_user=Depends(get_current_user)):
+def create_journey(payload: schemas.JourneyCreate,
+                   simplify_tolerance_m: Optional[float] = Query(None, gt=0),
+                   simplify_method: str = Query("dp", regex="^(dp|vw)$"),
+                   db: Session = Depends(get_db_dep), current_user=Depends(get_current_user)):
     # Basic validation of points
     if not payload.points or len(payload.points) < 2:
         raise HTTPException(status_code=400, detail="A journey requires at least 2 points.")
 
-    # create Journey
+    points = payload.points
+    report = None
+    if simplify_tolerance_m is not None:
+        points = sorted(points, key=lambda p: p.seq)
+        kept, report = simplify.simplify(
+            [p.lat for p in points], [p.lon for p in points], simplify.alt_array([p.alt for p in points]),
+            simplify_tolerance_m, simplify_method,
+        )
+        points = [points[i] for i in kept]
+
+    ordered = sorted(points, key=lambda p: p.seq)
+    breaches = geofence.check_path([p.lat for p in ordered], [p.lon for p in ordered],
+                                   simplify.alt_array([p.alt for p in ordered]))
+    if breaches:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail={"message": "Journey breaches geofences", "breaches": breaches[:100]})
+
     j = Journey(
         name=payload.name,
-        description=getattr(payload, "description", None) or None,
+        description=payload.description or None,
         owner_id=current_user.id,
         created_at=datetime.utcnow()
     )
     db.add(j)
     db.flush()  # get j.id without commit
+    db.execute(
+        Waypoint.__table__.insert(),
+        [{"journey_id": j.id, "seq": p.seq, "lat": p.lat, "lon": p.lon, "alt": p.alt} for p in points],
+    )
+    crud.bump_journey_version(db, current_user.id)
+    db.commit()
 
-    seq_col = _waypoint_column_name()
-    for i, p in enumerate(payload.points):
-        lat = getattr(p, "lat", None)
-        lon = getattr(p, "lon", None)
-        alt = getattr(p, "alt", None) if hasattr(p, "alt") else None
-        seq_val = getattr(p, "sequence", None) if hasattr(p, "sequence") else getattr(p, "seq", i)
+    out = serializers.journey_payloads(db, [serializers.get_journey_row(db, j.id, current_user.id)])[0]
+    out["simplification"] = report
+    return serializers.json_response(out, status_code=status.HTTP_201_CREATED)
 
-        if lat is None or lon is None:
-            raise HTTPException(status_code=400, detail=f"Waypoint #{i} missing lat/lon")
 
-        wp_kwargs = {"journey_id": j.id, "lat": float(lat), "lon": float(lon)}
-        # set the correct sequence field depending on model
-        wp_kwargs[seq_col] = int(seq_val) if seq_val is not None else i
-        # also include alt if model has it
-        if hasattr(Waypoint, "alt"):
-            wp_kwargs["alt"] = alt
+@router.post("/plan", response_model=schemas.JourneyCreate)
+def plan_journey(req: schemas.JourneyPlanRequest, current_user=Depends(get_current_user)):
+    """Generate (coverage) or reorder (tour) waypoints. Nothing is stored; POST the result to / to save it."""
+    try:
+        if req.mode == "coverage":
+            if not req.polygon:
+                raise HTTPException(status_code=400, detail="coverage planning requires a polygon")
+            width = req.footprint_width_m or journey_planner.footprint_width(req.altitude, req.fov_deg)
+            lat, lon = journey_planner.coverage_path(req.polygon, width * (1.0 - req.overlap), req.sweep_angle_deg)
+            alt = np.full(len(lat), req.altitude)
+        else:
+            if not req.points or len(req.points) < 2:
+                raise HTTPException(status_code=400, detail="tour planning requires at least 2 points")
+            pts = sorted(req.points, key=lambda p: p.seq)
+            order = journey_planner.optimize_order(
+                [p.lat for p in pts], [p.lon for p in pts],
+                return_to_start=req.return_to_start, time_budget_s=req.time_budget_ms / 1000,
+            )
+            lat = np.array([pts[i].lat for i in order])
+            lon = np.array([pts[i].lon for i in order])
+            alt = np.array([np.nan if pts[i].alt is None else pts[i].alt for i in order])
+    except journey_planner.PlanningError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if req.return_to_start:
+        lat, lon, alt = np.append(lat, lat[0]), np.append(lon, lon[0]), np.append(alt, alt[0])
+    points = [
+        {"seq": i, "lat": float(la), "lon": float(lo), "alt": None if np.isnan(al) else float(al)}
+        for i, (la, lo, al) in enumerate(zip(lat, lon, alt))
+    ]
+    return {"name": req.name, "description": req.description, "points": points}
 
-        wp = Waypoint(**wp_kwargs)
-        db.add(wp)
 
-    db.commit()
-    db.refresh(j)
-
-    # eager-load waypoints
-    j = db.query(Journey).options(selectinload(Journey.waypoints)).get(j.id)
-
-    # Build response in a stable shape (seq field used for consistency)
-    waypoints_out = []
-    for idx, wp in enumerate(sorted(j.waypoints, key=lambda w: getattr(w, "seq", getattr(w, "sequence", idx)))):
-        seq_value = getattr(wp, "seq", None)
-        if seq_value is None:
-            seq_value = getattr(wp, "sequence", idx)
-        waypoints_out.append({
-            "id": wp.id,
-            "seq": seq_value,
-            "lat": wp.lat,
-            "lon": wp.lon,
-            "alt": getattr(wp, "alt", None)
-        })
-
-    response = {
-        "id": j.id,
-        "name": j.name,
-        "description": j.description,
-        "owner_id": j.owner_id,
-        "created_at": j.created_at,
-        "waypoints": waypoints_out
-    }
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (t.strip() for t in if_none_match.split(","))
+
+
+@router.get("/", response_model=List[schemas.JourneyListItem])
+def list_journeys(after_id: Optional[int] = Query(None, ge=0),
+                  limit: Optional[int] = Query(None, ge=1),
+                  waypoints: str = Query("full", regex="^(full|summary|none)$"),
+                  format: str = Query("json", regex="^(json|ndjson)$"),
+                  if_none_match: Optional[str] = Header(None),
+                  db: Session = Depends(get_read_db), current_user=Depends(get_current_user)):
+    """
+    Keyset-paginated list ordered by id. JSON pages hold at most JOURNEY_PAGE_SIZE journeys
+    (?limit= up to JOURNEY_PAGE_MAX); when more exist the response carries X-Next-After-Id.
+    format=ndjson streams one journey per line. The ETag changes whenever a journey of the
+    user is created or deleted, so a matching If-None-Match returns 304 without reading journeys.
+    """
+    version = crud.get_journey_version(db, current_user.id)
+    etag = f'W/"{current_user.id}-{version}-{after_id}-{limit}-{waypoints}-{format}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    if format == "ndjson":
+        return StreamingResponse(
+            serializers.iter_ndjson(db, current_user.id, after_id, limit, waypoints),
+            media_type="application/x-ndjson", headers=headers,
+        )
+
+    page_size = min(limit or settings.JOURNEY_PAGE_SIZE, settings.JOURNEY_PAGE_MAX)
+    # one extra row tells us whether there is a next page
+    rows = serializers.list_journey_rows(db, current_user.id, after_id, page_size + 1)
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        headers["X-Next-After-Id"] = str(rows[-1][0])
+    response = serializers.json_response(serializers.journey_payloads(db, rows, waypoints))
+    response.headers.update(headers)
     return response
 
 
-@router.get("/", response_model=List[schemas.JourneyOut])
-def list_journeys(db: Session = Depends(get_db_dep), current_user=Depends(get_current_user)):
-    qs = db.query(Journey).filter(Journey.owner_id == current_user.id).options(selectinload(Journey.waypoints)).all()
-    out = []
-    for j in qs:
-        waypoints_out = []
-        for idx, wp in enumerate(sorted(j.waypoints, key=lambda w: getattr(w, "seq", getattr(w, "sequence", idx)))):
-            seq_value = getattr(wp, "seq", None)
-            if seq_value is None:
-                seq_value = getattr(wp, "sequence", idx)
-            waypoints_out.append({
-                "id": wp.id,
-                "seq": seq_value,
-                "lat": wp.lat,
-                "lon": wp.lon,
-                "alt": getattr(wp, "alt", None)
-            })
-        out.append({
-            "id": j.id,
-            "name": j.name,
-            "description": j.description,
-            "owner_id": j.owner_id,
-            "created_at": j.created_at,
-            "waypoints": waypoints_out
-        })
-    return out
+@router.post("/import", status_code=status.HTTP_201_CREATED)
+async def import_journeys(request: Request, db: Session = Depends(get_db_dep), current_user=Depends(get_current_user)):
+    """
+    Bulk import from the request body: a GeoJSON FeatureCollection (each LineString or
+    MultiLineString part becomes a journey, feature properties name / description), or a GPX
+    (rte, trk) or KML (Placemark LineString / gx:Track) file. The body is parsed and checked as
+    it arrives and only written once it is complete; nothing is stored if any journey is invalid
+    (400) or breaches a geofence (422).
+    """
+    importer = journey_io.JourneyImporter(current_user.id, settings.JOURNEY_IMPORT_CHUNK,
+                                          settings.JOURNEY_IMPORT_SPOOL_BYTES, settings.JOURNEY_IMPORT_MAX_BYTES)
+    try:
+        async for chunk in request.stream():
+            if chunk:
+                await run_in_threadpool(importer.feed, chunk)
+        rejected = await run_in_threadpool(importer.close)
+        if rejected:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                                detail=dict(rejected, message="Journeys breach geofences"))
+        return await run_in_threadpool(importer.insert, db)
+    except journey_io.ImportTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except journey_io.JourneyImportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        importer.discard()
+
+
+@router.get("/export")
+async def export_journeys(format: str = Query(journey_io.GEOJSON, regex=f"^({'|'.join(journey_io.EXPORT_FORMATS)})$"),
+                          db: Session = Depends(get_read_db), current_user=Depends(get_current_user)):
+    """All of the user's journeys as one GeoJSON FeatureCollection, GPX or KML document, streamed."""
+    return StreamingResponse(
+        journey_io.iter_export(db, current_user.id, format, settings.PROJECT_NAME),
+        media_type=journey_io.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="journeys.{"geojson" if format == journey_io.GEOJSON else format}"'},
+    )
 
 
 @router.get("/{journey_id}", response_model=schemas.JourneyOut)
-def get_journey(journey_id: int, db: Session = Depends(get_db_dep), current_user=Depends(get_current_user)):
-    j = db.query(Journey).options(selectinload(Journey.waypoints)).get(journey_id)
-    if not j or j.owner_id != current_user.id:
+def get_journey(journey_id: int, db: Session = Depends(get_read_db), current_user=Depends(get_current_user)):
+    row = serializers.get_journey_row(db, journey_id, current_user.id)
+    if not row:
         raise HTTPException(status_code=404, detail="Journey not found")
-    waypoints_out = []
-    for idx, wp in enumerate(sorted(j.waypoints, key=lambda w: getattr(w, "seq", getattr(w, "sequence", idx)))):
-        seq_value = getattr(wp, "seq", None)
-        if seq_value is None:
-            seq_value = getattr(wp, "sequence", idx)
-        waypoints_out.append({
-            "id": wp.id,
-            "seq": seq_value,
-            "lat": wp.lat,
-            "lon": wp.lon,
-            "alt": getattr(wp, "alt", None)
-        })
-    return {
-        "id": j.id,
-        "name": j.name,
-        "description": j.description,
-        "owner_id": j.owner_id,
-        "created_at": j.created_at,
-        "waypoints": waypoints_out
-    }
+    return serializers.json_response(serializers.journey_payloads(db, [row])[0])
 
 
 @router.delete("/{journey_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -152,21 +195,77 @@ def delete_journey(journey_id: int, db: Session = Depends(get_db_dep), current_u
     if not j or j.owner_id != current_user.id:
         raise HTTPException(status_code=404, detail="Journey not found")
     db.delete(j)
+    crud.bump_journey_version(db, current_user.id)
     db.commit()
     return {"detail": "deleted"}
 
 
+def _journey_with_waypoints(db: Session, journey_id: int, owner_id: int):
+    row = serializers.get_journey_row(db, journey_id, owner_id)
+    if not row:
+        return None, []
+    return row, serializers.waypoint_rows(db, [journey_id]).get(journey_id, [])
+
+
 @router.get("/{journey_id}/export")
-def export_journey_geojson(journey_id: int, db: Session = Depends(get_db_dep), current_user=Depends(get_current_user)):
-    j = db.query(Journey).options(selectinload(Journey.waypoints)).get(journey_id)
-    if not j or j.owner_id != current_user.id:
+def export_journey_geojson(journey_id: int,
+                           format: str = Query("geojson", regex="^(geojson|polyline)$"),
+                           simplify_tolerance_m: Optional[float] = Query(None, gt=0),
+                           simplify_method: str = Query("dp", regex="^(dp|vw)$"),
+                           db: Session = Depends(get_read_db), current_user=Depends(get_current_user)):
+    # (id, seq, lat, lon, alt)
+    row, wps = _journey_with_waypoints(db, journey_id, current_user.id)
+    if not row:
         raise HTTPException(status_code=404, detail="Journey not found")
-    coords = []
-    for idx, wp in enumerate(sorted(j.waypoints, key=lambda w: getattr(w, "seq", getattr(w, "sequence", idx)))):
-        coords.append([wp.lon, wp.lat])
+    _, name, description, _, _ = row
+    report = None
+    if simplify_tolerance_m is not None and wps:
+        kept, report = simplify.simplify(
+            [w[2] for w in wps], [w[3] for w in wps], simplify.alt_array([w[4] for w in wps]),
+            simplify_tolerance_m, simplify_method,
+        )
+        wps = [wps[i] for i in kept]
+    if format == "polyline":
+        out = {
+            "name": name,
+            "description": description,
+            "polyline": polyline.encode([w[2] for w in wps], [w[3] for w in wps]),
+            "precision": 5,
+        }
+        if any(w[4] is not None for w in wps):
+            out["altitudes"] = [w[4] for w in wps]
+        if report:
+            out["simplification"] = report
+        return serializers.json_response(out)
+    properties = {"name": name, "description": description}
+    if report:
+        properties["simplification"] = report
     geojson = {
         "type": "Feature",
-        "properties": {"name": j.name, "description": j.description},
-        "geometry": {"type": "LineString", "coordinates": coords}
+        "properties": properties,
+        "geometry": {"type": "LineString", "coordinates": [[w[3], w[2]] for w in wps]}
+    }
+    return serializers.json_response(geojson)
+
+
+@router.get("/{journey_id}/stats", response_model=schemas.JourneyStatsOut)
+def journey_stats(journey_id: int, db: Session = Depends(get_read_db), current_user=Depends(get_current_user)):
+    row, wps = _journey_with_waypoints(db, journey_id, current_user.id)
+    if not row:
+        raise HTTPException(status_code=404, detail="Journey not found")
+    rows = [w[2:] for w in wps]
+    if not rows:
+        return {"journey_id": journey_id, "waypoints": 0, "length_m": 0.0, "max_leg_m": 0.0}
+    pts = np.array(rows, dtype=np.float64)
+    lat, lon, alt = pts[:, 0], pts[:, 1], pts[:, 2]
+    legs = geo.consecutive_distances(lat, lon)
+    has_alt = ~np.isnan(alt)
+    return {
+        "journey_id": journey_id,
+        "waypoints": len(rows),
+        "length_m": float(legs.sum()),
+        "max_leg_m": float(legs.max()) if len(legs) else 0.0,
+        "bbox": [float(lon.min()), float(lat.min()), float(lon.max()), float(lat.max())],
+        "min_alt": float(alt[has_alt].min()) if has_alt.any() else None,
+        "max_alt": float(alt[has_alt].max()) if has_alt.any() else None,
     }
-    return geojson
@@ -1,10 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime, timezone
+from typing import Optional
+import numpy as np
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from edge_server.api import serializers
 from edge_server.database import crud, schemas
-from edge_server.api.deps import get_db_dep, get_current_user
+from edge_server.api.deps import get_db_dep, get_current_user, get_read_db
+from edge_server.services import mission_replay
+from edge_server.services.broker import BrokerError
+from edge_server.services.cluster import ClusterError, cluster
+from edge_server.services.mission_control import mission_control
+from edge_server.services.mission_progress import mission_progress
+from edge_server.services.telemetry_store import RAW, columns, telemetry_store
+from edge_server.utils import wire
 
 router = APIRouter()
 
+REPLAY_BLOCK = 256
+
 @router.post("/", response_model=schemas.MissionOut)
 def create_mission(mission_in: schemas.MissionCreate, db: Session = Depends(get_db_dep), current_user=Depends(get_current_user)):
     return crud.create_mission(db, mission_in)
@@ -15,3 +31,125 @@ def get_mission(mission_id: int, db: Session = Depends(get_db_dep), current_user
     if not mission:
         raise HTTPException(status_code=404, detail="Mission not found")
     return mission
+
+def _epoch(dt: Optional[datetime]) -> Optional[float]:
+    if dt is None:
+        return None
+    # naive datetimes are UTC, like the rest of the API
+    return (dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)).timestamp()
+
+def _telemetry_series(db: Session, mission_id: int, since, until, resolution: str, max_points: int):
+    if not crud.get_mission(db, mission_id):
+        return None
+    if resolution == "auto":
+        res = telemetry_store.pick_resolution(db, mission_id, since, until, max_points)
+    else:
+        res = RAW if resolution == "raw" else int(resolution)
+    return res, telemetry_store.query(db, mission_id, since, until, res)
+
+@router.get("/{mission_id}/telemetry", response_model=schemas.TelemetrySeriesOut)
+def mission_telemetry(mission_id: int, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                      resolution: str = Query("auto", regex="^(auto|raw|1|10|60)$"),
+                      max_points: int = Query(2000, ge=10, le=100000),
+                      db: Session = Depends(get_read_db), current_user=Depends(get_current_user)):
+    """
+    Telemetry for a time window. resolution=auto returns raw samples when the window holds at
+    most max_points of them, otherwise the finest 1 s / 10 s / 60 s rollup (min/max/mean) that fits.
+    """
+    out = _telemetry_series(db, mission_id, _epoch(since), _epoch(until), resolution, max_points)
+    if out is None:
+        raise HTTPException(status_code=404, detail="Mission not found")
+    res, cols = out
+    return serializers.json_response({
+        "mission_id": mission_id,
+        "resolution_s": res,
+        "columns": {name: col.tolist() for name, col in zip(columns(res), cols)},
+    })
+
+@router.get("/telemetry/stats")
+def telemetry_store_stats(current_user=Depends(get_current_user)):
+    return telemetry_store.stats()
+
+@router.get("/{mission_id}/progress")
+async def get_mission_progress(mission_id: int, current_user=Depends(get_current_user)):
+    """
+    Leg, distance flown / remaining, ETA and battery forecast at the finish, as last published
+    on the mission stream. Answered by the worker running the mission; kept after it ends.
+    """
+    try:
+        owner = await mission_control.owner(mission_id) or cluster.worker_id
+        progress = await cluster.call(owner, "progress.get", mission_id=mission_id)
+    except (ClusterError, BrokerError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if progress is None:
+        raise HTTPException(status_code=404, detail="No progress for this mission")
+    return progress
+
+@router.get("/progress/stats")
+def mission_progress_stats(current_user=Depends(get_current_user)):
+    return mission_progress.stats()
+
+@router.get("/{mission_id}/replay")
+async def replay_mission(mission_id: int, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                         speed: str = Query("1", regex=r"^(max|\d+(\.\d+)?)$"),
+                         format: str = Query("json", regex="^(json|binary)$"),
+                         current_user=Depends(get_current_user)):
+    """
+    Recorded telemetry and detections as NDJSON in timestamp order, at `speed` x real time
+    (1, 10, ... or max). `since` seeks via the chunk index. WebSocket clients use the same path.
+    format=binary sends length-prefixed utils/wire.py messages instead, telemetry in
+    delta-encoded blocks when the speed is max.
+    """
+    try:
+        factor = mission_replay.parse_speed(speed)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # no request-scoped session: it would stay open until the whole replay has been sent
+    if not await run_in_threadpool(mission_replay.in_read_session, crud.get_mission, mission_id):
+        raise HTTPException(status_code=404, detail="Mission not found")
+
+    if format == "binary":
+        return StreamingResponse(_binary_replay(mission_id, _epoch(since), _epoch(until), factor),
+                                 media_type=wire.MEDIA_TYPE)
+
+    async def body():
+        buf = []
+        async for _, event in mission_replay.replay(mission_id, _epoch(since), _epoch(until), factor):
+            buf.append(orjson.dumps(event))
+            # paced replays send every event as it becomes due; max speed sends in batches
+            if factor is not None or len(buf) >= 256:
+                yield b"\n".join(buf) + b"\n"
+                buf.clear()
+        if buf:
+            yield b"\n".join(buf) + b"\n"
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
+async def _binary_replay(mission_id: int, since: Optional[float], until: Optional[float], factor: Optional[float]):
+    # unpaced: runs of telemetry go out as one block of up to REPLAY_BLOCK samples
+    block = []
+
+    def flush():
+        cols = np.array([(t, e["lat"], e["lon"], e["alt"], e["battery"]) for t, e in block],
+                        dtype=np.float64).reshape(-1, 5).T
+        block.clear()
+        return wire.frame(wire.encode_telemetry_block(mission_id, *cols))
+
+    buf = []
+    async for t, event in mission_replay.replay(mission_id, since, until, factor):
+        if factor is None and event["type"] == "telemetry":
+            block.append((t, event))
+            if len(block) >= REPLAY_BLOCK:
+                buf.append(flush())
+        else:
+            if block:
+                buf.append(flush())
+            buf.append(wire.frame(wire.encode(event)))
+        if factor is not None or len(buf) >= 16:
+            yield b"".join(buf)
+            buf.clear()
+    if block:
+        buf.append(flush())
+    if buf:
+        yield b"".join(buf)
@@ -0,0 +1,115 @@
+# edge_server/api/serializers.py
+# Journey responses built straight from SQL column tuples (no ORM objects) and
+# encoded once with orjson. Endpoints return the Response directly, which skips
+# FastAPI's response_model re-validation.
+from itertools import groupby
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Sequence
+
+import orjson
+from fastapi import Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from edge_server.database.models import Journey, Waypoint
+
+JOURNEY_COLUMNS = (Journey.id, Journey.name, Journey.description, Journey.owner_id, Journey.created_at)
+WAYPOINT_COLUMNS = (Waypoint.journey_id, Waypoint.id, Waypoint.seq, Waypoint.lat, Waypoint.lon, Waypoint.alt)
+
+# SQLite limits the number of bound parameters per statement
+IN_CHUNK = 500
+
+
+def json_response(payload, status_code: int = 200) -> Response:
+    return Response(content=orjson.dumps(payload), status_code=status_code, media_type="application/json")
+
+
+def waypoint_rows(db: Session, journey_ids: Sequence[int]) -> Dict[int, list]:
+    """(id, seq, lat, lon, alt) tuples per journey, ordered by seq."""
+    out: Dict[int, list] = {}
+    for start in range(0, len(journey_ids), IN_CHUNK):
+        chunk = journey_ids[start:start + IN_CHUNK]
+        rows = db.execute(
+            select(*WAYPOINT_COLUMNS).where(Waypoint.journey_id.in_(chunk)).order_by(Waypoint.journey_id, Waypoint.seq)
+        )
+        for journey_id, group in groupby(rows, key=lambda r: r[0]):
+            out[journey_id] = [r[1:] for r in group]
+    return out
+
+
+def waypoint_summaries(db: Session, journey_ids: Sequence[int]) -> Dict[int, tuple]:
+    """(count, [min_lon, min_lat, max_lon, max_lat]) per journey, aggregated in SQL."""
+    out: Dict[int, tuple] = {}
+    for start in range(0, len(journey_ids), IN_CHUNK):
+        chunk = journey_ids[start:start + IN_CHUNK]
+        rows = db.execute(
+            select(Waypoint.journey_id, func.count(), func.min(Waypoint.lon), func.min(Waypoint.lat),
+                   func.max(Waypoint.lon), func.max(Waypoint.lat))
+            .where(Waypoint.journey_id.in_(chunk)).group_by(Waypoint.journey_id)
+        )
+        for journey_id, count, *bbox in rows:
+            out[journey_id] = (count, bbox)
+    return out
+
+
+def journey_dict(row, waypoints: Optional[list]) -> dict:
+    jid, name, description, owner_id, created_at = row
+    out = {"id": jid, "name": name, "description": description, "owner_id": owner_id, "created_at": created_at}
+    if waypoints is not None:
+        out["waypoints"] = [
+            {"id": wid, "seq": seq, "lat": lat, "lon": lon, "alt": alt} for wid, seq, lat, lon, alt in waypoints
+        ]
+    return out
+
+
+def journey_payloads(db: Session, rows: Iterable, waypoints: str = "full") -> List[dict]:
+    """waypoints: "full" (list of waypoints), "summary" (waypoint_count + bbox) or "none"."""
+    rows = list(rows)
+    ids = [r[0] for r in rows]
+    if waypoints == "full":
+        wps = waypoint_rows(db, ids)
+        return [journey_dict(r, wps.get(r[0], [])) for r in rows]
+    out = [journey_dict(r, None) for r in rows]
+    if waypoints == "summary":
+        summaries = waypoint_summaries(db, ids)
+        for item in out:
+            item["waypoint_count"], item["bbox"] = summaries.get(item["id"], (0, None))
+    return out
+
+
+def _ndjson_chunk(db: Session, owner_id: int, after_id: Optional[int], size: int, waypoints: str):
+    rows = list_journey_rows(db, owner_id, after_id, size)
+    body = b"".join(orjson.dumps(item) + b"\n" for item in journey_payloads(db, rows, waypoints))
+    return body, (rows[-1][0] if rows else after_id), len(rows)
+
+
+async def iter_ndjson(db: Session, owner_id: int, after_id: Optional[int] = None, limit: Optional[int] = None,
+                      waypoints: str = "full") -> AsyncIterator[bytes]:
+    """One JSON document per line, fetched IN_CHUNK journeys at a time so memory stays flat."""
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = IN_CHUNK if remaining is None else min(IN_CHUNK, remaining)
+        body, after_id, n = await run_in_threadpool(_ndjson_chunk, db, owner_id, after_id, size, waypoints)
+        if n:
+            yield body
+        if n < size:
+            return
+        if remaining is not None:
+            remaining -= n
+
+
+def get_journey_row(db: Session, journey_id: int, owner_id: int):
+    return db.execute(
+        select(*JOURNEY_COLUMNS).where(Journey.id == journey_id, Journey.owner_id == owner_id)
+    ).first()
+
+
+def list_journey_rows(db: Session, owner_id: int, after_id: Optional[int] = None, limit: Optional[int] = None):
+    """Keyset page ordered by id: journeys with id > after_id."""
+    q = select(*JOURNEY_COLUMNS).where(Journey.owner_id == owner_id)
+    if after_id is not None:
+        q = q.where(Journey.id > after_id)
+    q = q.order_by(Journey.id)
+    if limit is not None:
+        q = q.limit(limit)
+    return db.execute(q).all()
@@ -6,7 +6,108 @@ class Settings:
     SECRET_KEY: str = os.getenv("SECRET_KEY", "supersecret")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24  # 1 day
     REFRESH_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 7  # 7 days
-    DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./app.db")
+    DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./airchif.db")
+    # optional replica for the read-only pool used by query endpoints
+    DATABASE_READ_URL: str = os.getenv("DATABASE_READ_URL", "")
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_READ_POOL_SIZE: int = int(os.getenv("DB_READ_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    SQLITE_BUSY_TIMEOUT_MS: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    SQLITE_MMAP_SIZE: int = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+    # mission WebSocket fan-out: per-client queue size and overflow policy
+    WS_QUEUE_SIZE: int = int(os.getenv("WS_QUEUE_SIZE", "64"))
+    WS_QUEUE_POLICY: str = os.getenv("WS_QUEUE_POLICY", "coalesce_latest")
+    # write-behind detection buffer
+    DETECTION_BATCH_SIZE: int = int(os.getenv("DETECTION_BATCH_SIZE", "500"))
+    DETECTION_FLUSH_MS: int = int(os.getenv("DETECTION_FLUSH_MS", "250"))
+    DETECTION_MAX_PENDING: int = int(os.getenv("DETECTION_MAX_PENDING", "20000"))
+    DETECTION_SUBMIT_TIMEOUT: float = float(os.getenv("DETECTION_SUBMIT_TIMEOUT", "5"))
+    # a failed batch write (e.g. "database is locked") is retried this many times, waiting
+    # DETECTION_RETRY_BACKOFF_MS, then twice as long each time, before the batch is dropped
+    DETECTION_WRITE_RETRIES: int = int(os.getenv("DETECTION_WRITE_RETRIES", "5"))
+    DETECTION_RETRY_BACKOFF_MS: int = int(os.getenv("DETECTION_RETRY_BACKOFF_MS", "100"))
+    # repeated detections of one object (same mission and label, within the radius, seen again
+    # within the window) are merged into one row; radius 0 stores every detection
+    DETECTION_DEDUP_RADIUS_M: float = float(os.getenv("DETECTION_DEDUP_RADIUS_M", "5"))
+    DETECTION_DEDUP_WINDOW_S: float = float(os.getenv("DETECTION_DEDUP_WINDOW_S", "120"))
+    # mission progress: publish interval on the mission stream, distance from the route that
+    # triggers a search over all legs, and the time constant of the speed / battery smoothing
+    PROGRESS_PUBLISH_S: float = float(os.getenv("PROGRESS_PUBLISH_S", "1"))
+    PROGRESS_OFF_ROUTE_M: float = float(os.getenv("PROGRESS_OFF_ROUTE_M", "30"))
+    PROGRESS_SMOOTHING_S: float = float(os.getenv("PROGRESS_SMOOTHING_S", "10"))
+    # analytics export: rows per record batch (Parquet row group) and rows fetched per cursor round trip
+    EXPORT_BATCH_ROWS: int = int(os.getenv("EXPORT_BATCH_ROWS", "65536"))
+    EXPORT_FETCH_ROWS: int = int(os.getenv("EXPORT_FETCH_ROWS", "5000"))
+    # GET /journeys/ page size (JSON mode; NDJSON streams everything unless ?limit= is given)
+    JOURNEY_PAGE_SIZE: int = int(os.getenv("JOURNEY_PAGE_SIZE", "100"))
+    JOURNEY_PAGE_MAX: int = int(os.getenv("JOURNEY_PAGE_MAX", "1000"))
+    # POST /journeys/import: journeys per insert transaction, checked journeys kept in memory
+    # before spilling to a temporary file, and the largest accepted body (0 = unlimited)
+    JOURNEY_IMPORT_CHUNK: int = int(os.getenv("JOURNEY_IMPORT_CHUNK", "500"))
+    JOURNEY_IMPORT_SPOOL_BYTES: int = int(os.getenv("JOURNEY_IMPORT_SPOOL_BYTES", str(16 << 20)))
+    JOURNEY_IMPORT_MAX_BYTES: int = int(os.getenv("JOURNEY_IMPORT_MAX_BYTES", str(512 << 20)))
+    # verified-token -> user cache used by get_current_user
+    AUTH_CACHE_SIZE: int = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+    AUTH_CACHE_TTL: float = float(os.getenv("AUTH_CACHE_TTL", "300"))
+    # bcrypt cost and the process pool that runs it; existing hashes are upgraded on login
+    BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", "12"))
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+    PASSWORD_HASH_MAX_PENDING: int = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+    PASSWORD_HASH_TIMEOUT: float = float(os.getenv("PASSWORD_HASH_TIMEOUT", "10"))
+    # telemetry store: raw chunk length, rollup chunk size and write-behind interval
+    TELEMETRY_CHUNK_SECONDS: float = float(os.getenv("TELEMETRY_CHUNK_SECONDS", "10"))
+    TELEMETRY_CHUNK_MAX_SAMPLES: int = int(os.getenv("TELEMETRY_CHUNK_MAX_SAMPLES", "1000"))
+    TELEMETRY_ROLLUP_CHUNK_ROWS: int = int(os.getenv("TELEMETRY_ROLLUP_CHUNK_ROWS", "600"))
+    TELEMETRY_ROLLUP_FLUSH_S: float = float(os.getenv("TELEMETRY_ROLLUP_FLUSH_S", "300"))
+    TELEMETRY_FLUSH_MS: int = int(os.getenv("TELEMETRY_FLUSH_MS", "1000"))
+    # sealed chunks kept in memory while the database cannot be written (oldest dropped beyond)
+    TELEMETRY_MAX_PENDING_CHUNKS: int = int(os.getenv("TELEMETRY_MAX_PENDING_CHUNKS", "2000"))
+    # drone link: "mock" (simulator) or "mavlink"
+    DRONE_ADAPTER: str = os.getenv("DRONE_ADAPTER", "mock")
+    # udpin:<host>:<port> (vehicles/SITL send to us), udpout:<host>:<port> or serial:<device>:<baud>
+    MAVLINK_URL: str = os.getenv("MAVLINK_URL", "udpin:0.0.0.0:14550")
+    MAVLINK_SYSTEM_ID: int = int(os.getenv("MAVLINK_SYSTEM_ID", "255"))
+    MAVLINK_POSITION_HZ: float = float(os.getenv("MAVLINK_POSITION_HZ", "10"))
+    MAVLINK_STATUS_HZ: float = float(os.getenv("MAVLINK_STATUS_HZ", "1"))
+    MAVLINK_VEHICLE_TIMEOUT: float = float(os.getenv("MAVLINK_VEHICLE_TIMEOUT", "30"))
+    MAVLINK_DEFAULT_ALT: float = float(os.getenv("MAVLINK_DEFAULT_ALT", "30"))
+    # operator command queue: per-attempt ACK timeout, attempts, queue bound and result history
+    COMMAND_ACK_TIMEOUT: float = float(os.getenv("COMMAND_ACK_TIMEOUT", "1.5"))
+    COMMAND_RETRIES: int = int(os.getenv("COMMAND_RETRIES", "3"))
+    COMMAND_QUEUE_SIZE: int = int(os.getenv("COMMAND_QUEUE_SIZE", "32"))
+    COMMAND_HISTORY: int = int(os.getenv("COMMAND_HISTORY", "1000"))
+    COMMAND_WAIT_MAX: float = float(os.getenv("COMMAND_WAIT_MAX", "30"))
+    # shared state between uvicorn workers: local (single process), unix:///path/to.sock or redis://host:port/db
+    BROKER_URL: str = os.getenv("BROKER_URL", "local")
+    BROKER_TIMEOUT: float = float(os.getenv("BROKER_TIMEOUT", "5"))
+    BROKER_LEASE_TTL: float = float(os.getenv("BROKER_LEASE_TTL", "10"))
+    # uvicorn workers on this host (uvicorn reads the same variable when --workers is not given);
+    # the host-wide detector budgets below are split across them
+    WEB_CONCURRENCY: int = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+    # onboard detection: "none" (off), "mock" (no model, for tests/benchmarks) or "onnx" (DETECTOR_MODEL)
+    # every uvicorn worker runs its own engine: DETECTOR_WORKERS processes and
+    # DETECTOR_MAX_BATCH * (DETECTOR_WORKERS + 1) frame slots of DETECTOR_FRAME_MAX_BYTES in shared
+    # memory, by default 8 * 2 * 6.2 MB = 100 MB per uvicorn worker. DETECTOR_HOST_SLOTS caps the
+    # slots of all workers together (0 = no cap); fewer slots than that also means smaller batches.
+    DETECTOR_BACKEND: str = os.getenv("DETECTOR_BACKEND", "none")
+    DETECTOR_MODEL: str = os.getenv("DETECTOR_MODEL", "")
+    DETECTOR_LABELS: str = os.getenv("DETECTOR_LABELS", "plastic")  # comma separated, in class id order
+    DETECTOR_INPUT_SIZE: int = int(os.getenv("DETECTOR_INPUT_SIZE", "640"))
+    DETECTOR_WORKERS: int = int(os.getenv("DETECTOR_WORKERS", "1"))
+    # per detector process; by default the cores are shared among the uvicorn workers
+    DETECTOR_THREADS: int = int(os.getenv("DETECTOR_THREADS", str(max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY))))
+    DETECTOR_MAX_BATCH: int = int(os.getenv("DETECTOR_MAX_BATCH", "8"))
+    DETECTOR_MAX_LATENCY_MS: float = float(os.getenv("DETECTOR_MAX_LATENCY_MS", "15"))
+    DETECTOR_SCORE: float = float(os.getenv("DETECTOR_SCORE", "0.35"))
+    DETECTOR_IOU: float = float(os.getenv("DETECTOR_IOU", "0.45"))
+    DETECTOR_FRAME_MAX_BYTES: int = int(os.getenv("DETECTOR_FRAME_MAX_BYTES", str(1920 * 1080 * 3)))
+    DETECTOR_HOST_SLOTS: int = int(os.getenv("DETECTOR_HOST_SLOTS", "0"))
+    DETECTOR_SUBMIT_TIMEOUT: float = float(os.getenv("DETECTOR_SUBMIT_TIMEOUT", "2"))
+    # geofences: optional GeoJSON FeatureCollection loaded at startup next to the zones stored via the API
+    GEOFENCE_FILE: str = os.getenv("GEOFENCE_FILE", "")
+    # frame ingestion: window for the reported ingest fps; streams close this long after the last frame
+    FRAME_FPS_WINDOW_S: float = float(os.getenv("FRAME_FPS_WINDOW_S", "5"))
+    FRAME_IDLE_TIMEOUT_S: float = float(os.getenv("FRAME_IDLE_TIMEOUT_S", "30"))
 
 settings = Settings()
 
@@ -1,16 +1,28 @@
 # edge_server/database/crud.py
+from datetime import datetime
+from math import asin, cos, degrees, radians, sin
+from typing import List, Optional, Sequence
+import numpy as np
+from sqlalchemy import bindparam
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
 from edge_server.database import models, schemas
+from edge_server.utils import geo
 from edge_server.utils.security import get_password_hash
 
 # User
-def create_user(db: Session, user_in: schemas.UserCreate):
-    user = models.User(email=user_in.email, hashed_password=get_password_hash(user_in.password))
+def create_user(db: Session, user_in: schemas.UserCreate, hashed_password: Optional[str] = None):
+    # hashed_password lets async callers hash outside the request thread
+    user = models.User(email=user_in.email, hashed_password=hashed_password or get_password_hash(user_in.password))
     db.add(user)
     db.commit()
     db.refresh(user)
     return user
 
+def update_user_password_hash(db: Session, user: models.User, hashed_password: str):
+    user.hashed_password = hashed_password
+    db.commit()
+
 def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
 
@@ -25,10 +37,23 @@ def create_journey(db: Session, user_id: int, journey_in: schemas.JourneyCreate)
     for i, wp in enumerate(journey_in.points):
         waypoint = models.Waypoint(seq=wp.seq, lat=wp.lat, lon=wp.lon, alt=wp.alt, journey_id=journey.id)
         db.add(waypoint)
+    bump_journey_version(db, user_id)
     db.commit()
     db.refresh(journey)
     return journey
 
+def get_journey_version(db: Session, user_id: int) -> int:
+    row = db.query(models.JourneyVersion.version).filter(models.JourneyVersion.owner_id == user_id).first()
+    return row[0] if row else 0
+
+def bump_journey_version(db: Session, user_id: int):
+    """Call inside the transaction that changes the user's journeys (the caller commits)."""
+    # one upsert, so concurrent first writes of a user cannot both INSERT
+    t = models.JourneyVersion.__table__
+    insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    db.execute(insert(t).values(owner_id=user_id, version=1).on_conflict_do_update(
+        index_elements=[t.c.owner_id], set_={"version": t.c.version + 1}))
+
 def get_journeys(db: Session, user_id: int):
     return db.query(models.Journey).filter(models.Journey.owner_id == user_id).all()
 
@@ -46,10 +71,111 @@ def create_mission(db: Session, mission_in: schemas.MissionCreate):
 def get_mission(db: Session, mission_id: int):
     return db.query(models.Mission).get(mission_id)
 
+def set_mission_status(db: Session, mission_id: int, status: str):
+    db.query(models.Mission).filter(models.Mission.id == mission_id).update({models.Mission.status: status})
+    db.commit()
+
+def get_mission_waypoints(db: Session, mission_id: int):
+    """(lat, lon, alt) of the mission's journey in flight order."""
+    return db.query(models.Waypoint.lat, models.Waypoint.lon, models.Waypoint.alt).join(
+        models.Mission, models.Mission.journey_id == models.Waypoint.journey_id
+    ).filter(models.Mission.id == mission_id).order_by(models.Waypoint.seq).all()
+
+# Geofence
+def create_geofences(db: Session, rows: List[dict]) -> List[int]:
+    zones = [models.Geofence(**row) for row in rows]
+    db.add_all(zones)
+    db.commit()
+    return [z.id for z in zones]
+
+def get_geofences(db: Session):
+    return db.query(models.Geofence).order_by(models.Geofence.id).all()
+
+def delete_geofence(db: Session, zone_id: int) -> bool:
+    deleted = db.query(models.Geofence).filter(models.Geofence.id == zone_id).delete()
+    db.commit()
+    return bool(deleted)
+
 # Detection
-def create_detection(db: Session, det_in: schemas.DetectionCreate):
-    det = models.Detection(**det_in.dict())
-    db.add(det)
+def get_detection_by_track_key(db: Session, track_key: int):
+    return db.query(models.Detection).filter(models.Detection.track_key == track_key).first()
+
+def create_detections(db: Session, rows: List[dict], merges: Sequence[dict] = ()):
+    # one executemany in a single transaction instead of a commit per row;
+    # merges: {track_key, lat, lon, hits, score, last_seen} for objects stored earlier
+    if not rows and not merges:
+        return 0
+    if rows:
+        db.execute(models.Detection.__table__.insert(), rows)
+    if merges:
+        t = models.Detection.__table__
+        cols = ("lat", "lon", "hits", "score", "last_seen")
+        # bind names must differ from the column names in an executemany UPDATE
+        db.execute(
+            t.update().where(t.c.track_key == bindparam("m_track_key")).values(
+                **{c: bindparam(f"m_{c}") for c in cols}),
+            [{f"m_{c}": m[c] for c in ("track_key",) + cols} for m in merges],
+        )
     db.commit()
-    db.refresh(det)
-    return det
+    return len(rows)
+
+def _detections_in_bbox_query(db: Session, min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                              mission_id: Optional[int] = None, label: Optional[str] = None):
+    q = db.query(models.Detection)
+    if db.get_bind().dialect.name == "sqlite":
+        # R*Tree range scan for the candidates; it stores float32 boxes, so the exact
+        # comparison on Detection.lat/lon below is still needed
+        rt = models.detections_rtree.c
+        q = q.join(models.detections_rtree, rt.id == models.Detection.id).filter(
+            rt.max_lat >= min_lat, rt.min_lat <= max_lat,
+            rt.max_lon >= min_lon, rt.min_lon <= max_lon,
+        )
+    q = q.filter(
+        models.Detection.lat.between(min_lat, max_lat),
+        models.Detection.lon.between(min_lon, max_lon),
+    )
+    if mission_id is not None:
+        q = q.filter(models.Detection.mission_id == mission_id)
+    if label is not None:
+        q = q.filter(models.Detection.label == label)
+    return q
+
+def get_detections_in_bbox(db: Session, min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                           mission_id: Optional[int] = None, label: Optional[str] = None, limit: int = 1000):
+    q = _detections_in_bbox_query(db, min_lat, min_lon, max_lat, max_lon, mission_id, label)
+    return q.order_by(models.Detection.id).limit(limit).all()
+
+BOX_SLACK_DEG = 1e-7
+
+def get_detections_near(db: Session, lat: float, lon: float, radius_m: float,
+                        mission_id: Optional[int] = None, label: Optional[str] = None, limit: int = 1000):
+    """Detections within radius_m of (lat, lon) as (detection, distance_m) pairs, nearest first."""
+    # box around the circle on the same sphere as the exact filter below; the widest longitude
+    # offset is reached poleward of lat, hence asin rather than a plain division by cos(lat).
+    # BOX_SLACK_DEG absorbs rounding so points on the circle itself stay candidates
+    d = radius_m / geo.EARTH_RADIUS_M
+    dlat = degrees(d) + BOX_SLACK_DEG
+    c = cos(radians(lat))
+    dlon = 180.0 if sin(d) >= c else degrees(asin(sin(d) / c)) + BOX_SLACK_DEG
+    candidates = _detections_in_bbox_query(db, lat - dlat, lon - dlon, lat + dlat, lon + dlon, mission_id, label).all()
+    if not candidates:
+        return []
+    dist = geo.haversine(lat, lon,
+                         np.fromiter((d.lat for d in candidates), dtype=np.float64, count=len(candidates)),
+                         np.fromiter((d.lon for d in candidates), dtype=np.float64, count=len(candidates)))
+    inside = np.flatnonzero(dist <= radius_m)
+    order = inside[np.argsort(dist[inside], kind="stable")][:limit]
+    return [(candidates[i], float(dist[i])) for i in order]
+
+def get_detection_points(db: Session, mission_id: Optional[int] = None,
+                         since: Optional[datetime] = None, until: Optional[datetime] = None):
+    """lat, lon, score as NumPy arrays (score NaN where missing), without ORM objects."""
+    q = db.query(models.Detection.lat, models.Detection.lon, models.Detection.score)
+    if mission_id is not None:
+        q = q.filter(models.Detection.mission_id == mission_id)
+    if since is not None:
+        q = q.filter(models.Detection.created_at >= since)
+    if until is not None:
+        q = q.filter(models.Detection.created_at < until)
+    pts = np.array(q.all(), dtype=np.float64).reshape(-1, 3)
+    return pts[:, 0], pts[:, 1], pts[:, 2]
@@ -1,16 +1,81 @@
 # edge_server/database/db.py
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
+from edge_server.config import settings
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./airchif.db"
+SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+
+def is_sqlite(url) -> bool:
+    return make_url(str(url)).get_backend_name() == "sqlite"
+
+
+def _sqlite_pragmas(read_only: bool = False):
+    def on_connect(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        # WAL lets map reads run while the detection/telemetry writers commit
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=NORMAL")
+        cur.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}")
+        cur.execute(f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}")
+        cur.execute("PRAGMA temp_store=MEMORY")
+        if read_only:
+            cur.execute("PRAGMA query_only=ON")
+        cur.close()
+    return on_connect
+
+
+def _engine_kwargs(url, read_only: bool = False) -> dict:
+    u = make_url(str(url))
+    pool = {
+        "pool_size": settings.DB_READ_POOL_SIZE if read_only else settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+    }
+    if u.get_backend_name() == "sqlite":
+        kwargs = {"connect_args": {"check_same_thread": False}}
+        if u.database not in (None, "", ":memory:"):
+            kwargs.update(pool)
+        return kwargs
+    kwargs = dict(pool, pool_pre_ping=True)
+    if read_only and u.get_backend_name() == "postgresql":
+        kwargs["connect_args"] = {"options": "-c default_transaction_read_only=on"}
+    return kwargs
+
+
+def _install_pragmas(engine, read_only: bool = False):
+    if is_sqlite(engine.url):
+        event.listen(engine, "connect", _sqlite_pragmas(read_only))
+
+
+# Write engine: background writers, init_db and the endpoints that change data.
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **_engine_kwargs(SQLALCHEMY_DATABASE_URL))
+_install_pragmas(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Read-only pool for query endpoints (DATABASE_READ_URL may point at a replica; defaults to the
+# primary database). Its sessions are used from the threadpool, so query, row hydration and
+# serialization all stay off the event loop.
+_read_url = settings.DATABASE_READ_URL or SQLALCHEMY_DATABASE_URL
+read_engine = create_engine(_read_url, **_engine_kwargs(_read_url, read_only=True))
+_install_pragmas(read_engine, read_only=True)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def dispose_engines():
+    read_engine.dispose()
+    engine.dispose()
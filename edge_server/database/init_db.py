@@ -1,2 +1,75 @@
-# edge_server/database/__init__.py
-# leer
+# edge_server/database/init_db.py
+import time
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from edge_server.database.db import Base, engine
+from edge_server.database import models  # noqa: F401  (registers the tables)
+
+DETECTIONS_RTREE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS detections_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon)",
+    """CREATE TRIGGER IF NOT EXISTS detections_rtree_ai AFTER INSERT ON detections BEGIN
+        INSERT INTO detections_rtree VALUES (new.id, new.lat, new.lat, new.lon, new.lon);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS detections_rtree_au AFTER UPDATE OF lat, lon ON detections BEGIN
+        UPDATE detections_rtree SET min_lat = new.lat, max_lat = new.lat, min_lon = new.lon, max_lon = new.lon
+        WHERE id = new.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS detections_rtree_ad AFTER DELETE ON detections BEGIN
+        DELETE FROM detections_rtree WHERE id = old.id;
+    END""",
+]
+
+
+def install_detection_rtree(bind: Engine):
+    with bind.begin() as conn:
+        is_new = not inspect(conn).has_table("detections_rtree")
+        for ddl in DETECTIONS_RTREE_DDL:
+            conn.execute(text(ddl))
+        if is_new:
+            # index detections that existed before the R*Tree
+            conn.execute(text("INSERT INTO detections_rtree SELECT id, lat, lat, lon, lon FROM detections"))
+
+
+def ensure_indexes(bind: Engine):
+    # create_all() only creates indexes together with new tables
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+
+
+def ensure_columns(bind: Engine):
+    # create_all() does not touch existing tables; add columns introduced since (nullable or with a server default)
+    with bind.begin() as conn:
+        insp = inspect(conn)
+        for table in Base.metadata.sorted_tables:
+            if not insp.has_table(table.name):
+                continue
+            existing = {c["name"] for c in insp.get_columns(table.name)}
+            for col in table.columns:
+                if col.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {col.name} {col.type.compile(bind.dialect)}"
+                if col.server_default is not None:
+                    ddl += f" NOT NULL DEFAULT {col.server_default.arg}"
+                conn.execute(text(ddl))
+
+
+def _create(bind: Engine):
+    Base.metadata.create_all(bind=bind)
+    ensure_columns(bind)
+    ensure_indexes(bind)
+    if bind.dialect.name == "sqlite":
+        install_detection_rtree(bind)
+
+
+def init_db(bind: Engine = engine, attempts: int = 5):
+    # every uvicorn worker runs this on import; when they race, the loser's
+    # "table already exists" is harmless and the next pass finds everything in place
+    for attempt in range(attempts):
+        try:
+            return _create(bind)
+        except (OperationalError, ProgrammingError):
+            if attempt == attempts - 1:
+                raise
+            time.sleep(0.2 * (attempt + 1))
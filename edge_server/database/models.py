@@ -1,5 +1,5 @@
 # edge_server/database/models.py
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Float
+from sqlalchemy import BigInteger, Column, Integer, String, ForeignKey, DateTime, Float, Index, LargeBinary, MetaData, Table, Text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from edge_server.database.db import Base
@@ -20,6 +20,7 @@ class Journey(Base):
     owner_id = Column(Integer, ForeignKey("users.id"))
     owner = relationship("User", back_populates="journeys")
     waypoints = relationship("Waypoint", back_populates="journey", cascade="all, delete-orphan")
+    __table_args__ = (Index("ix_journeys_owner_id", "owner_id", "id"),)
 
 class Waypoint(Base):
     __tablename__ = "waypoints"
@@ -30,6 +31,13 @@ class Waypoint(Base):
     alt = Column(Float, nullable=True)
     journey_id = Column(Integer, ForeignKey("journeys.id"))
     journey = relationship("Journey", back_populates="waypoints")
+    __table_args__ = (Index("ix_waypoints_journey_seq", "journey_id", "seq"),)
+
+class JourneyVersion(Base):
+    # Bumped whenever one of the owner's journeys is created or deleted; drives list ETags.
+    __tablename__ = "journey_versions"
+    owner_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
 
 class Mission(Base):
     __tablename__ = "missions"
@@ -48,4 +56,45 @@ class Detection(Base):
     label = Column(String, nullable=False)
     score = Column(Float, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # de-duplicated object: created_at is the first sighting, score the best one
+    hits = Column(Integer, nullable=False, default=1, server_default="1")
+    last_seen = Column(DateTime, nullable=True)
+    track_key = Column(BigInteger, nullable=True, index=True)
     mission = relationship("Mission")
+    __table_args__ = (Index("ix_detections_mission_created", "mission_id", "created_at"),)
+
+class Geofence(Base):
+    # kind "no_fly" (stay out) or "boundary" (stay in); mission_id NULL applies to every mission.
+    # floor_m / ceiling_m bound the restricted altitude band (NULL = unbounded).
+    __tablename__ = "geofences"
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False)
+    kind = Column(String, nullable=False, default="no_fly")
+    mission_id = Column(Integer, ForeignKey("missions.id"), nullable=True, index=True)
+    floor_m = Column(Float, nullable=True)
+    ceiling_m = Column(Float, nullable=True)
+    geometry = Column(Text, nullable=False)  # GeoJSON Polygon / MultiPolygon
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class TelemetryChunk(Base):
+    # Column-packed float64 samples (layout in services/telemetry_store.py).
+    # resolution 0 = raw samples, otherwise the rollup bucket size in seconds; times are epoch seconds.
+    __tablename__ = "telemetry_chunks"
+    id = Column(Integer, primary_key=True)
+    mission_id = Column(Integer, ForeignKey("missions.id"), nullable=False)
+    resolution = Column(Integer, nullable=False, default=0)
+    t_start = Column(Float, nullable=False)
+    t_end = Column(Float, nullable=False)
+    count = Column(Integer, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+    __table_args__ = (Index("ix_telemetry_chunks_range", "mission_id", "resolution", "t_start"),)
+
+# SQLite R*Tree over detections.lat/lon, kept in sync by triggers (see init_db.py).
+# Separate metadata so create_all() does not try to create it as a normal table.
+rtree_metadata = MetaData()
+detections_rtree = Table(
+    "detections_rtree", rtree_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("min_lat", Float), Column("max_lat", Float),
+    Column("min_lon", Float), Column("max_lon", Float),
+)
@@ -1,6 +1,6 @@
 # edge_server/database/schemas.py
-from pydantic import BaseModel, EmailStr
-from typing import List, Optional
+from pydantic import BaseModel, EmailStr, Field
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 
 # User
@@ -35,6 +35,13 @@ class JourneyCreate(BaseModel):
     description: Optional[str] = None
     points: List[WaypointCreate]
 
+class SimplificationReport(BaseModel):
+    method: str
+    tolerance_m: float
+    original_points: int
+    simplified_points: int
+    max_deviation_m: float
+
 class JourneyOut(BaseModel):
     id: int
     name: str
@@ -42,9 +49,46 @@ class JourneyOut(BaseModel):
     owner_id: int
     created_at: datetime
     waypoints: List[WaypointOut]
+    simplification: Optional[SimplificationReport] = None
     class Config:
         orm_mode = True
 
+class JourneyListItem(BaseModel):
+    # GET /journeys/: waypoints only with ?waypoints=full, count/bbox only with ?waypoints=summary
+    id: int
+    name: str
+    description: Optional[str] = None
+    owner_id: int
+    created_at: datetime
+    waypoints: Optional[List[WaypointOut]] = None
+    waypoint_count: Optional[int] = None
+    bbox: Optional[List[float]] = None
+
+class JourneyPlanRequest(BaseModel):
+    name: str
+    description: Optional[str] = None
+    mode: str = Field("coverage", regex="^(coverage|tour)$")
+    # coverage: GeoJSON Polygon/MultiPolygon (geometry or Feature) to survey
+    polygon: Optional[Dict[str, Any]] = None
+    altitude: float = Field(30.0, gt=0)
+    footprint_width_m: Optional[float] = Field(None, gt=0)  # default: derived from altitude and fov_deg
+    fov_deg: float = Field(60.0, gt=0, lt=180)
+    overlap: float = Field(0.2, ge=0, lt=1)
+    sweep_angle_deg: Optional[float] = None  # compass bearing of the sweep lines
+    # tour: waypoints to reorder, the first one is the start
+    points: Optional[List[WaypointCreate]] = None
+    return_to_start: bool = False
+    time_budget_ms: int = Field(500, ge=10, le=5000)
+
+class JourneyStatsOut(BaseModel):
+    journey_id: int
+    waypoints: int
+    length_m: float
+    max_leg_m: float
+    bbox: Optional[List[float]] = None  # [min_lon, min_lat, max_lon, max_lat]
+    min_alt: Optional[float] = None
+    max_alt: Optional[float] = None
+
 # Mission
 class MissionCreate(BaseModel):
     journey_id: int
@@ -57,6 +101,12 @@ class MissionOut(BaseModel):
     class Config:
         orm_mode = True
 
+class TelemetrySeriesOut(BaseModel):
+    # columnar: "t" is epoch seconds (raw sample time or bucket start), NaN/missing values are null
+    mission_id: int
+    resolution_s: int
+    columns: Dict[str, List[Optional[float]]]
+
 # Detection
 class DetectionCreate(BaseModel):
     mission_id: int
@@ -68,5 +118,35 @@ class DetectionCreate(BaseModel):
 class DetectionOut(DetectionCreate):
     id: int
     created_at: datetime
+    hits: int = 1
+    last_seen: Optional[datetime] = None
     class Config:
         orm_mode = True
+
+class DetectionBatchOut(BaseModel):
+    accepted: int
+
+class DetectionNearOut(DetectionOut):
+    distance_m: float
+
+class TileBin(BaseModel):
+    x: int
+    y: int
+    count: int
+    mean_score: Optional[float] = None
+
+class DetectionTilesOut(BaseModel):
+    z: int
+    mission_id: Optional[int] = None
+    tiles: List[TileBin]
+
+class GridBin(BaseModel):
+    lat: float
+    lon: float
+    count: int
+    mean_score: Optional[float] = None
+
+class DetectionGridOut(BaseModel):
+    cell_m: float
+    mission_id: Optional[int] = None
+    cells: List[GridBin]
@@ -1,26 +1,32 @@
 # edge_server/drone/adapter.py
 import asyncio
 import random
+import time
 from datetime import datetime
 from typing import Dict, Optional
+from edge_server.config import settings
 from edge_server.utils.logger import logger
-from edge_server.database.db import SessionLocal
-from edge_server.database import crud
+from edge_server.services.detection_writer import detection_writer
+from edge_server.services.telemetry_hub import telemetry_hub
+from edge_server.drone.telemetry import end_telemetry, publish_telemetry
 
-# This module provides a mock adapter that simulates a MAVLink drone.
-# Later you can implement a real pymavlink adapter here and keep the same interface.
+# This module provides a mock adapter that simulates a MAVLink drone. The real MAVLink
+# adapter (drone/mav_control.py) keeps the same interface; DRONE_ADAPTER selects one.
 
 class MockMavAdapter:
+    # every worker can simulate its own missions
+    exclusive_link = False
+
     def __init__(self):
         self._tasks: Dict[int, asyncio.Task] = {}
 
     async def _run_sim(self, mission_id: int):
         logger.info("MockMavAdapter: starting simulation for mission %s", mission_id)
-        db = SessionLocal()
         try:
             for i in range(60):  # simulate 60 steps (~60 seconds)
                 lat = 48.2 + random.uniform(-0.001, 0.001)
                 lon = 16.37 + random.uniform(-0.001, 0.001)
+                now = time.time()
                 telemetry = {
                     "type": "telemetry",
                     "mission_id": mission_id,
@@ -28,38 +34,29 @@ class MockMavAdapter:
                     "lon": lon,
                     "alt": 10 + random.uniform(-1,1),
                     "battery": random.randint(50, 100),
-                    "timestamp": datetime.utcnow().isoformat()
+                    "timestamp": datetime.utcfromtimestamp(now).isoformat()
                 }
-                # If you want to propagate telemetry over WebSocket, import manager from endpoints.missions
-                try:
-                    from edge_server.api.endpoints.missions import manager
-                    await manager.broadcast(mission_id, telemetry)
-                except Exception:
-                    pass
+                publish_telemetry(mission_id, telemetry, t=now)
 
                 # occasionally create detection
                 if random.random() < 0.1:
-                    detection_payload = type("D", (), {
+                    det = {
                         "mission_id": mission_id,
                         "lat": lat,
                         "lon": lon,
                         "label": "plastic",
-                        "score": round(random.uniform(0.7, 0.98), 3)
-                    })()
-                    # use crud.add_detection wrapper
-                    det = crud.add_detection(db, detection_payload)
-                    try:
-                        from edge_server.api.endpoints.missions import manager
-                        await manager.broadcast(mission_id, {
-                            "type": "detection",
-                            "lat": det.lat,
-                            "lon": det.lon,
-                            "label": det.label,
-                            "score": det.score,
-                            "timestamp": str(det.timestamp)
-                        })
-                    except Exception:
-                        pass
+                        "score": round(random.uniform(0.7, 0.98), 3),
+                        "created_at": datetime.utcnow()
+                    }
+                    await detection_writer.submit([det])
+                    telemetry_hub.publish(mission_id, {
+                        "type": "detection",
+                        "lat": det["lat"],
+                        "lon": det["lon"],
+                        "label": det["label"],
+                        "score": det["score"],
+                        "timestamp": det["created_at"].isoformat()
+                    })
 
                 await asyncio.sleep(1)
         except asyncio.CancelledError:
@@ -67,11 +64,11 @@ class MockMavAdapter:
         except Exception as e:
             logger.exception("MockMavAdapter: error for mission %s: %s", mission_id, e)
         finally:
-            db.close()
+            end_telemetry(mission_id)
             logger.info("MockMavAdapter: finished mission %s", mission_id)
 
     def start(self, mission_id: int):
-        if mission_id in self._tasks:
+        if self.running(mission_id):
             logger.info("MockMavAdapter: mission %s already running", mission_id)
             return
         loop = asyncio.get_event_loop()
@@ -83,16 +80,47 @@ class MockMavAdapter:
         if t:
             t.cancel()
 
+    def running(self, mission_id: int) -> bool:
+        t = self._tasks.get(mission_id)
+        return t is not None and not t.done()
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        for mission_id in list(self._tasks):
+            self.stop(mission_id)
+
     def send_command(self, mission_id: int, command: str, params=None):
         logger.info("MockMavAdapter: received command for mission %s: %s %s", mission_id, command, params)
         # simple stub: we can react to "rtl", "land", etc.
         if command == "land":
             self.stop(mission_id)
 
+    async def execute(self, mission_id: int, command: str, params=None, timeout: float = 1.5, attempt: int = 0) -> int:
+        # the simulator accepts everything immediately (MAV_RESULT_ACCEPTED)
+        self.send_command(mission_id, command, params)
+        return 0
+
 # Manager singleton
+def make_adapter(kind: str = settings.DRONE_ADAPTER):
+    if kind == "mock":
+        return MockMavAdapter()
+    if kind == "mavlink":
+        from edge_server.drone.mav_control import MavlinkAdapter
+        return MavlinkAdapter(settings.MAVLINK_URL)
+    raise ValueError(f"unknown DRONE_ADAPTER {kind!r}, expected 'mock' or 'mavlink'")
+
+
 class DroneManager:
     def __init__(self):
-        self.adapter = MockMavAdapter()
+        self.adapter = make_adapter()
+
+    async def open(self):
+        await self.adapter.open()
+
+    async def close(self):
+        await self.adapter.close()
 
     def start_mission(self, mission_id: int):
         self.adapter.start(mission_id)
@@ -100,7 +128,18 @@ class DroneManager:
     def stop_mission(self, mission_id: int):
         self.adapter.stop(mission_id)
 
+    def running(self, mission_id: int) -> bool:
+        return self.adapter.running(mission_id)
+
+    @property
+    def exclusive_link(self) -> bool:
+        """True when only one process can talk to the vehicles (e.g. one UDP port)."""
+        return self.adapter.exclusive_link
+
     def send_command(self, mission_id: int, command: str, params=None):
         self.adapter.send_command(mission_id, command, params=params)
 
+    async def execute(self, mission_id: int, command: str, params=None, timeout: float = 1.5, attempt: int = 0) -> int:
+        return await self.adapter.execute(mission_id, command, params, timeout=timeout, attempt=attempt)
+
 drone_manager_singleton = DroneManager()
@@ -0,0 +1,318 @@
+# edge_server/drone/journey_planner.py
+# Coverage-path generation and waypoint ordering. All geometry is done in a
+# local ENU plane (utils.geo.LocalENU), which is exact enough at mission scale.
+import math
+import time
+from collections import deque
+from typing import Optional, Tuple
+
+import numpy as np
+
+from edge_server.utils.geo import LocalENU
+
+
+class PlanningError(ValueError):
+    pass
+
+
+def polygon_rings(geojson: dict):
+    """Rings ([lon, lat] lists) of a GeoJSON Polygon, MultiPolygon or a Feature holding one."""
+    if geojson.get("type") == "Feature":
+        geojson = geojson.get("geometry") or {}
+    kind = geojson.get("type")
+    coords = geojson.get("coordinates") or []
+    if kind == "Polygon":
+        rings = coords
+    elif kind == "MultiPolygon":
+        rings = [ring for poly in coords for ring in poly]
+    else:
+        raise PlanningError(f"Expected a Polygon or MultiPolygon, got {kind!r}")
+    rings = [np.asarray(r, dtype=np.float64)[:, :2] for r in rings if len(r) >= 3]
+    if not rings:
+        raise PlanningError("Polygon has no ring with at least 3 points")
+    return rings
+
+
+def footprint_width(altitude_m: float, fov_deg: float) -> float:
+    return 2.0 * altitude_m * math.tan(math.radians(fov_deg) / 2.0)
+
+
+def coverage_path(polygon: dict, line_spacing_m: float, sweep_angle_deg: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Lawnmower (boustrophedon) path over a polygon. Sweep lines run along sweep_angle_deg
+    (compass bearing; default: the longest edge of the outer ring) and are line_spacing_m apart.
+    Holes are respected because each sweep line is clipped with the even-odd rule.
+    Returns lat, lon arrays of the turn points.
+    """
+    if line_spacing_m <= 0:
+        raise PlanningError("line spacing must be positive")
+    rings = polygon_rings(polygon)
+    outer = rings[0]
+    enu = LocalENU.around(outer[:, 1], outer[:, 0])
+    rings_xy = [np.column_stack(enu.forward(r[:, 1], r[:, 0])) for r in rings]
+
+    if sweep_angle_deg is None:
+        ox = rings_xy[0]
+        d = np.diff(np.vstack([ox, ox[:1]]), axis=0)
+        k = int(np.argmax(np.hypot(d[:, 0], d[:, 1])))
+        theta = math.atan2(d[k, 1], d[k, 0])
+    else:
+        # compass bearing -> math angle in the ENU plane
+        theta = math.radians(90.0 - sweep_angle_deg)
+
+    # rotate so that sweep lines are horizontal
+    c, s = math.cos(-theta), math.sin(-theta)
+    rot = np.array([[c, -s], [s, c]])
+    edges = []
+    for xy in rings_xy:
+        r = xy @ rot.T
+        edges.append(np.column_stack([r, np.roll(r, -1, axis=0)]))
+    edges = np.vstack(edges)  # x1, y1, x2, y2
+    x1, y1, x2, y2 = edges.T
+
+    ymin, ymax = min(y1.min(), y2.min()), max(y1.max(), y2.max())
+    ys = np.arange(ymin + line_spacing_m / 2.0, ymax, line_spacing_m)
+    if len(ys) == 0:
+        ys = np.array([(ymin + ymax) / 2.0])
+
+    # intersections of every sweep line with every edge at once (half-open rule avoids double vertices)
+    Y = ys[:, None]
+    crosses = ((y1 <= Y) & (Y < y2)) | ((y2 <= Y) & (Y < y1))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        X = np.where(crosses, x1 + (Y - y1) * (x2 - x1) / (y2 - y1), np.nan)
+    X.sort(axis=1)  # NaNs go last
+
+    pts = []
+    forward = True
+    for row, y in zip(X, ys):
+        xs = row[~np.isnan(row)]
+        if len(xs) < 2:
+            continue
+        segs = xs[: len(xs) // 2 * 2].reshape(-1, 2)
+        if not forward:
+            segs = segs[::-1, ::-1]
+        for a, b in segs:
+            pts.append((a, y))
+            pts.append((b, y))
+        forward = not forward
+    if not pts:
+        raise PlanningError("Polygon is too small for the requested line spacing")
+
+    xy = np.asarray(pts) @ rot  # rotate back
+    lat, lon = enu.inverse(xy[:, 0], xy[:, 1])
+    return lat, lon
+
+
+def _neighbours(xy: np.ndarray, k: int, cap: int = 8) -> np.ndarray:
+    """
+    Approximate k nearest neighbours of every point from a uniform grid (about two points
+    per cell, at most `cap` kept per cell, 5 x 5 cells searched), so no n x n matrix is built.
+    Slots without a candidate are filled with the point itself and skipped by the callers.
+    """
+    n = len(xy)
+    k = min(k, n - 1)
+    lo = xy.min(axis=0)
+    span = np.maximum(xy.max(axis=0) - lo, 1e-9)
+    cell = max(float(np.sqrt(span[0] * span[1] * 2.0 / n)), float(span.max()) / 4096, 1e-9)
+    nx, ny = int(span[0] // cell) + 1, int(span[1] // cell) + 1
+    cx = ((xy[:, 0] - lo[0]) // cell).astype(np.int64)
+    cy = ((xy[:, 1] - lo[1]) // cell).astype(np.int64)
+    cid = cx * ny + cy
+    order = np.argsort(cid, kind="stable")
+    first = np.searchsorted(cid[order], cid[order], side="left")
+    slot = np.arange(n) - first
+    keep = slot < cap
+    table = np.full((nx * ny, cap), -1, dtype=np.int64)
+    table[cid[order][keep], slot[keep]] = order[keep]
+
+    offs = np.arange(-2, 3)
+    ox, oy = np.meshgrid(offs, offs, indexing="ij")
+    ncx = cx[:, None] + ox.reshape(1, -1)
+    ncy = cy[:, None] + oy.reshape(1, -1)
+    valid = (ncx >= 0) & (ncx < nx) & (ncy >= 0) & (ncy < ny)
+    cand = table[np.where(valid, ncx * ny + ncy, 0)].reshape(n, -1)
+    cand[np.repeat(~valid, cap, axis=1)] = -1
+    d = ((xy[np.maximum(cand, 0)] - xy[:, None, :]) ** 2).sum(axis=2)
+    d[(cand < 0) | (cand == np.arange(n)[:, None])] = np.inf
+    if d.shape[1] <= k:
+        idx = np.argsort(d, axis=1)
+    else:
+        idx = np.argpartition(d, k - 1, axis=1)[:, :k]
+        idx = np.take_along_axis(idx, np.take_along_axis(d, idx, axis=1).argsort(axis=1), axis=1)
+    out = np.take_along_axis(cand, idx, axis=1)
+    dist = np.take_along_axis(d, idx, axis=1)
+    return np.where(np.isinf(dist), np.arange(n)[:, None], out)
+
+
+def _nearest_neighbour_tour(xy: np.ndarray, start: int, nbrs: np.ndarray) -> np.ndarray:
+    """Greedy nearest-neighbour tour; uses the neighbour lists and scans all points only when they are exhausted."""
+    n = len(xy)
+    x, y = xy[:, 0], xy[:, 1]
+    tour = np.empty(n, dtype=np.int64)
+    visited = np.zeros(n, dtype=bool)
+    unvisited = np.arange(n)
+    nb = nbrs.tolist()
+    cur = start
+    for i in range(n):
+        tour[i] = cur
+        visited[cur] = True
+        if i == n - 1:
+            break
+        nxt = -1
+        for c in nb[cur]:
+            if not visited[c]:
+                nxt = c
+                break
+        if nxt < 0:
+            unvisited = unvisited[~visited[unvisited]]
+            d = (x[unvisited] - x[cur]) ** 2 + (y[unvisited] - y[cur]) ** 2
+            nxt = int(unvisited[int(np.argmin(d))])
+        cur = nxt
+    return tour
+
+
+class _Route:
+    """Tour under local search. For closed tours the start node is repeated at the end."""
+
+    def __init__(self, xy: np.ndarray, tour: np.ndarray, closed: bool):
+        self.x, self.y = xy[:, 0].copy(), xy[:, 1].copy()
+        self.xl, self.yl = self.x.tolist(), self.y.tolist()
+        self.closed = closed
+        self.route = np.append(tour, tour[0]) if closed else tour.copy()
+        self.m = len(self.route) - 1  # number of edges
+        self.pos = np.empty(len(xy), dtype=np.int64)
+        self.pos[tour] = np.arange(len(tour))
+
+    def d(self, a, b):
+        x, y = self.x, self.y
+        return np.hypot(x[a] - x[b], y[a] - y[b])
+
+    def ds(self, a, b) -> float:
+        """Scalar distance, much cheaper than d() for single nodes."""
+        return math.hypot(self.xl[a] - self.xl[b], self.yl[a] - self.yl[b])
+
+    def reverse(self, i: int, j: int):
+        """Reverse route[i..j] (inclusive)."""
+        self.route[i:j + 1] = self.route[i:j + 1][::-1].copy()
+        self.pos[self.route[i:j + 1]] = np.arange(i, j + 1)
+
+    def move(self, s: int, e: int, cp: int, flipped: bool):
+        """Move route[s..e] between route[cp] and route[cp + 1]."""
+        route = self.route
+        seg = route[s:e + 1][::-1] if flipped else route[s:e + 1]
+        rest = np.concatenate([route[:s], route[e + 1:]])
+        at = cp + 1 if cp < s else cp + 1 - (e - s + 1)
+        self.route = np.concatenate([rest[:at], seg, rest[at:]])
+        lo, hi = min(s, at), max(e, at + e - s)
+        self.pos[self.route[lo:hi + 1]] = np.arange(lo, hi + 1)
+
+
+def _try_two_opt(rt: _Route, nbrs: np.ndarray, a: int):
+    """Best improving 2-opt move on the edge leaving a; returns the touched nodes or None."""
+    i = int(rt.pos[a])
+    if i >= rt.m:
+        return None
+    route, m = rt.route, rt.m
+    b = int(route[i + 1])
+    d_ab = rt.ds(a, b)
+    j = rt.pos[nbrs[a]]
+    # neighbour c after b: reverse route[i+1..j], new edges (a, c) and (b, route[j+1]);
+    # on an open path c may be the last node, then the tail is simply reversed
+    jf = j[j > i + 1]
+    if len(jf):
+        c = route[jf]
+        has_next = jf < m
+        dn = route[np.minimum(jf + 1, m)]
+        gain = d_ab - rt.d(a, c) + np.where(has_next, rt.d(c, dn) - rt.d(b, dn), 0.0)
+        k = int(np.argmax(gain))
+        if gain[k] > 1e-9:
+            touched = (a, b, route[jf[k]], dn[k])
+            rt.reverse(i + 1, int(jf[k]))
+            return touched
+    # neighbour c before a: reverse route[j+1..i], new edges (c, a) and (route[j+1], b)
+    jb = j[j < i - 1]
+    if len(jb):
+        c = route[jb]
+        cn = route[jb + 1]
+        gain = rt.d(c, cn) + d_ab - rt.d(c, a) - rt.d(cn, b)
+        k = int(np.argmax(gain))
+        if gain[k] > 1e-9:
+            touched = (a, b, c[k], cn[k])
+            rt.reverse(int(jb[k]) + 1, i)
+            return touched
+    return None
+
+
+def _try_or_opt(rt: _Route, nbrs: np.ndarray, a: int, max_len: int = 3):
+    """Move the segment of 1..max_len nodes starting at a next to a neighbour (either orientation)."""
+    s = int(rt.pos[a])
+    last = rt.m - 1 if rt.closed else rt.m  # the start node (and its closing copy) never move
+    if s < 1:
+        return None
+    route = rt.route
+    for seg_len in range(1, max_len + 1):
+        e = s + seg_len - 1
+        if e > last:
+            break
+        p, s0, e0 = int(route[s - 1]), int(route[s]), int(route[e])
+        has_q = e < rt.m
+        q = int(route[e + 1]) if has_q else None
+        removed = rt.ds(p, s0) + (rt.ds(e0, q) - rt.ds(p, q) if has_q else 0.0)
+        cpos = rt.pos[np.concatenate([nbrs[s0], nbrs[e0]])]
+        # insert between route[cp] and route[cp+1], outside the segment and not where it already is
+        cp = cpos[((cpos < s - 1) | (cpos > e)) & (cpos < rt.m)]
+        if not len(cp):
+            continue
+        c, cn = route[cp], route[cp + 1]
+        base = rt.d(c, cn)
+        keep = rt.d(c, s0) + rt.d(e0, cn) - base
+        flip = rt.d(c, e0) + rt.d(s0, cn) - base
+        gain = removed - np.minimum(keep, flip)
+        k = int(np.argmax(gain))
+        if gain[k] > 1e-9:
+            touched = (p, s0, e0, c[k], cn[k]) + ((q,) if has_q else ())
+            rt.move(s, e, int(cp[k]), bool(flip[k] < keep[k]))
+            return touched
+    return None
+
+
+def optimize_order(lat, lon, start_index: int = 0, return_to_start: bool = False,
+                   time_budget_s: float = 0.5, neighbours: int = 10) -> np.ndarray:
+    """
+    Visiting order for a set of waypoints that approximately minimizes flight distance.
+    Nearest-neighbour construction followed by 2-opt and Or-opt local search restricted to
+    each point's nearest neighbours (with a work queue of nodes whose edges changed),
+    stopped after time_budget_s. The start point stays first.
+    """
+    lat, lon = np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)
+    n = len(lat)
+    if n <= 3:
+        return np.concatenate([[start_index], np.delete(np.arange(n), start_index)]).astype(np.int64)
+    deadline = time.perf_counter() + time_budget_s
+    enu = LocalENU.around(lat, lon)
+    xy = np.column_stack(enu.forward(lat, lon))
+    nbrs = _neighbours(xy, neighbours)
+    rt = _Route(xy, _nearest_neighbour_tour(xy, start_index, nbrs), closed=return_to_start)
+
+    queue = deque(rt.route[:n].tolist())
+    queued = np.ones(n, dtype=bool)
+    while queue and time.perf_counter() < deadline:
+        a = queue.popleft()
+        queued[a] = False
+        touched = _try_two_opt(rt, nbrs, a) or _try_or_opt(rt, nbrs, a)
+        if touched:
+            for t in touched:
+                if not queued[t]:
+                    queued[t] = True
+                    queue.append(int(t))
+    return rt.route[:-1].copy() if return_to_start else rt.route.copy()
+
+
+def route_length(lat, lon, order=None, closed: bool = False) -> float:
+    lat, lon = np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)
+    if order is not None:
+        lat, lon = lat[order], lon[order]
+    if closed:
+        lat, lon = np.append(lat, lat[:1]), np.append(lon, lon[:1])
+    xy = np.column_stack(LocalENU.around(lat, lon).forward(lat, lon))
+    return float(np.hypot(*np.diff(xy, axis=0).T).sum())
@@ -0,0 +1,33 @@
+# edge_server/drone/manual_control.py
+# Operator commands (POST /missions/{id}/command) -> MAVLink COMMAND_LONG parameters.
+from typing import Dict, Optional, Tuple
+
+from edge_server.drone import mavlink
+
+# name -> (MAV_CMD, function building param1..7 from the request params)
+COMMANDS = {
+    "arm": (mavlink.MAV_CMD_COMPONENT_ARM_DISARM, lambda p: (1,)),
+    "disarm": (mavlink.MAV_CMD_COMPONENT_ARM_DISARM, lambda p: (0, 21196 if p.get("force") else 0)),
+    "takeoff": (mavlink.MAV_CMD_NAV_TAKEOFF, lambda p: (0, 0, 0, float("nan"), 0, 0, float(p.get("alt", 10)))),
+    "land": (mavlink.MAV_CMD_NAV_LAND, lambda p: (0, 0, 0, float("nan"), 0, 0, 0)),
+    "rtl": (mavlink.MAV_CMD_NAV_RETURN_TO_LAUNCH, lambda p: ()),
+    "start": (mavlink.MAV_CMD_MISSION_START, lambda p: (0, 0)),
+    "pause": (mavlink.MAV_CMD_DO_PAUSE_CONTINUE, lambda p: (0,)),
+    "continue": (mavlink.MAV_CMD_DO_PAUSE_CONTINUE, lambda p: (1,)),
+    "speed": (mavlink.MAV_CMD_DO_CHANGE_SPEED, lambda p: (1, float(p["speed"]), -1)),
+}
+
+# jump the per-mission command queue and preempt whatever is queued or waiting for an ACK
+EMERGENCY_COMMANDS = {"land", "rtl"}
+
+
+def command_long(command: str, params: Optional[Dict] = None) -> Tuple[int, Tuple[float, ...]]:
+    """(MAV_CMD id, 7 params). Raises ValueError for unknown commands or missing params."""
+    if command not in COMMANDS:
+        raise ValueError(f"unknown command {command!r}, expected one of {sorted(COMMANDS)}")
+    cmd, build = COMMANDS[command]
+    try:
+        values = tuple(float(v) for v in build(params or {}))
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"invalid params for {command!r}: {e}")
+    return cmd, values + (0.0,) * (7 - len(values))
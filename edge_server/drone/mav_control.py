@@ -0,0 +1,367 @@
+# edge_server/drone/mav_control.py
+# MAVLink adapter: same start/stop/send_command interface as MockMavAdapter, for real
+# vehicles or SITL. One asyncio endpoint (UDP, or serial via pyserial-asyncio) serves every vehicle
+# on the link (vehicles are told apart by system id), so there is no thread per drone.
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from edge_server.config import settings
+from edge_server.database import crud
+from edge_server.database.db import SessionLocal
+from edge_server.drone import mavlink
+from edge_server.drone.manual_control import command_long
+from edge_server.drone.telemetry import end_telemetry, publish_telemetry
+from edge_server.utils.logger import logger
+
+# the only messages decoded; everything else is skipped by the parser
+SUBSCRIBED = {"HEARTBEAT", "SYS_STATUS", "GLOBAL_POSITION_INT", "COMMAND_ACK", "MISSION_REQUEST",
+              "MISSION_REQUEST_INT", "MISSION_ACK", "MISSION_CURRENT", "MISSION_ITEM_REACHED"}
+
+
+class MavlinkError(Exception):
+    pass
+
+
+def parse_url(url: str) -> Tuple[str, str, int]:
+    """"udpin:0.0.0.0:14550" -> ("udpin", "0.0.0.0", 14550); "serial:/dev/ttyACM0:57600" -> ("serial", device, baud)."""
+    try:
+        kind, host, port = url.split(":")
+        if kind not in ("udpin", "udpout", "serial"):
+            raise ValueError
+        return kind, host, int(port)
+    except ValueError:
+        raise ValueError(f"unsupported MAVLink URL {url!r}, expected udpin:<host>:<port>, udpout:<host>:<port> "
+                         f"or serial:<device>:<baud>")
+
+
+class Vehicle:
+    def __init__(self, sysid: int, compid: int, addr):
+        self.sysid = sysid
+        self.compid = compid
+        self.addr = addr
+        self.last_heartbeat = time.monotonic()
+        self.mission_id: Optional[int] = None
+        self.battery: Optional[float] = None
+        self.mission_seq: Optional[int] = None
+        # futures waiting for COMMAND_ACK, per MAV_CMD
+        self.acks: Dict[int, asyncio.Future] = {}
+        # mission protocol messages while an upload is running
+        self.mission_queue: Optional[asyncio.Queue] = None
+
+
+class _LinkProtocol(asyncio.DatagramProtocol):
+    def __init__(self, adapter: "MavlinkAdapter"):
+        self.adapter = adapter
+
+    def datagram_received(self, data: bytes, addr):
+        self.adapter._on_datagram(data, addr)
+
+    def error_received(self, exc):
+        logger.warning("MAVLink link error: %s", exc)
+
+
+class _SerialProtocol(asyncio.Protocol):
+    def __init__(self, adapter: "MavlinkAdapter"):
+        self.adapter = adapter
+
+    def data_received(self, data: bytes):
+        self.adapter._on_datagram(data, None)
+
+
+class MavlinkAdapter:
+    # the link (UDP port / serial device) can only be opened by one process
+    exclusive_link = True
+
+    def __init__(self, url: str = settings.MAVLINK_URL, system_id: int = settings.MAVLINK_SYSTEM_ID,
+                 position_hz: float = settings.MAVLINK_POSITION_HZ, status_hz: float = settings.MAVLINK_STATUS_HZ):
+        self.kind, self.host, self.port = parse_url(url)
+        self.system_id = system_id
+        self.component_id = 190  # MAV_COMP_ID_MISSIONPLANNER
+        self.position_hz = position_hz
+        self.status_hz = status_hz
+        self.vehicles: Dict[int, Vehicle] = {}
+        self._parsers: Dict[tuple, mavlink.MavParser] = {}
+        self._transport: Optional[asyncio.DatagramTransport] = None
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._vehicle_seen: Optional[asyncio.Event] = None
+        self._seq = 0
+
+    # link
+
+    async def open(self):
+        loop = asyncio.get_running_loop()
+        if self.kind == "serial":
+            try:
+                import serial_asyncio
+            except ImportError:
+                raise MavlinkError("serial MAVLink links need pyserial-asyncio (pip install pyserial-asyncio)")
+            self._transport, _ = await serial_asyncio.create_serial_connection(
+                loop, lambda: _SerialProtocol(self), self.host, baudrate=self.port)
+        elif self.kind == "udpin":
+            self._transport, _ = await loop.create_datagram_endpoint(
+                lambda: _LinkProtocol(self), local_addr=(self.host, self.port))
+        else:
+            self._transport, _ = await loop.create_datagram_endpoint(
+                lambda: _LinkProtocol(self), remote_addr=(self.host, self.port))
+        self._vehicle_seen = asyncio.Event()
+        self._heartbeat = asyncio.create_task(self._gcs_heartbeat())
+        logger.info("MAVLink adapter listening (%s %s:%s)", self.kind, self.host, self.port)
+
+    async def close(self):
+        for mission_id in list(self._tasks):
+            self.stop(mission_id)
+        if self._heartbeat:
+            self._heartbeat.cancel()
+        if self._transport:
+            self._transport.close()
+            self._transport = None
+
+    def _send(self, name: str, addr=None, **fields):
+        if self._transport is None:
+            raise MavlinkError("MAVLink link is not open")
+        self._seq = (self._seq + 1) & 0xFF
+        self._write(mavlink.encode(name, self._seq, self.system_id, self.component_id, **fields), addr)
+
+    def _write(self, frame: bytes, addr):
+        if self.kind == "serial":
+            self._transport.write(frame)
+        elif self.kind == "udpout":
+            self._transport.sendto(frame)
+        else:
+            self._transport.sendto(frame, addr)
+
+    async def _gcs_heartbeat(self):
+        # autopilots trigger GCS-loss failsafes without a heartbeat from us
+        while True:
+            if self.kind != "udpin" and not self.vehicles:
+                self._send("HEARTBEAT", type=mavlink.MAV_TYPE_GCS, autopilot=mavlink.MAV_AUTOPILOT_INVALID,
+                           mavlink_version=3)
+            for v in list(self.vehicles.values()):
+                self._send("HEARTBEAT", v.addr, type=mavlink.MAV_TYPE_GCS,
+                           autopilot=mavlink.MAV_AUTOPILOT_INVALID, mavlink_version=3)
+            await asyncio.sleep(1)
+
+    def _on_datagram(self, data: bytes, addr):
+        parser = self._parsers.get(addr)
+        if parser is None:
+            parser = self._parsers[addr] = mavlink.MavParser(SUBSCRIBED)
+        for msg in parser.feed(data):
+            try:
+                self._dispatch(msg, addr)
+            except Exception:
+                logger.exception("MAVLink: failed to handle %s from %s", msg.name, msg.sysid)
+
+    def _dispatch(self, msg: mavlink.Message, addr):
+        v = self.vehicles.get(msg.sysid)
+        f = msg.fields
+        if msg.name == "HEARTBEAT":
+            if f["type"] == mavlink.MAV_TYPE_GCS:
+                return
+            if v is None:
+                v = self.vehicles[msg.sysid] = Vehicle(msg.sysid, msg.compid, addr)
+                logger.info("MAVLink: vehicle %s at %s", msg.sysid, addr)
+                self._request_streams(v)
+                self._vehicle_seen.set()
+            v.addr, v.last_heartbeat = addr, time.monotonic()
+            return
+        if v is None:
+            return
+        if msg.name == "GLOBAL_POSITION_INT":
+            if v.mission_id is not None:
+                now = time.time()
+                publish_telemetry(v.mission_id, {
+                    "type": "telemetry",
+                    "mission_id": v.mission_id,
+                    "lat": f["lat"] / 1e7,
+                    "lon": f["lon"] / 1e7,
+                    "alt": f["relative_alt"] / 1000,
+                    "battery": v.battery,
+                    "heading": f["hdg"] / 100 if f["hdg"] != 65535 else None,
+                    "timestamp": datetime.utcfromtimestamp(now).isoformat(),
+                }, t=now)
+        elif msg.name == "SYS_STATUS":
+            v.battery = None if f["battery_remaining"] < 0 else f["battery_remaining"]
+        elif msg.name == "COMMAND_ACK":
+            fut = v.acks.get(f["command"])
+            if fut is not None and not fut.done() and f["result"] != mavlink.MAV_RESULT_IN_PROGRESS:
+                fut.set_result(f["result"])
+        elif msg.name in ("MISSION_REQUEST", "MISSION_REQUEST_INT", "MISSION_ACK"):
+            if v.mission_queue is not None:
+                v.mission_queue.put_nowait(msg)
+        elif msg.name in ("MISSION_CURRENT", "MISSION_ITEM_REACHED"):
+            v.mission_seq = f["seq"]
+
+    def _request_streams(self, v: Vehicle):
+        # explicit rates instead of whatever the autopilot streams by default
+        for msg_name, hz in (("GLOBAL_POSITION_INT", self.position_hz), ("SYS_STATUS", self.status_hz)):
+            self._command(v, mavlink.MAV_CMD_SET_MESSAGE_INTERVAL,
+                          (mavlink.BY_NAME[msg_name].id, 1e6 / hz if hz > 0 else -1, 0, 0, 0, 0, 0))
+
+    # commands
+
+    def _command(self, v: Vehicle, command: int, params, confirmation: int = 0):
+        p = list(params) + [0.0] * (7 - len(params))
+        self._send("COMMAND_LONG", v.addr, command=command, target_system=v.sysid, target_component=v.compid,
+                   confirmation=confirmation, **{f"param{i + 1}": p[i] for i in range(7)})
+
+    async def _command_once(self, v: Vehicle, command: int, params, timeout: float, confirmation: int = 0) -> int:
+        """Send COMMAND_LONG once and return the MAV_RESULT of its COMMAND_ACK; asyncio.TimeoutError if none."""
+        fut = asyncio.get_running_loop().create_future()
+        v.acks[command] = fut
+        try:
+            self._command(v, command, params, confirmation=confirmation)
+            return await asyncio.wait_for(fut, timeout)
+        finally:
+            if v.acks.get(command) is fut:
+                del v.acks[command]
+
+    async def command(self, v: Vehicle, command: int, params, timeout: float = 1.5, retries: int = 3) -> int:
+        """COMMAND_LONG with retries (confirmation counts the resends)."""
+        for attempt in range(retries):
+            try:
+                return await self._command_once(v, command, params, timeout, attempt)
+            except asyncio.TimeoutError:
+                continue
+        raise MavlinkError(f"no COMMAND_ACK for command {command} from vehicle {v.sysid}")
+
+    # mission upload
+
+    def mission_items(self, v: Vehicle, waypoints: List[tuple]) -> List[bytes]:
+        """All MISSION_ITEM_INT frames, encoded once up front."""
+        frames = []
+        for seq, (lat, lon, alt) in enumerate(waypoints):
+            self._seq = (self._seq + 1) & 0xFF
+            frames.append(mavlink.encode(
+                "MISSION_ITEM_INT", self._seq, self.system_id, self.component_id,
+                seq=seq, frame=mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT_INT, command=mavlink.MAV_CMD_NAV_WAYPOINT,
+                current=1 if seq == 0 else 0, autocontinue=1, x=int(round(lat * 1e7)), y=int(round(lon * 1e7)),
+                z=float(settings.MAVLINK_DEFAULT_ALT if alt is None else alt),
+                target_system=v.sysid, target_component=v.compid,
+            ))
+        return frames
+
+    async def upload_mission(self, v: Vehicle, waypoints: List[tuple], timeout: float = 1.5, retries: int = 5):
+        frames = self.mission_items(v, waypoints)
+        v.mission_queue = asyncio.Queue()
+        last = None
+        try:
+            self._send("MISSION_COUNT", v.addr, count=len(frames), target_system=v.sysid, target_component=v.compid)
+            misses = 0
+            while True:
+                try:
+                    msg = await asyncio.wait_for(v.mission_queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    misses += 1
+                    if misses > retries:
+                        raise MavlinkError(f"mission upload to vehicle {v.sysid} timed out")
+                    # repeat whatever the vehicle did not answer
+                    if last is None:
+                        self._send("MISSION_COUNT", v.addr, count=len(frames), target_system=v.sysid,
+                                   target_component=v.compid)
+                    else:
+                        self._write(frames[last], v.addr)
+                    continue
+                misses = 0
+                if msg.name == "MISSION_ACK":
+                    if msg.fields["type"] != mavlink.MAV_MISSION_ACCEPTED:
+                        raise MavlinkError(f"vehicle {v.sysid} rejected the mission (MAV_MISSION_RESULT "
+                                           f"{msg.fields['type']})")
+                    return
+                seq = msg.fields["seq"]
+                if seq >= len(frames):
+                    raise MavlinkError(f"vehicle {v.sysid} requested item {seq} of {len(frames)}")
+                last = seq
+                self._write(frames[seq], v.addr)
+        finally:
+            v.mission_queue = None
+
+    # adapter interface
+
+    async def _wait_for_vehicle(self, timeout: float) -> Vehicle:
+        deadline = time.monotonic() + timeout
+        while True:
+            for v in self.vehicles.values():
+                if v.mission_id is None and time.monotonic() - v.last_heartbeat < 5:
+                    return v
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise MavlinkError("no idle vehicle available")
+            self._vehicle_seen.clear()
+            try:
+                await asyncio.wait_for(self._vehicle_seen.wait(), min(remaining, 1.0))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run_mission(self, mission_id: int):
+        v = None
+        try:
+            v = await self._wait_for_vehicle(settings.MAVLINK_VEHICLE_TIMEOUT)
+            v.mission_id = mission_id
+            waypoints = await asyncio.get_running_loop().run_in_executor(None, _load_waypoints, mission_id)
+            if not waypoints:
+                raise MavlinkError(f"mission {mission_id} has no waypoints")
+            await self.upload_mission(v, waypoints)
+            logger.info("MAVLink: mission %s uploaded to vehicle %s (%s items)", mission_id, v.sysid, len(waypoints))
+            for command, params in ((mavlink.MAV_CMD_COMPONENT_ARM_DISARM, (1,)),
+                                    (mavlink.MAV_CMD_MISSION_START, (0, 0))):
+                result = await self.command(v, command, params)
+                if result != mavlink.MAV_RESULT_ACCEPTED:
+                    raise MavlinkError(f"vehicle {v.sysid} refused command {command} (MAV_RESULT {result})")
+            # telemetry now flows through _dispatch until stop()
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            logger.exception("MAVLink: mission %s failed", mission_id)
+        finally:
+            if v is not None and v.mission_id == mission_id:
+                v.mission_id = None
+            end_telemetry(mission_id)
+
+    def start(self, mission_id: int):
+        if self.running(mission_id):
+            logger.info("MAVLink: mission %s already running", mission_id)
+            return
+        self._tasks[mission_id] = asyncio.get_event_loop().create_task(self._run_mission(mission_id))
+
+    def stop(self, mission_id: int):
+        t = self._tasks.pop(mission_id, None)
+        if t:
+            t.cancel()
+
+    def running(self, mission_id: int) -> bool:
+        t = self._tasks.get(mission_id)
+        return t is not None and not t.done()
+
+    def vehicle_for(self, mission_id: int) -> Optional[Vehicle]:
+        for v in self.vehicles.values():
+            if v.mission_id == mission_id:
+                return v
+        return None
+
+    def _mission_vehicle(self, mission_id: int) -> Vehicle:
+        v = self.vehicle_for(mission_id)
+        if v is None:
+            raise MavlinkError(f"no vehicle is flying mission {mission_id}")
+        return v
+
+    def send_command(self, mission_id: int, command: str, params=None):
+        cmd, values = command_long(command, params)
+        self._command(self._mission_vehicle(mission_id), cmd, values)
+
+    async def execute(self, mission_id: int, command: str, params=None, timeout: float = 1.5,
+                      attempt: int = 0) -> int:
+        """One attempt of an operator command; returns the vehicle's MAV_RESULT."""
+        cmd, values = command_long(command, params)
+        return await self._command_once(self._mission_vehicle(mission_id), cmd, values, timeout, attempt)
+
+
+def _load_waypoints(mission_id: int):
+    db = SessionLocal()
+    try:
+        return [tuple(r) for r in crud.get_mission_waypoints(db, mission_id)]
+    finally:
+        db.close()
@@ -0,0 +1,168 @@
+# edge_server/drone/mavlink.py
+# Minimal MAVLink v1/v2 codec for the handful of common.xml messages the edge server
+# uses. Frames of other message ids are skipped without decoding or CRC work, so a
+# chatty autopilot costs little more than the bytes it sends.
+import struct
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+STX_V1 = 0xFE
+STX_V2 = 0xFD
+
+
+class MsgDef(NamedTuple):
+    id: int
+    name: str
+    crc_extra: int
+    fmt: str            # struct format in wire order, extension fields included
+    fields: Tuple[str, ...]
+
+    @property
+    def size(self) -> int:
+        return struct.calcsize(self.fmt)
+
+
+# wire order: base fields sorted by type size (largest first), then extension fields
+_DEFS = [
+    MsgDef(0, "HEARTBEAT", 50, "<IBBBBB",
+           ("custom_mode", "type", "autopilot", "base_mode", "system_status", "mavlink_version")),
+    MsgDef(1, "SYS_STATUS", 124, "<IIIHHhHHHHHHb",
+           ("sensors_present", "sensors_enabled", "sensors_health", "load", "voltage_battery", "current_battery",
+            "drop_rate_comm", "errors_comm", "errors_count1", "errors_count2", "errors_count3", "errors_count4",
+            "battery_remaining")),
+    MsgDef(33, "GLOBAL_POSITION_INT", 104, "<IiiiihhhH",
+           ("time_boot_ms", "lat", "lon", "alt", "relative_alt", "vx", "vy", "vz", "hdg")),
+    MsgDef(40, "MISSION_REQUEST", 230, "<HBBB", ("seq", "target_system", "target_component", "mission_type")),
+    MsgDef(42, "MISSION_CURRENT", 28, "<H", ("seq",)),
+    MsgDef(44, "MISSION_COUNT", 221, "<HBBB", ("count", "target_system", "target_component", "mission_type")),
+    MsgDef(46, "MISSION_ITEM_REACHED", 11, "<H", ("seq",)),
+    MsgDef(47, "MISSION_ACK", 153, "<BBBB", ("target_system", "target_component", "type", "mission_type")),
+    MsgDef(51, "MISSION_REQUEST_INT", 196, "<HBBB", ("seq", "target_system", "target_component", "mission_type")),
+    MsgDef(73, "MISSION_ITEM_INT", 38, "<ffffiifHHBBBBBB",
+           ("param1", "param2", "param3", "param4", "x", "y", "z", "seq", "command", "target_system",
+            "target_component", "frame", "current", "autocontinue", "mission_type")),
+    MsgDef(76, "COMMAND_LONG", 152, "<fffffffHBBB",
+           ("param1", "param2", "param3", "param4", "param5", "param6", "param7", "command", "target_system",
+            "target_component", "confirmation")),
+    MsgDef(77, "COMMAND_ACK", 143, "<HBBiBB",
+           ("command", "result", "progress", "result_param2", "target_system", "target_component")),
+]
+MESSAGES: Dict[int, MsgDef] = {d.id: d for d in _DEFS}
+BY_NAME: Dict[str, MsgDef] = {d.name: d for d in _DEFS}
+
+# enums used by the adapter
+MAV_CMD_NAV_WAYPOINT = 16
+MAV_CMD_NAV_RETURN_TO_LAUNCH = 20
+MAV_CMD_NAV_LAND = 21
+MAV_CMD_NAV_TAKEOFF = 22
+MAV_CMD_DO_SET_MODE = 176
+MAV_CMD_DO_CHANGE_SPEED = 178
+MAV_CMD_DO_PAUSE_CONTINUE = 193
+MAV_CMD_MISSION_START = 300
+MAV_CMD_COMPONENT_ARM_DISARM = 400
+MAV_CMD_SET_MESSAGE_INTERVAL = 511
+MAV_FRAME_GLOBAL_RELATIVE_ALT_INT = 6
+MAV_MISSION_ACCEPTED = 0
+MAV_RESULT_ACCEPTED = 0
+MAV_RESULT_IN_PROGRESS = 5
+MAV_TYPE_GCS = 6
+MAV_AUTOPILOT_INVALID = 8
+
+
+def _crc_table():
+    # MAVLink's per-byte step only depends on (byte ^ low byte of crc), so it tabulates
+    table = []
+    for i in range(256):
+        tmp = (i ^ (i << 4)) & 0xFF
+        table.append(((tmp << 8) ^ (tmp << 3) ^ (tmp >> 4)) & 0xFFFF)
+    return table
+
+
+_TABLE = _crc_table()
+
+
+def x25crc(data: bytes, crc: int = 0xFFFF) -> int:
+    """CRC-16/MCRF4XX as used by MAVLink."""
+    table = _TABLE
+    for b in data:
+        crc = (crc >> 8) ^ table[(crc ^ b) & 0xFF]
+    return crc
+
+
+def encode(name: str, seq: int, sysid: int, compid: int, /, **fields) -> bytes:
+    """One MAVLink 2 frame (unsigned); missing fields are 0, trailing zero bytes are truncated."""
+    d = BY_NAME[name]
+    payload = struct.pack(d.fmt, *(fields.get(f, 0) for f in d.fields)).rstrip(b"\x00") or b"\x00"
+    header = bytes([len(payload), 0, 0, seq & 0xFF, sysid, compid]) + d.id.to_bytes(3, "little")
+    crc = x25crc(bytes([d.crc_extra]), x25crc(payload, x25crc(header)))
+    return bytes([STX_V2]) + header + payload + crc.to_bytes(2, "little")
+
+
+class Message(NamedTuple):
+    name: str
+    sysid: int
+    compid: int
+    fields: dict
+
+
+class MavParser:
+    """
+    Incremental frame parser for a byte stream or datagrams. Only message ids in `wanted`
+    (default: all known) are CRC-checked and decoded; everything else is skipped by length.
+    """
+
+    def __init__(self, wanted: Optional[Set[str]] = None):
+        self.wanted = {BY_NAME[n].id for n in wanted} if wanted else set(MESSAGES)
+        self._buf = bytearray()
+        self.decoded = 0
+        self.skipped = 0
+        self.bad_crc = 0
+
+    def feed(self, data: bytes) -> List[Message]:
+        buf = self._buf
+        buf.extend(data)
+        out = []
+        i = 0
+        n = len(buf)
+        while i < n:
+            stx = buf[i]
+            if stx == STX_V2:
+                if n - i < 12:
+                    break
+                plen, incompat = buf[i + 1], buf[i + 2]
+                total = 12 + plen + (13 if incompat & 0x01 else 0)  # signed frames carry a 13-byte signature
+                if n - i < total:
+                    break
+                msgid = buf[i + 7] | (buf[i + 8] << 8) | (buf[i + 9] << 16)
+                hdr_end, sysid, compid = i + 10, buf[i + 5], buf[i + 6]
+            elif stx == STX_V1:
+                if n - i < 8:
+                    break
+                plen = buf[i + 1]
+                total = 8 + plen
+                if n - i < total:
+                    break
+                msgid = buf[i + 5]
+                hdr_end, sysid, compid = i + 6, buf[i + 3], buf[i + 4]
+            else:
+                i += 1
+                continue
+            if msgid not in self.wanted:
+                self.skipped += 1
+                i += total
+                continue
+            d = MESSAGES[msgid]
+            crc_end = hdr_end + plen
+            crc = x25crc(bytes([d.crc_extra]), x25crc(buf[i + 1:crc_end]))
+            if crc != buf[crc_end] | (buf[crc_end + 1] << 8):
+                # not a frame after all (or corrupted): resync one byte further
+                self.bad_crc += 1
+                i += 1
+                continue
+            payload = bytes(buf[hdr_end:crc_end])
+            size = d.size
+            payload = payload[:size] if len(payload) >= size else payload + bytes(size - len(payload))
+            out.append(Message(d.name, sysid, compid, dict(zip(d.fields, struct.unpack(d.fmt, payload)))))
+            self.decoded += 1
+            i += total
+        del buf[:i]
+        return out
@@ -0,0 +1,157 @@
+# edge_server/drone/sitl_stub.py
+# Stand-in for ArduPilot SITL when testing the MAVLink adapter: N vehicles, each on its
+# own UDP socket sending to the edge server, speaking just enough MAVLink for it
+# (heartbeats, SET_MESSAGE_INTERVAL, mission upload, arm/start, waypoint following).
+#
+#   python -m edge_server.drone.sitl_stub --vehicles 5 --target 127.0.0.1:14550
+import argparse
+import asyncio
+import time
+
+from edge_server.drone import mavlink
+from edge_server.utils import geo
+
+WANTED = {"HEARTBEAT", "COMMAND_LONG", "MISSION_COUNT", "MISSION_ITEM_INT"}
+
+
+class SimVehicle(asyncio.DatagramProtocol):
+    def __init__(self, sysid: int, home=(48.2, 16.37), speed: float = 10.0):
+        self.sysid = sysid
+        self.lat, self.lon = home
+        self.alt = 0.0
+        self.speed = speed
+        self.battery = 100.0
+        self.armed = False
+        self.items = []
+        self.current = 0
+        self.flying = False
+        self.intervals = {0: 1.0}  # msg id -> seconds
+        self._expected = 0
+        self._seq = 0
+        self._parser = mavlink.MavParser(WANTED)
+        self.transport = None
+        self.sent = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def send(self, name: str, **fields):
+        self._seq = (self._seq + 1) & 0xFF
+        self.transport.sendto(mavlink.encode(name, self._seq, self.sysid, 1, **fields))
+        self.sent += 1
+
+    def datagram_received(self, data, addr):
+        for msg in self._parser.feed(data):
+            f = msg.fields
+            if f.get("target_system", self.sysid) not in (0, self.sysid):
+                continue
+            if msg.name == "COMMAND_LONG":
+                self._on_command(f)
+            elif msg.name == "MISSION_COUNT":
+                self.items = [None] * f["count"]
+                self._expected = 0
+                self._request_next()
+            elif msg.name == "MISSION_ITEM_INT" and self.items and f["seq"] == self._expected:
+                self.items[f["seq"]] = (f["x"] / 1e7, f["y"] / 1e7, f["z"])
+                self._expected += 1
+                self._request_next()
+
+    def _request_next(self):
+        if self._expected < len(self.items):
+            self.send("MISSION_REQUEST_INT", seq=self._expected, target_system=255, target_component=190)
+        else:
+            self.current = 0
+            self.send("MISSION_ACK", type=mavlink.MAV_MISSION_ACCEPTED, target_system=255, target_component=190)
+
+    def _on_command(self, f):
+        cmd, result = f["command"], mavlink.MAV_RESULT_ACCEPTED
+        if cmd == mavlink.MAV_CMD_SET_MESSAGE_INTERVAL:
+            msg_id, interval = int(f["param1"]), f["param2"]
+            if interval < 0:
+                self.intervals.pop(msg_id, None)
+            else:
+                self.intervals[msg_id] = interval / 1e6 if interval > 0 else 1.0
+        elif cmd == mavlink.MAV_CMD_COMPONENT_ARM_DISARM:
+            self.armed = f["param1"] == 1
+        elif cmd == mavlink.MAV_CMD_MISSION_START:
+            if not (self.armed and self.items and None not in self.items):
+                result = 4  # MAV_RESULT_FAILED
+            else:
+                self.flying = True
+        elif cmd == mavlink.MAV_CMD_DO_PAUSE_CONTINUE:
+            self.flying = f["param1"] == 1
+        elif cmd in (mavlink.MAV_CMD_NAV_LAND, mavlink.MAV_CMD_NAV_RETURN_TO_LAUNCH):
+            self.flying = False
+        elif cmd == mavlink.MAV_CMD_DO_CHANGE_SPEED:
+            self.speed = f["param2"]
+        self.send("COMMAND_ACK", command=cmd, result=result, target_system=255, target_component=190)
+
+    def step(self, dt: float):
+        if not self.flying or self.current >= len(self.items):
+            return
+        lat, lon, alt = self.items[self.current]
+        # great-circle, like the mission progress and geofence checks fed by this track
+        dist = float(geo.haversine(self.lat, self.lon, lat, lon))
+        move = self.speed * dt
+        if dist <= move:
+            self.lat, self.lon, self.alt = lat, lon, alt
+            self.send("MISSION_ITEM_REACHED", seq=self.current)
+            self.current += 1
+            if self.current >= len(self.items):
+                self.flying = False
+            else:
+                self.send("MISSION_CURRENT", seq=self.current)
+        else:
+            brg = geo.bearing(self.lat, self.lon, lat, lon)
+            self.lat, self.lon = map(float, geo.destination_point(self.lat, self.lon, brg, move))
+            self.alt += (alt - self.alt) * min(1.0, move / dist)
+        self.battery = max(0.0, self.battery - 0.01 * dt)
+
+    def emit(self, msg_id: int, boot: float):
+        if msg_id == 0:
+            self.send("HEARTBEAT", type=2, autopilot=3, base_mode=128 if self.armed else 0, system_status=4,
+                      mavlink_version=3)
+        elif msg_id == 1:
+            self.send("SYS_STATUS", battery_remaining=int(self.battery), voltage_battery=12600)
+        elif msg_id == 33:
+            self.send("GLOBAL_POSITION_INT", time_boot_ms=int(boot * 1000) & 0xFFFFFFFF,
+                      lat=int(self.lat * 1e7), lon=int(self.lon * 1e7), alt=int(self.alt * 1000),
+                      relative_alt=int(self.alt * 1000), hdg=65535)
+
+
+async def run_vehicle(v: SimVehicle, target, tick: float = 0.02):
+    loop = asyncio.get_running_loop()
+    await loop.create_datagram_endpoint(lambda: v, remote_addr=target)
+    start = last = time.monotonic()
+    due = {}
+    while True:
+        now = time.monotonic()
+        v.step(now - last)
+        last = now
+        for msg_id, interval in list(v.intervals.items()):
+            if now >= due.get(msg_id, 0):
+                v.emit(msg_id, now - start)
+                due[msg_id] = now + interval
+        await asyncio.sleep(tick)
+
+
+async def run(vehicles: int, target, first_sysid: int = 1):
+    sims = [SimVehicle(first_sysid + i, home=(48.2 + 0.001 * i, 16.37)) for i in range(vehicles)]
+    await asyncio.gather(*(run_vehicle(v, target) for v in sims))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated MAVLink vehicles for the edge server")
+    parser.add_argument("--vehicles", type=int, default=1)
+    parser.add_argument("--target", default="127.0.0.1:14550", help="edge server MAVLink UDP address")
+    parser.add_argument("--first-sysid", type=int, default=1)
+    args = parser.parse_args()
+    host, port = args.target.rsplit(":", 1)
+    try:
+        asyncio.run(run(args.vehicles, (host, int(port)), args.first_sysid))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
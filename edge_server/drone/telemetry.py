@@ -0,0 +1,29 @@
+# edge_server/drone/telemetry.py
+# Single entry point for telemetry coming from a drone adapter.
+import time
+from typing import Optional
+
+from edge_server.services.geofence import geofence
+from edge_server.services.mission_progress import mission_progress
+from edge_server.services.telemetry_hub import telemetry_hub
+from edge_server.services.telemetry_store import telemetry_store
+
+
+def publish_telemetry(mission_id: int, message: dict, t: Optional[float] = None):
+    """
+    Fan a telemetry message out to live subscribers, append it to the mission's time series,
+    check it against the geofences and advance the mission's progress (breach events and
+    progress updates go out on the same stream).
+    """
+    t = time.time() if t is None else t
+    telemetry_hub.publish(mission_id, message)
+    telemetry_store.append(mission_id, t, message)
+    geofence.observe(mission_id, message)
+    mission_progress.observe(mission_id, message, t)
+
+
+def end_telemetry(mission_id: int):
+    """The mission stopped sending: seal its buffered samples and open rollup buckets, publish its final progress."""
+    telemetry_store.close(mission_id)
+    geofence.forget(mission_id)
+    mission_progress.forget(mission_id)
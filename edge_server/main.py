@@ -1,10 +1,23 @@
 from fastapi import FastAPI
+from edge_server.ai.detect import inference_engine
 from edge_server.config import settings
-from edge_server.database.db import Base, engine
-from edge_server.api.endpoints import auth, journeys, missions, detections, drone_ws
+from edge_server.database.db import dispose_engines
+from edge_server.database.init_db import init_db
+from edge_server.api.endpoints import auth, journeys, missions, detections, drone_ws, drone_control, geofences
+from edge_server.services.auth_cache import share_invalidations
+from edge_server.services.cluster import cluster
+from edge_server.services.detection_tiles import share_changes
+from edge_server.services.detection_writer import detection_writer
+from edge_server.services.frame_ingest import frame_ingest
+from edge_server.services.geofence import geofence
+from edge_server.services.mission_control import mission_control
+from edge_server.services.mission_progress import mission_progress
+from edge_server.services.password_hasher import password_hasher
+from edge_server.services.telemetry_hub import telemetry_hub
+from edge_server.services.telemetry_store import telemetry_store
 
 # DB erstellen
-Base.metadata.create_all(bind=engine)
+init_db()
 
 app = FastAPI(title=settings.PROJECT_NAME)
 
@@ -13,3 +26,35 @@ app.include_router(journeys.router, prefix=f"{settings.API_V1_STR}/journeys", ta
 app.include_router(missions.router, prefix=f"{settings.API_V1_STR}/missions", tags=["missions"])
 app.include_router(detections.router, prefix=f"{settings.API_V1_STR}/detections", tags=["detections"])
 app.include_router(drone_ws.router, prefix=f"{settings.API_V1_STR}/missions", tags=["websocket"])
+app.include_router(drone_control.router, prefix=f"{settings.API_V1_STR}/missions", tags=["drone"])
+app.include_router(geofences.router, prefix=f"{settings.API_V1_STR}/geofences", tags=["geofences"])
+
+
+@app.on_event("startup")
+async def on_startup():
+    # with several uvicorn workers, missions and WebSocket fan-out are coordinated through the broker
+    await cluster.start()
+    telemetry_hub.attach(cluster.broker)
+    share_invalidations(cluster.broker)
+    share_changes(cluster.broker)
+    detection_writer.start()
+    password_hasher.start()
+    telemetry_store.start()
+    await geofence.start(cluster.broker)
+    await mission_progress.start(cluster)
+    inference_engine.start()
+    await mission_control.start()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await mission_control.stop()
+    await frame_ingest.stop()
+    await inference_engine.stop()
+    # write out buffered detections before the process exits
+    await detection_writer.stop()
+    await telemetry_store.stop()
+    password_hasher.stop()
+    telemetry_hub.detach()
+    await cluster.stop()
+    dispose_engines()
@@ -0,0 +1,116 @@
+# edge_server/services/auth_cache.py
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple
+
+from sqlalchemy import event
+
+from edge_server.config import settings
+from edge_server.database.models import User
+
+
+@dataclass(frozen=True)
+class Principal:
+    """What endpoints get as current_user: plain values, safe to share between requests."""
+    id: int
+    email: str
+
+
+class AuthCache:
+    """
+    LRU of verified token -> Principal. An entry lives at most ttl seconds and never past the
+    token's exp claim, so a cached token stops working exactly when the JWT would.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[Principal, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+        self.invalidated = 0
+        # called with the user id after a local invalidation (set when running several workers)
+        self.on_invalidate: Optional[Callable[[int], None]] = None
+
+    def get(self, token: str) -> Optional[Principal]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            principal, expires_at = entry
+            if expires_at <= now:
+                del self._entries[token]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return principal
+
+    def put(self, token: str, principal: Principal, exp: Optional[float] = None):
+        expires_at = time.time() + self.ttl
+        if exp is not None:
+            expires_at = min(expires_at, float(exp))
+        with self._lock:
+            self._entries[token] = (principal, expires_at)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            stale = [t for t, (p, _) in self._entries.items() if p.id == user_id]
+            for t in stale:
+                del self._entries[t]
+            self.invalidated += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "invalidated": self.invalidated,
+            }
+
+
+auth_cache = AuthCache(settings.AUTH_CACHE_SIZE, settings.AUTH_CACHE_TTL)
+
+
+# Any ORM flush that changes or removes a user drops that user's cached tokens.
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_user(mapper, connection, target):
+    auth_cache.invalidate_user(target.id)
+    if auth_cache.on_invalidate is not None:
+        auth_cache.on_invalidate(target.id)
+
+
+def share_invalidations(broker):
+    """Make user invalidations reach the caches of the other workers. Call from the event loop."""
+    if not broker.distributed:
+        return
+    loop = asyncio.get_running_loop()
+    broker.subscribe("auth.invalidate", lambda channel, data: auth_cache.invalidate_user(int(data)))
+    # the ORM listener runs wherever the session flushes, usually a threadpool thread
+    auth_cache.on_invalidate = lambda user_id: loop.call_soon_threadsafe(
+        broker.publish, "auth.invalidate", str(user_id))
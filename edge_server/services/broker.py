@@ -0,0 +1,519 @@
+# edge_server/services/broker.py
+# Message bus shared by the uvicorn worker processes: fire-and-forget pub/sub (telemetry
+# fan-out, RPC between workers) plus leases with a TTL (who owns a mission / the drone link).
+#
+#   BROKER_URL=local                      single process, nothing leaves the process (default)
+#   BROKER_URL=unix:///tmp/airchif.sock   the first worker to start hosts the hub on a Unix
+#                                         socket, the others connect; if the host dies another
+#                                         worker takes over (or run a dedicated hub, see main())
+#   BROKER_URL=redis://host:6379/0        Redis pub/sub + SET NX PX leases (needs `redis`)
+#
+# A publisher never receives its own messages back.
+import argparse
+import asyncio
+import fcntl
+import os
+import socket
+import struct
+import time
+from typing import Callable, Dict, Optional, Set, Tuple
+
+import orjson
+
+from edge_server.config import settings
+from edge_server.utils.logger import logger
+
+Callback = Callable[[str, str], None]  # (channel, data)
+
+
+class BrokerError(Exception):
+    pass
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class Broker:
+    """Interface. publish/subscribe/unsubscribe never block; lease calls are awaitable."""
+    distributed = False
+
+    def __init__(self, worker_id: Optional[str] = None):
+        self.worker_id = worker_id or default_worker_id()
+        self.published = 0
+        self.received = 0
+        self.dropped = 0
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def publish(self, channel: str, data: str):
+        raise NotImplementedError
+
+    def subscribe(self, channel: str, callback: Callback):
+        raise NotImplementedError
+
+    def unsubscribe(self, channel: str):
+        raise NotImplementedError
+
+    async def acquire(self, key: str, ttl: float) -> Optional[str]:
+        """Take or renew the lease on key. Returns the owner afterwards (self.worker_id on success)."""
+        raise NotImplementedError
+
+    async def release(self, key: str):
+        raise NotImplementedError
+
+    async def owner(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {"backend": type(self).__name__, "worker_id": self.worker_id, "published": self.published,
+                "received": self.received, "dropped": self.dropped}
+
+
+class _Leases:
+    """Lease table used by LocalBroker and the Unix hub."""
+
+    def __init__(self):
+        self._leases: Dict[str, Tuple[str, float]] = {}
+
+    def acquire(self, key: str, owner: str, ttl: float) -> str:
+        now = time.monotonic()
+        cur = self._leases.get(key)
+        if cur is None or cur[1] <= now or cur[0] == owner:
+            self._leases[key] = (owner, now + ttl)
+            return owner
+        return cur[0]
+
+    def release(self, key: str, owner: str):
+        cur = self._leases.get(key)
+        if cur is not None and cur[0] == owner:
+            del self._leases[key]
+
+    def release_all(self, owner: str):
+        for key in [k for k, (o, _) in self._leases.items() if o == owner]:
+            del self._leases[key]
+
+    def owner(self, key: str) -> Optional[str]:
+        cur = self._leases.get(key)
+        if cur is None or cur[1] <= time.monotonic():
+            return None
+        return cur[0]
+
+
+class LocalBroker(Broker):
+    """One process: there is nobody to publish to, leases are a dict."""
+
+    def __init__(self, worker_id: Optional[str] = None):
+        super().__init__(worker_id)
+        self._leases = _Leases()
+
+    def publish(self, channel: str, data: str):
+        pass
+
+    def subscribe(self, channel: str, callback: Callback):
+        pass
+
+    def unsubscribe(self, channel: str):
+        pass
+
+    async def acquire(self, key: str, ttl: float) -> Optional[str]:
+        return self._leases.acquire(key, self.worker_id, ttl)
+
+    async def release(self, key: str):
+        self._leases.release(key, self.worker_id)
+
+    async def owner(self, key: str) -> Optional[str]:
+        return self._leases.owner(key)
+
+
+# Unix socket hub. Frames are a 4-byte big-endian length followed by an orjson object;
+# "pub" frames are forwarded to subscribers byte for byte.
+
+_LEN = struct.Struct(">I")
+
+
+def _frame(msg: dict) -> bytes:
+    body = orjson.dumps(msg)
+    return _LEN.pack(len(body)) + body
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> bytes:
+    (n,) = _LEN.unpack(await reader.readexactly(4))
+    return await reader.readexactly(n)
+
+
+class _HubClient:
+    __slots__ = ("writer", "worker", "channels", "dropped")
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.worker: Optional[str] = None
+        self.channels: Set[str] = set()
+        self.dropped = 0
+
+    def send(self, data: bytes, max_buffer: int):
+        # a worker that stops reading loses messages instead of growing the hub's memory
+        if self.writer.transport.get_write_buffer_size() > max_buffer:
+            self.dropped += 1
+            return
+        self.writer.write(data)
+
+
+class BrokerHub:
+    def __init__(self, path: str, max_buffer: int = 4 * 1024 * 1024):
+        self.path = path
+        self.max_buffer = max_buffer
+        self._subs: Dict[str, Set[_HubClient]] = {}
+        self._leases = _Leases()
+        self._clients: Set[_HubClient] = set()
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        self._server = await asyncio.start_unix_server(self._serve, path=self.path)
+        logger.info("Broker hub listening on %s", self.path)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            for c in list(self._clients):
+                c.writer.close()
+            await self._server.wait_closed()
+            self._server = None
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+    async def serve_forever(self):
+        await self.start()
+        await self._server.serve_forever()
+
+    def _reply(self, client: _HubClient, req: dict, **fields):
+        client.writer.write(_frame({"op": "reply", "id": req["id"], **fields}))
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        client = _HubClient(writer)
+        self._clients.add(client)
+        try:
+            while True:
+                body = await _read_frame(reader)
+                msg = orjson.loads(body)
+                op = msg["op"]
+                if op == "pub":
+                    subs = self._subs.get(msg["ch"])
+                    if subs:
+                        data = _LEN.pack(len(body)) + body
+                        for c in subs:
+                            if c is not client:
+                                c.send(data, self.max_buffer)
+                elif op == "sub":
+                    self._subs.setdefault(msg["ch"], set()).add(client)
+                    client.channels.add(msg["ch"])
+                elif op == "unsub":
+                    self._unsub(client, msg["ch"])
+                elif op == "hello":
+                    client.worker = msg["o"]
+                elif op == "lease":
+                    self._reply(client, msg, owner=self._leases.acquire(msg["key"], client.worker, msg["ttl"]))
+                elif op == "release":
+                    self._leases.release(msg["key"], client.worker)
+                    self._reply(client, msg)
+                elif op == "owner":
+                    self._reply(client, msg, owner=self._leases.owner(msg["key"]))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._clients.discard(client)
+            for ch in list(client.channels):
+                self._unsub(client, ch)
+            if client.worker is not None:
+                # a worker that went away gives up its missions now rather than after the TTL
+                self._leases.release_all(client.worker)
+            writer.close()
+
+    def _unsub(self, client: _HubClient, channel: str):
+        client.channels.discard(channel)
+        subs = self._subs.get(channel)
+        if subs is not None:
+            subs.discard(client)
+            if not subs:
+                del self._subs[channel]
+
+
+class UnixBroker(Broker):
+    distributed = True
+
+    def __init__(self, path: str, worker_id: Optional[str] = None, host_hub: bool = True,
+                 request_timeout: float = 5.0, max_buffer: int = 4 * 1024 * 1024):
+        super().__init__(worker_id)
+        self.path = path
+        self.host_hub = host_hub
+        self.request_timeout = request_timeout
+        self.max_buffer = max_buffer
+        self.hub: Optional[BrokerHub] = None
+        self._lock_fd: Optional[int] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._callbacks: Dict[str, Callback] = {}
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._next_id = 0
+        self.reconnects = 0
+
+    async def start(self):
+        reader = await self._connect()
+        self._reader_task = asyncio.create_task(self._read_loop(reader))
+
+    async def _try_host(self) -> bool:
+        # whoever holds the lock file hosts the hub; the kernel drops the lock if that process dies
+        fd = os.open(self.path + ".lock", os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        try:
+            os.unlink(self.path)  # left over from a hub that died
+        except FileNotFoundError:
+            pass
+        self.hub = BrokerHub(self.path, self.max_buffer)
+        await self.hub.start()
+        self._lock_fd = fd
+        return True
+
+    async def _connect(self) -> asyncio.StreamReader:
+        deadline = time.monotonic() + self.request_timeout * 2
+        while True:
+            try:
+                reader, self._writer = await asyncio.open_unix_connection(self.path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if self.host_hub and self.hub is None and await self._try_host():
+                    continue
+                if time.monotonic() > deadline:
+                    raise BrokerError(f"no broker hub at {self.path}")
+                await asyncio.sleep(0.05)
+        self._send({"op": "hello", "o": self.worker_id})
+        for ch in self._callbacks:
+            self._send({"op": "sub", "ch": ch})
+        return reader
+
+    async def _read_loop(self, reader: asyncio.StreamReader):
+        while True:
+            try:
+                while True:
+                    msg = orjson.loads(await _read_frame(reader))
+                    if msg["op"] == "pub":
+                        cb = self._callbacks.get(msg["ch"])
+                        if cb is not None:
+                            self.received += 1
+                            try:
+                                cb(msg["ch"], msg["d"])
+                            except Exception:
+                                logger.exception("Broker callback for %s failed", msg["ch"])
+                    elif msg["op"] == "reply":
+                        fut = self._pending.pop(msg["id"], None)
+                        if fut is not None and not fut.done():
+                            fut.set_result(msg.get("owner"))
+            except (asyncio.IncompleteReadError, ConnectionError):
+                logger.warning("Broker connection to %s lost, reconnecting", self.path)
+                for fut in self._pending.values():
+                    if not fut.done():
+                        fut.set_exception(BrokerError("broker connection lost"))
+                self._pending.clear()
+                self._writer = None
+                self.reconnects += 1
+                while True:
+                    try:
+                        reader = await self._connect()
+                        break
+                    except BrokerError as e:
+                        logger.warning("%s, retrying", e)
+
+    def _send(self, msg: dict) -> bool:
+        w = self._writer
+        if w is None or w.is_closing() or w.transport.get_write_buffer_size() > self.max_buffer:
+            self.dropped += 1
+            return False
+        w.write(_frame(msg))
+        return True
+
+    def publish(self, channel: str, data: str):
+        if self._send({"op": "pub", "ch": channel, "d": data}):
+            self.published += 1
+
+    def subscribe(self, channel: str, callback: Callback):
+        self._callbacks[channel] = callback
+        self._send({"op": "sub", "ch": channel})
+
+    def unsubscribe(self, channel: str):
+        if self._callbacks.pop(channel, None) is not None:
+            self._send({"op": "unsub", "ch": channel})
+
+    async def _request(self, msg: dict) -> Optional[str]:
+        self._next_id += 1
+        msg["id"] = self._next_id
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[msg["id"]] = fut
+        if not self._send(msg):
+            self._pending.pop(msg["id"], None)
+            raise BrokerError("broker not connected")
+        try:
+            return await asyncio.wait_for(fut, self.request_timeout)
+        except asyncio.TimeoutError:
+            self._pending.pop(msg["id"], None)
+            raise BrokerError(f"broker did not answer {msg['op']} within {self.request_timeout} s")
+
+    async def acquire(self, key: str, ttl: float) -> Optional[str]:
+        return await self._request({"op": "lease", "key": key, "ttl": ttl})
+
+    async def release(self, key: str):
+        await self._request({"op": "release", "key": key})
+
+    async def owner(self, key: str) -> Optional[str]:
+        return await self._request({"op": "owner", "key": key})
+
+    async def stop(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            self._reader_task = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self.hub is not None:
+            await self.hub.stop()
+            self.hub = None
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def stats(self) -> dict:
+        d = super().stats()
+        d.update(path=self.path, hosting_hub=self.hub is not None, reconnects=self.reconnects)
+        return d
+
+
+# compare-and-renew / compare-and-delete so a worker never touches a lease it lost
+_REDIS_ACQUIRE = """
+local cur = redis.call('GET', KEYS[1])
+if cur == ARGV[1] then redis.call('PEXPIRE', KEYS[1], ARGV[2]) return ARGV[1] end
+if not cur then redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2]) return ARGV[1] end
+return cur
+"""
+_REDIS_RELEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+
+
+class RedisBroker(Broker):
+    distributed = True
+
+    def __init__(self, url: str, worker_id: Optional[str] = None, prefix: str = "airchif:"):
+        super().__init__(worker_id)
+        self.url = url
+        self.prefix = prefix
+        self._redis = None
+        self._pubsub = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._callbacks: Dict[str, Callback] = {}
+        self._inflight: Set[asyncio.Task] = set()
+
+    async def start(self):
+        try:
+            import redis.asyncio as aioredis
+        except ImportError:
+            raise BrokerError("BROKER_URL=redis://... needs the redis package (pip install redis)")
+        self._redis = aioredis.from_url(self.url, decode_responses=True)
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        # listen() returns at once while nothing is subscribed
+        await self._pubsub.subscribe(f"{self.prefix}worker.{self.worker_id}")
+        self._reader_task = asyncio.create_task(self._read_loop())
+
+    def _spawn(self, coro):
+        task = asyncio.get_running_loop().create_task(coro)
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _read_loop(self):
+        async for m in self._pubsub.listen():
+            if m.get("type") != "message":
+                continue
+            origin, _, data = m["data"].partition("\n")
+            channel = m["channel"][len(self.prefix):]
+            cb = self._callbacks.get(channel)
+            if origin == self.worker_id or cb is None:
+                continue
+            self.received += 1
+            try:
+                cb(channel, data)
+            except Exception:
+                logger.exception("Broker callback for %s failed", channel)
+
+    def publish(self, channel: str, data: str):
+        if len(self._inflight) > 10000:
+            self.dropped += 1
+            return
+        self.published += 1
+        self._spawn(self._redis.publish(self.prefix + channel, f"{self.worker_id}\n{data}"))
+
+    def subscribe(self, channel: str, callback: Callback):
+        self._callbacks[channel] = callback
+        self._spawn(self._pubsub.subscribe(self.prefix + channel))
+
+    def unsubscribe(self, channel: str):
+        if self._callbacks.pop(channel, None) is not None:
+            self._spawn(self._pubsub.unsubscribe(self.prefix + channel))
+
+    async def acquire(self, key: str, ttl: float) -> Optional[str]:
+        return await self._redis.eval(_REDIS_ACQUIRE, 1, self.prefix + key, self.worker_id, int(ttl * 1000))
+
+    async def release(self, key: str):
+        await self._redis.eval(_REDIS_RELEASE, 1, self.prefix + key, self.worker_id)
+
+    async def owner(self, key: str) -> Optional[str]:
+        return await self._redis.get(self.prefix + key)
+
+    async def stop(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            self._reader_task = None
+        if self._pubsub is not None:
+            await self._pubsub.close()
+        if self._redis is not None:
+            await self._redis.close()
+
+
+def make_broker(url: str = settings.BROKER_URL, worker_id: Optional[str] = None) -> Broker:
+    if url in ("", "local"):
+        return LocalBroker(worker_id)
+    if url.startswith("unix://"):
+        return UnixBroker(url[len("unix://"):], worker_id, request_timeout=settings.BROKER_TIMEOUT)
+    if url.startswith(("redis://", "rediss://", "unix+redis://")):
+        return RedisBroker(url.replace("unix+redis://", "unix://", 1), worker_id)
+    raise ValueError(f"unsupported BROKER_URL {url!r}, expected local, unix:///path or redis://host:port")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Unix-socket broker hub as its own process")
+    parser.add_argument("--socket", default=settings.BROKER_URL[len("unix://"):]
+                        if settings.BROKER_URL.startswith("unix://") else "/tmp/airchif-broker.sock")
+    args = parser.parse_args()
+    # hold the same lock the workers compete for, so none of them starts a second hub
+    fd = os.open(args.socket + ".lock", os.O_CREAT | os.O_RDWR, 0o600)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    try:
+        os.unlink(args.socket)
+    except FileNotFoundError:
+        pass
+    try:
+        asyncio.run(BrokerHub(args.socket).serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
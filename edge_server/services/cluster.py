@@ -0,0 +1,185 @@
+# edge_server/services/cluster.py
+# Coordination between uvicorn workers on top of the broker: RPC to a named worker and
+# leases that are renewed in the background while their owner still wants them.
+import asyncio
+import itertools
+from typing import Awaitable, Callable, Dict, Optional
+
+import orjson
+
+from edge_server.config import settings
+from edge_server.services.broker import Broker, BrokerError, make_broker
+from edge_server.utils.logger import logger
+
+Handler = Callable[..., Awaitable]
+
+
+class ClusterError(Exception):
+    pass
+
+
+class _Lease:
+    __slots__ = ("keep", "on_lost", "on_acquired", "held")
+
+    def __init__(self, keep, on_lost, on_acquired, held):
+        self.keep = keep
+        self.on_lost = on_lost
+        self.on_acquired = on_acquired
+        self.held = held
+
+
+class Cluster:
+    def __init__(self, broker: Broker, lease_ttl: float = 10.0, rpc_timeout: float = 5.0):
+        self.broker = broker
+        self.worker_id = broker.worker_id
+        self.lease_ttl = lease_ttl
+        self.rpc_timeout = rpc_timeout
+        self._handlers: Dict[str, Handler] = {}
+        # exception types that are re-raised by name on the calling side
+        self._errors: Dict[str, type] = {"ValueError": ValueError, "LookupError": LookupError}
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+        self._leases: Dict[str, _Lease] = {}
+        self._keeper: Optional[asyncio.Task] = None
+
+    @property
+    def distributed(self) -> bool:
+        return self.broker.distributed
+
+    async def start(self):
+        await self.broker.start()
+        self.broker.subscribe(f"rpc.{self.worker_id}", self._on_rpc)
+        self._keeper = asyncio.create_task(self._keep_leases())
+        if self.distributed:
+            logger.info("Cluster worker %s joined via %s", self.worker_id, type(self.broker).__name__)
+
+    async def stop(self):
+        if self._keeper is not None:
+            self._keeper.cancel()
+            self._keeper = None
+        for key, lease in list(self._leases.items()):
+            if lease.held:
+                try:
+                    await self.broker.release(key)
+                except BrokerError:
+                    pass
+        self._leases.clear()
+        await self.broker.stop()
+
+    # RPC
+
+    def handle(self, op: str, fn: Handler):
+        self._handlers[op] = fn
+
+    def register_error(self, cls: type):
+        self._errors[cls.__name__] = cls
+
+    async def call(self, worker: str, op: str, timeout: Optional[float] = None, **kwargs):
+        """Run handler `op` on `worker` (directly when that is this process)."""
+        if worker == self.worker_id:
+            return await self._handlers[op](**kwargs)
+        req_id = next(self._ids)
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[req_id] = fut
+        self.broker.publish(f"rpc.{worker}", orjson.dumps(
+            {"t": "req", "id": req_id, "op": op, "args": kwargs, "reply": self.worker_id}).decode())
+        timeout = timeout or self.rpc_timeout
+        try:
+            ok, value = await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            raise ClusterError(f"worker {worker} did not answer {op} within {timeout} s")
+        finally:
+            self._pending.pop(req_id, None)
+        if ok:
+            return value
+        kind, detail = value
+        raise self._errors.get(kind, ClusterError)(detail)
+
+    def _on_rpc(self, channel: str, data: str):
+        msg = orjson.loads(data)
+        if msg["t"] == "res":
+            fut = self._pending.get(msg["id"])
+            if fut is not None and not fut.done():
+                fut.set_result((msg["ok"], msg["value"]))
+        else:
+            asyncio.get_running_loop().create_task(self._serve(msg))
+
+    async def _serve(self, msg: dict):
+        try:
+            handler = self._handlers[msg["op"]]
+            value, ok = await handler(**msg["args"]), True
+        except Exception as e:
+            if type(e).__name__ not in self._errors:
+                logger.exception("RPC %s from %s failed", msg["op"], msg["reply"])
+            value, ok = (type(e).__name__, str(e)), False
+        self.broker.publish(f"rpc.{msg['reply']}", orjson.dumps(
+            {"t": "res", "id": msg["id"], "ok": ok, "value": value}).decode())
+
+    # leases
+
+    async def owner(self, key: str) -> Optional[str]:
+        return await self.broker.owner(key)
+
+    async def hold(self, key: str, keep: Optional[Callable[[], bool]] = None,
+                   on_lost: Optional[Callable[[], Awaitable]] = None) -> Optional[str]:
+        """
+        Try once to take key. On success it is renewed every ttl/3 until keep() turns false or
+        release(); if another worker takes it over meanwhile, on_lost() runs. Returns the owner.
+        """
+        owner = await self.broker.acquire(key, self.lease_ttl)
+        if owner == self.worker_id:
+            self._leases[key] = _Lease(keep, on_lost, None, True)
+        return owner
+
+    async def campaign(self, key: str, on_acquired: Callable[[], Awaitable],
+                       on_lost: Optional[Callable[[], Awaitable]] = None):
+        """Keep trying to take key (for singletons like the MAVLink link); on_acquired() runs once it is ours."""
+        lease = self._leases[key] = _Lease(None, on_lost, on_acquired, False)
+        await self._renew(key, lease)
+
+    async def release(self, key: str):
+        lease = self._leases.pop(key, None)
+        if lease is not None and lease.held:
+            await self.broker.release(key)
+
+    async def _keep_leases(self):
+        while True:
+            for key, lease in list(self._leases.items()):
+                try:
+                    await self._renew(key, lease)
+                except BrokerError as e:
+                    logger.warning("Lease %s: %s", key, e)
+                except Exception:
+                    logger.exception("Lease %s: callback failed", key)
+            await asyncio.sleep(self.lease_ttl / 3)
+
+    async def _renew(self, key: str, lease: _Lease):
+        if lease.keep is not None and not lease.keep():
+            await self.release(key)
+            return
+        owner = await self.broker.acquire(key, self.lease_ttl)
+        if owner == self.worker_id:
+            if not lease.held:
+                lease.held = True
+                logger.info("Worker %s took %s", self.worker_id, key)
+                if lease.on_acquired is not None:
+                    await lease.on_acquired()
+        elif lease.held:
+            logger.warning("Worker %s lost %s to %s", self.worker_id, key, owner)
+            if lease.on_acquired is None:
+                self._leases.pop(key, None)
+            else:
+                lease.held = False  # keep campaigning
+            if lease.on_lost is not None:
+                await lease.on_lost()
+
+    def stats(self) -> dict:
+        return {
+            "worker_id": self.worker_id,
+            "broker": self.broker.stats(),
+            "leases": sorted(k for k, lease in self._leases.items() if lease.held),
+        }
+
+
+cluster = Cluster(make_broker(settings.BROKER_URL), lease_ttl=settings.BROKER_LEASE_TTL,
+                  rpc_timeout=settings.BROKER_TIMEOUT)
@@ -0,0 +1,230 @@
+# edge_server/services/command_queue.py
+# Per-mission operator command queue. Commands are sent one at a time per mission and
+# each waits for the vehicle's ACK (with timeout/retry) before the next one goes out;
+# emergency commands (land/rtl) jump the queue and preempt everything still pending.
+import asyncio
+import heapq
+import itertools
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from edge_server.config import settings
+from edge_server.drone.adapter import drone_manager_singleton
+from edge_server.drone.manual_control import EMERGENCY_COMMANDS, command_long
+from edge_server.services.telemetry_hub import telemetry_hub
+from edge_server.utils.logger import logger
+from edge_server.utils.metrics import Histogram
+
+EMERGENCY = 0
+NORMAL = 1
+
+# states
+QUEUED, SENT, ACKED, REJECTED, TIMEOUT, FAILED, PREEMPTED = (
+    "queued", "sent", "acked", "rejected", "timeout", "failed", "preempted")
+FINAL = {ACKED, REJECTED, TIMEOUT, FAILED, PREEMPTED}
+
+
+class CommandQueueFull(Exception):
+    """Raised when a mission already has COMMAND_QUEUE_SIZE commands waiting."""
+
+
+class Command:
+    __slots__ = ("id", "mission_id", "command", "params", "priority", "state", "result", "error", "attempts",
+                 "enqueued_at", "sent_at", "done_at", "_done")
+
+    def __init__(self, id: int, mission_id: int, command: str, params: Optional[dict], priority: int):
+        self.id = id
+        self.mission_id = mission_id
+        self.command = command
+        self.params = params
+        self.priority = priority
+        self.state = QUEUED
+        self.result: Optional[int] = None
+        self.error: Optional[str] = None
+        self.attempts = 0
+        self.enqueued_at = time.time()
+        self.sent_at: Optional[float] = None
+        self.done_at: Optional[float] = None
+        self._done = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.state in FINAL
+
+    def as_dict(self) -> dict:
+        def ms(a, b):
+            return None if a is None or b is None else round((b - a) * 1000, 3)
+        return {
+            "id": self.id,
+            "mission_id": self.mission_id,
+            "command": self.command,
+            "params": self.params,
+            "priority": "emergency" if self.priority == EMERGENCY else "normal",
+            "state": self.state,
+            "result": self.result,
+            "error": self.error,
+            "attempts": self.attempts,
+            "queue_ms": ms(self.enqueued_at, self.sent_at),
+            "ack_ms": ms(self.sent_at, self.done_at) if self.state in (ACKED, REJECTED) else None,
+        }
+
+
+class _MissionQueue:
+    def __init__(self):
+        self.heap = []
+        self.current: Optional[Command] = None
+        self.current_task: Optional[asyncio.Task] = None
+        self.worker: Optional[asyncio.Task] = None
+
+
+class CommandDispatcher:
+    def __init__(self, timeout: float = 1.5, retries: int = 3, max_queue: int = 32, history: int = 1000):
+        self.timeout = timeout
+        self.retries = max(1, retries)
+        self.max_queue = max_queue
+        self.history = history
+        self._ids = itertools.count(1)
+        self._order = itertools.count()
+        self._queues: Dict[int, _MissionQueue] = {}
+        self._commands: "OrderedDict[int, Command]" = OrderedDict()
+        self.counts: Dict[str, int] = {}
+        # enqueue -> first send, first send -> ACK, enqueue -> final state
+        self.queue_latency = Histogram()
+        self.ack_latency = Histogram()
+        self.total_latency = Histogram()
+
+    def submit(self, mission_id: int, command: str, params: Optional[dict] = None) -> Command:
+        command_long(command, params)  # ValueError for unknown commands / bad params, before queueing
+        q = self._queues.get(mission_id)
+        if q is None:
+            q = self._queues[mission_id] = _MissionQueue()
+        priority = EMERGENCY if command in EMERGENCY_COMMANDS else NORMAL
+        if priority == NORMAL and len(q.heap) >= self.max_queue:
+            raise CommandQueueFull()
+        cmd = Command(next(self._ids), mission_id, command, params, priority)
+        self._remember(cmd)
+        if priority == EMERGENCY:
+            self._preempt(q, cmd)
+        heapq.heappush(q.heap, (priority, next(self._order), cmd))
+        if q.worker is None or q.worker.done():
+            q.worker = asyncio.get_running_loop().create_task(self._work(mission_id, q))
+        return cmd
+
+    def get(self, command_id: int) -> Optional[Command]:
+        return self._commands.get(command_id)
+
+    async def wait(self, cmd: Command, timeout: float) -> Command:
+        if not cmd.done and timeout > 0:
+            try:
+                await asyncio.wait_for(cmd._done.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return cmd
+
+    def _remember(self, cmd: Command):
+        self._commands[cmd.id] = cmd
+        while len(self._commands) > self.history:
+            old_id, old = next(iter(self._commands.items()))
+            if not old.done:
+                break
+            del self._commands[old_id]
+
+    def _preempt(self, q: _MissionQueue, by: Command):
+        kept = []
+        for item in q.heap:
+            if item[0] == EMERGENCY:
+                kept.append(item)
+            else:
+                self._finish(item[2], PREEMPTED, error=f"preempted by {by.command} (#{by.id})")
+        heapq.heapify(kept)
+        q.heap = kept
+        if q.current is not None and q.current.priority == NORMAL and q.current_task is not None:
+            q.current_task.cancel()
+
+    def _finish(self, cmd: Command, state: str, result: Optional[int] = None, error: Optional[str] = None):
+        if cmd.done:
+            return
+        cmd.state, cmd.result, cmd.error, cmd.done_at = state, result, error, time.time()
+        self.counts[state] = self.counts.get(state, 0) + 1
+        if cmd.sent_at is not None and state in (ACKED, REJECTED):
+            self.ack_latency.observe(cmd.done_at - cmd.sent_at)
+        self.total_latency.observe(cmd.done_at - cmd.enqueued_at)
+        cmd._done.set()
+        telemetry_hub.publish(cmd.mission_id, {"type": "command", **cmd.as_dict()})
+
+    async def _send(self, cmd: Command):
+        for attempt in range(self.retries):
+            cmd.attempts = attempt + 1
+            if cmd.sent_at is None:
+                cmd.sent_at = time.time()
+                cmd.state = SENT
+                self.queue_latency.observe(cmd.sent_at - cmd.enqueued_at)
+            try:
+                result = await asyncio.wait_for(
+                    drone_manager_singleton.execute(cmd.mission_id, cmd.command, cmd.params, timeout=self.timeout,
+                                                    attempt=attempt),
+                    self.timeout)
+            except asyncio.TimeoutError:
+                continue
+            self._finish(cmd, ACKED if result == 0 else REJECTED, result=result)
+            return
+        self._finish(cmd, TIMEOUT, error=f"no ACK after {self.retries} attempt(s)")
+
+    async def _work(self, mission_id: int, q: _MissionQueue):
+        while q.heap:
+            _, _, cmd = heapq.heappop(q.heap)
+            if cmd.done:
+                continue
+            q.current = cmd
+            q.current_task = asyncio.get_running_loop().create_task(self._send(cmd))
+            try:
+                await asyncio.shield(q.current_task)
+            except asyncio.CancelledError:
+                if not q.current_task.cancelled():
+                    # the worker itself was cancelled (shutdown)
+                    q.current_task.cancel()
+                    self._finish(cmd, FAILED, error="dispatcher stopped")
+                    raise
+                self._finish(cmd, PREEMPTED, error="preempted by an emergency command")
+            except Exception as e:
+                logger.warning("Command %s (%s) for mission %s failed: %s", cmd.id, cmd.command, mission_id, e)
+                self._finish(cmd, FAILED, error=str(e))
+            finally:
+                q.current = q.current_task = None
+        if self._queues.get(mission_id) is q and not q.heap:
+            del self._queues[mission_id]
+
+    async def stop(self):
+        workers = [q.worker for q in self._queues.values() if q.worker is not None]
+        for q in list(self._queues.values()):
+            for _, _, cmd in q.heap:
+                self._finish(cmd, FAILED, error="dispatcher stopped")
+            q.heap = []
+            if q.worker is not None:
+                q.worker.cancel()
+        for w in workers:
+            try:
+                await w
+            except asyncio.CancelledError:
+                pass
+        self._queues.clear()
+
+    def stats(self) -> dict:
+        return {
+            "missions": len(self._queues),
+            "queued": sum(len(q.heap) for q in self._queues.values()),
+            "in_flight": sum(1 for q in self._queues.values() if q.current is not None),
+            "states": dict(self.counts),
+            "queue_latency": self.queue_latency.as_dict(),
+            "ack_latency": self.ack_latency.as_dict(),
+            "total_latency": self.total_latency.as_dict(),
+        }
+
+
+command_dispatcher = CommandDispatcher(
+    timeout=settings.COMMAND_ACK_TIMEOUT,
+    retries=settings.COMMAND_RETRIES,
+    max_queue=settings.COMMAND_QUEUE_SIZE,
+    history=settings.COMMAND_HISTORY,
+)
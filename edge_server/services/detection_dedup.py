@@ -0,0 +1,173 @@
+# edge_server/services/detection_dedup.py
+# Online merging of repeated detections. A drone hovering over the same patch reports it
+# every tick; detections of the same mission and label within radius_m of a tracked object
+# seen during the last window_s seconds are folded into that object (hit count, best score,
+# hit-weighted position) instead of becoming new rows. Recent objects live in a grid hash
+# with radius-sized cells, so a lookup only visits the 3x3 cells around the detection.
+# Distances are great-circle (utils.geo), like every other proximity check in the server.
+import math
+import secrets
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from edge_server.config import settings
+from edge_server.utils import geo
+
+EPOCH = datetime(1970, 1, 1)
+
+# object lifecycle: the row waits in the writer's buffer, is being inserted, or is in the table
+BUFFERED, IN_FLIGHT, WRITTEN = 0, 1, 2
+
+
+def _seconds(dt: datetime) -> float:
+    return (dt - EPOCH).total_seconds()
+
+
+class Track:
+    """
+    A de-duplicated object; row is the detections row that is (or will be) stored for it.
+    stored is (lat, lon, score) as last committed, None until the row is written.
+    """
+    __slots__ = ("row", "cell", "t_last", "state", "stored")
+
+    def __init__(self, row: dict, cell: tuple, t: float):
+        self.row = row
+        self.cell = cell
+        self.t_last = t
+        self.state = BUFFERED
+        self.stored: Optional[tuple] = None
+
+
+class DetectionDeduplicator:
+    def __init__(self, radius_m: float = 5.0, window_s: float = 120.0):
+        self.radius_m = radius_m
+        self.window_s = window_s
+        # radius as an angle on the sphere, i.e. in degrees of latitude
+        self.cell_lat = math.degrees(radius_m / geo.EARTH_RADIUS_M)
+        self._grid: Dict[tuple, List[Track]] = {}
+        self._tracks: Dict[int, Track] = {}
+        # (t_last at push, track) in arrival order, for expiring objects older than the window
+        self._expiry: deque = deque()
+        self._now = 0.0
+        self.seen = 0
+        self.merged = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.radius_m > 0 and self.window_s > 0
+
+    def _cell(self, mission_id: int, label: str, lat: float, lon: float) -> Tuple[tuple, float]:
+        # longitude cells are widened with latitude so they stay ~radius_m across
+        cell_lon = self.cell_lat / max(math.cos(math.radians(lat)), 1e-6)
+        return (mission_id, label, math.floor(lat / self.cell_lat), math.floor(lon / cell_lon)), cell_lon
+
+    def _nearest(self, mission_id: int, label: str, lat: float, lon: float, t: float) -> Optional[Track]:
+        (_, _, iy, ix), _ = self._cell(mission_id, label, lat, lon)
+        near = [track for dy in (-1, 0, 1) for dx in (-1, 0, 1)
+                for track in self._grid.get((mission_id, label, iy + dy, ix + dx), ())
+                if t - track.t_last <= self.window_s]
+        if not near:
+            return None
+        d = geo.haversine(lat, lon, np.fromiter((tr.row["lat"] for tr in near), dtype=np.float64, count=len(near)),
+                          np.fromiter((tr.row["lon"] for tr in near), dtype=np.float64, count=len(near)))
+        i = int(np.argmin(d))
+        return near[i] if d[i] <= self.radius_m else None
+
+    def merge(self, rows: List[dict], keys: Optional[List[int]] = None) -> Tuple[List[dict], List[Track]]:
+        """
+        Returns (rows to insert, already stored objects whose row changed). Inserted rows get
+        track_key and hits; merged hits update the object's row in place. With keys, the
+        track_key of the object each row ended up in is appended to it.
+        """
+        new_rows: List[dict] = []
+        updated: Dict[int, Track] = {}
+        for row in rows:
+            self.seen += 1
+            created_at = row.get("created_at") or datetime.utcnow()
+            t = _seconds(created_at)
+            self._now = max(self._now, t)
+            track = self._nearest(row["mission_id"], row["label"], row["lat"], row["lon"], t) if self.enabled else None
+            if track is None:
+                row = dict(row, created_at=created_at, last_seen=created_at, hits=1, track_key=secrets.randbits(63))
+                new_rows.append(row)
+                if keys is not None:
+                    keys.append(row["track_key"])
+                if self.enabled:
+                    self._add(Track(row, self._cell(row["mission_id"], row["label"], row["lat"], row["lon"])[0], t))
+                continue
+            self.merged += 1
+            r = track.row
+            if keys is not None:
+                keys.append(r["track_key"])
+            hits = r["hits"] + 1
+            r["lat"] += (row["lat"] - r["lat"]) / hits
+            r["lon"] += (row["lon"] - r["lon"]) / hits
+            r["hits"] = hits
+            if row.get("score") is not None and (r.get("score") is None or row["score"] > r["score"]):
+                r["score"] = row["score"]
+            if created_at > r["last_seen"]:
+                r["last_seen"] = created_at
+            track.t_last = max(track.t_last, t)
+            self._expiry.append((track.t_last, track))
+            cell = self._cell(r["mission_id"], r["label"], r["lat"], r["lon"])[0]
+            if cell != track.cell:
+                self._unlink(track)
+                track.cell = cell
+                self._grid.setdefault(cell, []).append(track)
+            if track.state != BUFFERED:
+                updated[r["track_key"]] = track
+        self._expire()
+        return new_rows, list(updated.values())
+
+    def _add(self, track: Track):
+        self._grid.setdefault(track.cell, []).append(track)
+        self._tracks[track.row["track_key"]] = track
+        self._expiry.append((track.t_last, track))
+
+    def _expire(self):
+        horizon = self._now - self.window_s
+        while self._expiry and self._expiry[0][0] < horizon:
+            _, track = self._expiry.popleft()
+            if track.t_last >= horizon or self._tracks.get(track.row["track_key"]) is not track:
+                continue  # seen again since (a later entry covers it), or already gone
+            del self._tracks[track.row["track_key"]]
+            self._unlink(track)
+
+    def _unlink(self, track: Track):
+        cell = self._grid[track.cell]
+        cell.remove(track)
+        if not cell:
+            del self._grid[track.cell]
+
+    def set_state(self, rows: List[dict], state: int):
+        """rows are the objects' rows; for WRITTEN, the copies that were committed."""
+        for row in rows:
+            track = self._tracks.get(row.get("track_key"))
+            if track is not None:
+                track.state = state
+                if state == WRITTEN:
+                    track.stored = (row["lat"], row["lon"], row.get("score"))
+
+    def discard(self, rows: List[dict]):
+        """Forget the objects of rows that will never be stored; later hits start new objects."""
+        for row in rows:
+            track = self._tracks.pop(row.get("track_key"), None)
+            if track is not None:
+                self._unlink(track)
+
+    def stats(self) -> dict:
+        return {
+            "radius_m": self.radius_m,
+            "window_s": self.window_s,
+            "seen": self.seen,
+            "merged": self.merged,
+            "merge_rate": round(self.merged / self.seen, 4) if self.seen else 0.0,
+            "tracked": len(self._tracks),
+            "cells": len(self._grid),
+        }
+
+
+detection_dedup = DetectionDeduplicator(settings.DETECTION_DEDUP_RADIUS_M, settings.DETECTION_DEDUP_WINDOW_S)
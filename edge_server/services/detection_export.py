@@ -0,0 +1,542 @@
+# edge_server/services/detection_export.py
+# Analytics export of detections (or a mission's recorded telemetry) to gzip-compressed CSV,
+# Parquet or Arrow IPC. Rows are read through a server-side cursor in partitions and written
+# as fixed-size record batches (one Parquet row group each), so memory stays flat however
+# large the table; per-label summary statistics are accumulated in the same pass.
+#
+#   python -m edge_server.services.detection_export --mission 3 --format parquet -o mission3.parquet
+import argparse
+import asyncio
+import csv
+import io
+import json
+import operator
+import secrets
+import sys
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from edge_server.config import settings
+from edge_server.database.models import Detection, TelemetryChunk
+from edge_server.services.telemetry_store import RAW, unpack
+
+CSV_GZ = "csv.gz"
+PARQUET = "parquet"
+ARROW = "arrow"
+FORMATS = (CSV_GZ, PARQUET, ARROW)
+
+DETECTIONS = "detections"
+TELEMETRY = "telemetry"
+DATASETS = (DETECTIONS, TELEMETRY)
+
+MEDIA_TYPES = {
+    CSV_GZ: "application/gzip",
+    PARQUET: "application/vnd.apache.parquet",
+    ARROW: "application/vnd.apache.arrow.stream",
+}
+
+# column name -> type; timestamps are UTC milliseconds
+COLUMNS = {
+    DETECTIONS: (("id", "int64"), ("mission_id", "int64"), ("created_at", "timestamp"), ("last_seen", "timestamp"),
+                 ("lat", "float64"), ("lon", "float64"), ("label", "string"), ("score", "float64"),
+                 ("hits", "int64"), ("track_key", "int64")),
+    TELEMETRY: (("t", "timestamp"), ("lat", "float64"), ("lon", "float64"), ("alt", "float64"),
+                ("battery", "float64")),
+}
+
+SUMMARIES_KEPT = 64
+# telemetry is read as raw chunks of up to TELEMETRY_CHUNK_MAX_SAMPLES samples each
+TELEMETRY_FETCH_CHUNKS = 16
+
+
+class ExportError(ValueError):
+    pass
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportError("Parquet and Arrow export need pyarrow (pip install pyarrow); format=csv.gz works without")
+    return pa, pq
+
+
+def check_format(fmt: str):
+    if fmt not in FORMATS:
+        raise ExportError(f"format must be one of {FORMATS}")
+    if fmt != CSV_GZ:
+        _pyarrow()
+
+
+# queries
+
+
+def detections_query(mission_id: Optional[int] = None, since: Optional[datetime] = None,
+                     until: Optional[datetime] = None, label: Optional[str] = None):
+    d = Detection
+    q = select(d.id, d.mission_id, d.created_at, d.last_seen, d.lat, d.lon, d.label, d.score, d.hits, d.track_key)
+    if mission_id is not None:
+        q = q.where(d.mission_id == mission_id)
+    if since is not None:
+        q = q.where(d.created_at >= since)
+    if until is not None:
+        q = q.where(d.created_at < until)
+    if label is not None:
+        q = q.where(d.label == label)
+    # with a mission the (mission_id, created_at) index gives the order for free
+    return q.order_by(d.created_at, d.id) if mission_id is not None else q.order_by(d.id)
+
+
+def telemetry_query(mission_id: int, since: Optional[float] = None, until: Optional[float] = None):
+    c = TelemetryChunk
+    q = select(c.data).where(c.mission_id == mission_id, c.resolution == RAW)
+    if since is not None:
+        q = q.where(c.t_end >= since)
+    if until is not None:
+        q = q.where(c.t_start < until)
+    return q.order_by(c.t_start, c.id)
+
+
+def _ms(values) -> np.ndarray:
+    """datetimes (naive UTC) or None -> datetime64[ms] (None becomes NaT)."""
+    return np.array(values, dtype="datetime64[ms]")
+
+
+# writers: write(batch) / close() return the bytes to send next
+
+
+class CsvGzWriter:
+    def __init__(self, columns):
+        self.names = [name for name, _ in columns]
+        self.types = [kind for _, kind in columns]
+        self._zip = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+        self._header = True
+
+    def write(self, batch: Dict[str, object]) -> bytes:
+        buf = io.StringIO()
+        w = csv.writer(buf, lineterminator="\n")
+        if self._header:
+            w.writerow(self.names)
+            self._header = False
+        cols = []
+        for name, kind in zip(self.names, self.types):
+            col = batch[name]
+            if kind == "timestamp":
+                text = np.datetime_as_string(col, unit="ms")
+                cols.append(np.where(np.isnat(col), "", text).tolist())
+            elif kind == "float64":
+                cols.append(["" if v != v else repr(v) for v in col.tolist()])
+            else:
+                cols.append(["" if v is None else v for v in col])
+        w.writerows(zip(*cols))
+        return self._zip.compress(buf.getvalue().encode())
+
+    def close(self) -> bytes:
+        return self._zip.compress(b"") + self._zip.flush()
+
+
+class _Sink(io.RawIOBase):
+    """File object that pyarrow writes into; take() hands over what was written so far."""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+
+    def writable(self):
+        return True
+
+    def write(self, b) -> int:
+        self._parts.append(bytes(b))
+        return len(b)
+
+    def take(self) -> bytes:
+        out = b"".join(self._parts)
+        self._parts.clear()
+        return out
+
+
+class ArrowWriter:
+    """Parquet (one row group per batch, zstd) or Arrow IPC stream."""
+
+    def __init__(self, columns, fmt: str):
+        pa, pq = _pyarrow()
+        self.pa = pa
+        types = {"int64": pa.int64(), "float64": pa.float64(), "string": pa.string(),
+                 "timestamp": pa.timestamp("ms", tz="UTC")}
+        self.schema = pa.schema([(name, types[kind]) for name, kind in columns])
+        self.kinds = dict(columns)
+        self._sink = _Sink()
+        if fmt == PARQUET:
+            self._writer = pq.ParquetWriter(self._sink, self.schema, compression="zstd")
+        else:
+            self._writer = pa.ipc.new_stream(self._sink, self.schema)
+
+    def write(self, batch: Dict[str, object]) -> bytes:
+        pa = self.pa
+        arrays = []
+        for field in self.schema:
+            col = batch[field.name]
+            if self.kinds[field.name] == "timestamp":
+                arrays.append(pa.array(col.astype("int64"), type=pa.int64(), mask=np.isnat(col)).cast(field.type))
+            elif self.kinds[field.name] == "float64":
+                arrays.append(pa.array(col, type=field.type, from_pandas=True))
+            else:
+                arrays.append(pa.array(col, type=field.type))
+        self._writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+        return self._sink.take()
+
+    def close(self) -> bytes:
+        self._writer.close()
+        return self._sink.take()
+
+
+def make_writer(dataset: str, fmt: str):
+    check_format(fmt)
+    return CsvGzWriter(COLUMNS[dataset]) if fmt == CSV_GZ else ArrowWriter(COLUMNS[dataset], fmt)
+
+
+# summaries
+
+
+def _fmin(a: float, b: float) -> float:
+    return b if a != a else a if b != b else min(a, b)
+
+
+def _fmax(a: float, b: float) -> float:
+    return b if a != a else a if b != b else max(a, b)
+
+
+# how the LabelSummary fields of two batches combine
+_MERGE = (operator.add, operator.add, operator.add, operator.add, _fmin, _fmax, min, max, min, min, max, max)
+
+
+class LabelSummary:
+    """Per-label count, hits, score statistics, first / last sighting and bounding box."""
+
+    def __init__(self):
+        self.labels: Dict[str, list] = {}
+
+    def add(self, batch: Dict[str, object]):
+        labels = np.asarray(batch["label"], dtype=object)
+        if not len(labels):
+            return
+        uniq, inv = np.unique(labels, return_inverse=True)
+        order = np.argsort(inv, kind="stable")
+        starts = np.flatnonzero(np.r_[True, np.diff(inv[order]) != 0])
+        count = np.diff(np.r_[starts, len(order)])
+
+        def reduce(ufunc, values):
+            return ufunc.reduceat(values[order], starts)
+
+        score = batch["score"]
+        valid = ~np.isnan(score)
+        created = batch["created_at"].astype("int64")
+        seen = np.where(np.isnat(batch["last_seen"]), created, batch["last_seen"].astype("int64"))
+        stats = zip(
+            count, reduce(np.add, np.asarray(batch["hits"], dtype=np.int64)),
+            reduce(np.add, valid.astype(np.int64)), reduce(np.add, np.where(valid, score, 0.0)),
+            reduce(np.fmin, np.where(valid, score, np.nan)), reduce(np.fmax, np.where(valid, score, np.nan)),
+            reduce(np.minimum, created), reduce(np.maximum, seen),
+            reduce(np.minimum, batch["lat"]), reduce(np.minimum, batch["lon"]),
+            reduce(np.maximum, batch["lat"]), reduce(np.maximum, batch["lon"]),
+        )
+        for label, row in zip(uniq.tolist(), stats):
+            acc = self.labels.get(label)
+            row = [v.item() for v in row]
+            if acc is None:
+                self.labels[label] = row
+            else:
+                self.labels[label] = [merge(a, b) for merge, a, b in zip(_MERGE, acc, row)]
+
+    def as_dict(self) -> dict:
+        out = {}
+        for label, (count, hits, n_score, score_sum, score_min, score_max, first, last,
+                    min_lat, min_lon, max_lat, max_lon) in sorted(self.labels.items()):
+            out[label] = {
+                "count": count,
+                "hits": hits,
+                "score_mean": round(score_sum / n_score, 4) if n_score else None,
+                "score_min": None if score_min != score_min else float(score_min),
+                "score_max": None if score_max != score_max else float(score_max),
+                "first_seen": _iso_ms(first),
+                "last_seen": _iso_ms(last),
+                "bbox": [min_lon, min_lat, max_lon, max_lat],
+            }
+        return out
+
+
+class TelemetrySummary:
+    def __init__(self):
+        self.samples = 0
+        self.first = self.last = None
+        self.sums = np.zeros(4)
+        self.counts = np.zeros(4, dtype=np.int64)
+        self.mins = np.full(4, np.inf)
+        self.maxs = np.full(4, -np.inf)
+        self.battery_first = self.battery_last = None
+
+    def add(self, batch: Dict[str, object]):
+        t = batch["t"].astype("int64")
+        if not len(t):
+            return
+        self.samples += len(t)
+        self.first = int(t[0]) if self.first is None else self.first
+        self.last = int(t[-1])
+        cols = np.vstack([batch[f] for f in ("lat", "lon", "alt", "battery")])
+        valid = ~np.isnan(cols)
+        self.counts += valid.sum(axis=1)
+        self.sums += np.where(valid, cols, 0.0).sum(axis=1)
+        self.mins = np.fmin(self.mins, np.nanmin(np.where(valid, cols, np.inf), axis=1))
+        self.maxs = np.fmax(self.maxs, np.nanmax(np.where(valid, cols, -np.inf), axis=1))
+        battery = batch["battery"][~np.isnan(batch["battery"])]
+        if len(battery):
+            self.battery_first = float(battery[0]) if self.battery_first is None else self.battery_first
+            self.battery_last = float(battery[-1])
+
+    def as_dict(self) -> dict:
+        def stat(i):
+            if not self.counts[i]:
+                return None
+            return {"min": float(self.mins[i]), "max": float(self.maxs[i]), "mean": float(self.sums[i] / self.counts[i])}
+
+        return {
+            "samples": self.samples,
+            "first": _iso_ms(self.first),
+            "last": _iso_ms(self.last),
+            "lat": stat(0), "lon": stat(1), "alt": stat(2), "battery": stat(3),
+            "battery_first": self.battery_first,
+            "battery_last": self.battery_last,
+        }
+
+
+def _iso_ms(ms: Optional[int]) -> Optional[str]:
+    if ms is None:
+        return None
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).replace(tzinfo=None).isoformat(timespec="milliseconds")
+
+
+# export
+
+
+class Export:
+    """
+    One export: feed() takes a partition of cursor rows and returns the encoded bytes of every
+    complete batch_rows batch, finish() the rest plus the file trailer.
+    """
+
+    def __init__(self, dataset: str, fmt: str, batch_rows: int = 65536,
+                 since: Optional[float] = None, until: Optional[float] = None):
+        if dataset not in DATASETS:
+            raise ExportError(f"dataset must be one of {DATASETS}")
+        self.dataset = dataset
+        self.fmt = fmt
+        self.batch_rows = batch_rows
+        self.since, self.until = since, until  # telemetry: sample time filter inside the chunks
+        self.writer = make_writer(dataset, fmt)
+        self.summary = LabelSummary() if dataset == DETECTIONS else TelemetrySummary()
+        self.rows = 0
+        self.batches = 0
+        self.bytes = 0
+        self._pending: List = []
+        self._pending_rows = 0
+        self.started = time.perf_counter()
+
+    def _columns(self, parts: List) -> Dict[str, object]:
+        if self.dataset == DETECTIONS:
+            rows = [r for part in parts for r in part]
+            cols = list(zip(*rows))
+            return {
+                "id": list(cols[0]), "mission_id": list(cols[1]),
+                "created_at": _ms(cols[2]), "last_seen": _ms(cols[3]),
+                "lat": np.array(cols[4], dtype=np.float64), "lon": np.array(cols[5], dtype=np.float64),
+                "label": list(cols[6]), "score": np.array(cols[7], dtype=np.float64),
+                "hits": [1 if h is None else h for h in cols[8]], "track_key": list(cols[9]),
+            }
+        raw = np.concatenate(parts, axis=1)
+        return {"t": np.round(raw[0] * 1000).astype("int64").astype("datetime64[ms]"),
+                "lat": raw[1], "lon": raw[2], "alt": raw[3], "battery": raw[4]}
+
+    def _split(self, rows):
+        """Normalised pieces of a cursor partition: row lists, or raw telemetry columns."""
+        if self.dataset == DETECTIONS:
+            return [(list(rows), len(rows))]
+        out = []
+        for (blob,) in rows:
+            cols = unpack(blob, RAW)
+            keep = np.ones(cols.shape[1], dtype=bool)
+            if self.since is not None:
+                keep &= cols[0] >= self.since
+            if self.until is not None:
+                keep &= cols[0] < self.until
+            if keep.any():
+                out.append((cols[:, keep], int(keep.sum())))
+        return out
+
+    def _emit(self, n: int) -> bytes:
+        """Write the first n pending rows as one batch."""
+        if self.dataset == DETECTIONS:
+            rows = [r for part in self._pending for r in part]
+            head, tail = rows[:n], rows[n:]
+            self._pending = [tail] if tail else []
+            parts = [head]
+        else:
+            raw = np.concatenate(self._pending, axis=1)
+            parts = [raw[:, :n]]
+            self._pending = [raw[:, n:]] if raw.shape[1] > n else []
+        self._pending_rows -= n
+        batch = self._columns(parts)
+        self.summary.add(batch)
+        self.rows += n
+        self.batches += 1
+        data = self.writer.write(batch)
+        self.bytes += len(data)
+        return data
+
+    def feed(self, rows) -> bytes:
+        out = []
+        for piece, n in self._split(rows):
+            self._pending.append(piece)
+            self._pending_rows += n
+            while self._pending_rows >= self.batch_rows:
+                out.append(self._emit(self.batch_rows))
+        return b"".join(out)
+
+    def finish(self) -> bytes:
+        out = self._emit(self._pending_rows) if self._pending_rows else b""
+        tail = self.writer.close()
+        self.bytes += len(tail)
+        return out + tail
+
+    def report(self) -> dict:
+        return {
+            "dataset": self.dataset,
+            "format": self.fmt,
+            "rows": self.rows,
+            "batches": self.batches,
+            "bytes": self.bytes,
+            "seconds": round(time.perf_counter() - self.started, 3),
+            "summary": self.summary.as_dict(),
+        }
+
+
+class ExportRegistry:
+    """Reports of recent HTTP exports, so the summary can be fetched once the download ends."""
+
+    def __init__(self, kept: int = SUMMARIES_KEPT):
+        self.kept = kept
+        self._reports: "OrderedDict[str, dict]" = OrderedDict()
+
+    def begin(self, export: Export) -> str:
+        export_id = secrets.token_hex(8)
+        self._reports[export_id] = {"state": "running", "dataset": export.dataset, "format": export.fmt}
+        while len(self._reports) > self.kept:
+            self._reports.popitem(last=False)
+        return export_id
+
+    def end(self, export_id: str, export: Export, error: Optional[str] = None):
+        if error is None:
+            self._reports[export_id] = dict(export.report(), state="done")
+        else:
+            self._reports[export_id] = {"state": "failed", "detail": error, "rows": export.rows}
+
+    def get(self, export_id: str) -> Optional[dict]:
+        return self._reports.get(export_id)
+
+
+export_registry = ExportRegistry()
+
+
+async def stream(db: Session, query, export: Export, export_id: str) -> AsyncIterator[bytes]:
+    """Encoded file for a StreamingResponse; fetching and encoding run in the default executor."""
+    loop = asyncio.get_running_loop()
+    partition = TELEMETRY_FETCH_CHUNKS if export.dataset == TELEMETRY else settings.EXPORT_FETCH_ROWS
+    error = "download interrupted"
+    result = None
+    try:
+        result = await loop.run_in_executor(None, lambda: db.execute(query.execution_options(yield_per=partition)))
+        partitions = result.partitions(partition)
+
+        def step() -> Optional[bytes]:
+            rows = next(partitions, None)
+            return None if rows is None else export.feed(rows)
+
+        while (data := await loop.run_in_executor(None, step)) is not None:
+            if data:
+                yield data
+        yield await loop.run_in_executor(None, export.finish)
+        error = None
+    except Exception as e:
+        error = str(e)
+        raise
+    finally:
+        if result is not None:
+            result.close()
+        export_registry.end(export_id, export, error)
+
+
+# command line
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromtimestamp(float(value), tz=timezone.utc).replace(tzinfo=None)
+    except ValueError:
+        dt = datetime.fromisoformat(value)
+        return dt.astimezone(timezone.utc).replace(tzinfo=None) if dt.tzinfo else dt
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export detections or mission telemetry for analysis")
+    parser.add_argument("--dataset", choices=DATASETS, default=DETECTIONS)
+    parser.add_argument("--format", choices=FORMATS, default=CSV_GZ)
+    parser.add_argument("--mission", type=int, help="mission id (required for telemetry)")
+    parser.add_argument("--since", help="epoch seconds or ISO time (UTC)")
+    parser.add_argument("--until", help="epoch seconds or ISO time (UTC)")
+    parser.add_argument("--label")
+    parser.add_argument("--batch-rows", type=int, default=settings.EXPORT_BATCH_ROWS)
+    parser.add_argument("-o", "--output", required=True, help="output file; the summary goes to <output>.summary.json")
+    args = parser.parse_args()
+    if args.dataset == TELEMETRY and args.mission is None:
+        parser.error("--mission is required for telemetry")
+
+    from edge_server.database.db import SessionLocal
+
+    since, until = _parse_time(args.since), _parse_time(args.until)
+    try:
+        if args.dataset == DETECTIONS:
+            export = Export(DETECTIONS, args.format, args.batch_rows)
+            query = detections_query(args.mission, since, until, args.label)
+            partition = settings.EXPORT_FETCH_ROWS
+        else:
+            epoch = [None if v is None else v.replace(tzinfo=timezone.utc).timestamp() for v in (since, until)]
+            export = Export(TELEMETRY, args.format, args.batch_rows, *epoch)
+            query = telemetry_query(args.mission, *epoch)
+            partition = TELEMETRY_FETCH_CHUNKS
+    except ExportError as e:
+        parser.error(str(e))
+    db = SessionLocal()
+    try:
+        with open(args.output, "wb") as f:
+            for rows in db.execute(query.execution_options(yield_per=partition)).partitions(partition):
+                f.write(export.feed(rows))
+            f.write(export.finish())
+    finally:
+        db.close()
+    report = export.report()
+    with open(args.output + ".summary.json", "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"{report['rows']} rows in {report['batches']} batches, {report['bytes']} bytes, {report['seconds']} s",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+# edge_server/services/detection_tiles.py
+import asyncio
+import math
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import orjson
+
+from edge_server.utils import geo
+
+MAX_MERCATOR_LAT = 85.05112878
+
+
+def tile_xy(lat: np.ndarray, lon: np.ndarray, z: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Web-mercator (slippy map) tile indices for arrays of coordinates."""
+    n = 1 << z
+    lat_r = np.radians(np.clip(lat, -MAX_MERCATOR_LAT, MAX_MERCATOR_LAT))
+    x = np.floor((lon + 180.0) / 360.0 * n)
+    y = np.floor((1.0 - np.log(np.tan(lat_r) + 1.0 / np.cos(lat_r)) / np.pi) / 2.0 * n)
+    return np.clip(x, 0, n - 1).astype(np.int64), np.clip(y, 0, n - 1).astype(np.int64)
+
+
+def _bin(keys: np.ndarray, score: np.ndarray):
+    """Count and score sums per unique key. Missing scores are NaN and do not count towards the mean."""
+    uniq, inv = np.unique(keys, return_inverse=True)
+    has_score = ~np.isnan(score)
+    counts = np.bincount(inv, minlength=len(uniq))
+    sums = np.bincount(inv, weights=np.where(has_score, score, 0.0), minlength=len(uniq))
+    scored = np.bincount(inv, weights=has_score, minlength=len(uniq))
+    return uniq, counts, sums, scored
+
+
+def bin_tiles(lat: np.ndarray, lon: np.ndarray, score: np.ndarray, z: int) -> Dict[int, list]:
+    x, y = tile_xy(lat, lon, z)
+    uniq, counts, sums, scored = _bin((x << z) | y, score)
+    return {int(k): [int(c), float(s), int(n)] for k, c, s, n in zip(uniq, counts, sums, scored)}
+
+
+def bin_grid(lat: np.ndarray, lon: np.ndarray, score: np.ndarray, cell_m: float) -> List[dict]:
+    """Square-ish cells of cell_m metres (longitude step scaled at the mean latitude)."""
+    if len(lat) == 0:
+        return []
+    cell_lat = math.degrees(cell_m / geo.EARTH_RADIUS_M)
+    cell_lon = cell_lat / max(np.cos(np.radians(lat.mean())), 1e-6)
+    iy = np.floor(lat / cell_lat).astype(np.int64)
+    ix = np.floor(lon / cell_lon).astype(np.int64)
+    uniq, inv = np.unique(np.stack([iy, ix], axis=1), axis=0, return_inverse=True)
+    inv = inv.reshape(-1)
+    has_score = ~np.isnan(score)
+    counts = np.bincount(inv, minlength=len(uniq))
+    sums = np.bincount(inv, weights=np.where(has_score, score, 0.0), minlength=len(uniq))
+    scored = np.bincount(inv, weights=has_score, minlength=len(uniq))
+    return [
+        {
+            "lat": (cy + 0.5) * cell_lat,
+            "lon": (cx + 0.5) * cell_lon,
+            "count": int(c),
+            "mean_score": float(s / n) if n else None,
+        }
+        for (cy, cx), c, s, n in zip(uniq.tolist(), counts, sums, scored)
+    ]
+
+
+def tile_bounds(z: int, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> Tuple[int, int, int, int]:
+    """(x0, y0, x1, y1), inclusive, of the tiles covering a lat/lon box (tile y grows southwards)."""
+    x, y = tile_xy(np.array([max_lat, min_lat]), np.array([min_lon, max_lon]), z)
+    return int(x[0]), int(y[0]), int(x[1]), int(y[1])
+
+
+def tiles_out(z: int, bins: Dict[int, list], bounds: Optional[Tuple[int, int, int, int]] = None) -> List[dict]:
+    mask = (1 << z) - 1
+    out = []
+    for k, (c, s, n) in sorted(bins.items()):
+        x, y = k >> z, k & mask
+        if bounds is not None and not (bounds[0] <= x <= bounds[2] and bounds[1] <= y <= bounds[3]):
+            continue
+        out.append({"x": x, "y": y, "count": c, "mean_score": s / n if n else None})
+    return out
+
+
+class TileBuild:
+    """An entry being computed from the database; fresh until a commit for its mission is reported."""
+    __slots__ = ("mission_id", "fresh")
+
+    def __init__(self, mission_id: Optional[int]):
+        self.mission_id = mission_id
+        self.fresh = True
+
+
+class TileCache:
+    """
+    Per (mission_id, zoom) tile aggregates. mission_id None means all missions.
+    Entries are built once from the database and then updated by add_detections() and
+    move_detections(), which the writers call after their commit. A build runs inside
+    building(): if detections of its mission are reported while it queries, its result may
+    or may not include them, so put() does not store it (the next request builds again).
+    With several workers, the others only learn which missions changed (see share_changes) and
+    drop those entries: a delta could arrive after a build that already counted the rows.
+    """
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[Optional[int], int], Dict[int, list]]" = OrderedDict()
+        self._builds: List[TileBuild] = []
+        self._lock = threading.Lock()
+        # called with the changed mission ids after each update
+        self.on_change: Optional[Callable[[set], None]] = None
+
+    def get(self, mission_id: Optional[int], z: int,
+            bounds: Optional[Tuple[int, int, int, int]] = None) -> Optional[List[dict]]:
+        with self._lock:
+            bins = self._entries.get((mission_id, z))
+            if bins is None:
+                return None
+            self._entries.move_to_end((mission_id, z))
+            return tiles_out(z, bins, bounds)
+
+    @contextmanager
+    def building(self, mission_id: Optional[int]):
+        build = TileBuild(mission_id)
+        with self._lock:
+            self._builds.append(build)
+        try:
+            yield build
+        finally:
+            with self._lock:
+                self._builds.remove(build)
+
+    def put(self, mission_id: Optional[int], z: int, bins: Dict[int, list], build: TileBuild) -> bool:
+        with self._lock:
+            if not build.fresh:
+                return False
+            self._entries[(mission_id, z)] = bins
+            self._entries.move_to_end((mission_id, z))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return True
+
+    def add_detections(self, rows: Iterable):
+        """Committed rows: dicts or Detection objects with mission_id, lat, lon, score."""
+        rows = [r if isinstance(r, dict) else {"mission_id": r.mission_id, "lat": r.lat, "lon": r.lon, "score": r.score}
+                for r in rows]
+        self._update(rows, [])
+
+    def move_detections(self, moves: Iterable[tuple]):
+        """
+        Committed updates of stored rows (merged detections):
+        (mission_id, (lat, lon, score) before, (lat, lon, score) after).
+        """
+        added, removed = [], []
+        for mission_id, old, new in moves:
+            if old != new:
+                removed.append({"mission_id": mission_id, "lat": old[0], "lon": old[1], "score": old[2]})
+                added.append({"mission_id": mission_id, "lat": new[0], "lon": new[1], "score": new[2]})
+        self._update(added, removed)
+
+    def invalidate(self, missions: Iterable[Optional[int]]):
+        """Drop the entries covering detections of missions changed by another worker."""
+        missions = set(missions)
+        with self._lock:
+            self._stale_builds(missions)
+            for key in [k for k in self._entries if k[0] is None or k[0] in missions]:
+                del self._entries[key]
+
+    def _stale_builds(self, missions: set):
+        # caller holds the lock
+        for build in self._builds:
+            if build.mission_id is None or build.mission_id in missions:
+                build.fresh = False
+
+    def _update(self, added: List[dict], removed: List[dict]):
+        if not added and not removed:
+            return
+        missions = {r["mission_id"] for r in added} | {r["mission_id"] for r in removed}
+        with self._lock:
+            self._stale_builds(missions)
+            for (mission_id, z), bins in self._entries.items():
+                for rows, sign in ((added, 1), (removed, -1)):
+                    sel = [r for r in rows if mission_id is None or r["mission_id"] == mission_id]
+                    if not sel:
+                        continue
+                    lat = np.fromiter((r["lat"] for r in sel), dtype=np.float64, count=len(sel))
+                    lon = np.fromiter((r["lon"] for r in sel), dtype=np.float64, count=len(sel))
+                    score = np.fromiter((np.nan if r.get("score") is None else r["score"] for r in sel),
+                                        dtype=np.float64, count=len(sel))
+                    for k, (c, s, n) in bin_tiles(lat, lon, score, z).items():
+                        acc = bins.setdefault(k, [0, 0.0, 0])
+                        acc[0] += sign * c
+                        acc[1] += sign * s
+                        acc[2] += sign * n
+                        if acc[0] <= 0:
+                            del bins[k]
+        if self.on_change is not None:
+            self.on_change(missions)
+
+tile_cache = TileCache()
+
+
+def share_changes(broker):
+    """Make detections committed here drop the affected entries of the other workers. Call from the event loop."""
+    if not broker.distributed:
+        return
+    loop = asyncio.get_running_loop()
+    broker.subscribe("tiles.invalidate", lambda channel, data: tile_cache.invalidate(orjson.loads(data)))
+    # updates come from the detection writer's thread as well as from the loop
+    tile_cache.on_change = lambda missions: loop.call_soon_threadsafe(
+        broker.publish, "tiles.invalidate", orjson.dumps(list(missions)).decode())
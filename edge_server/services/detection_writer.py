@@ -0,0 +1,237 @@
+# edge_server/services/detection_writer.py
+import asyncio
+import secrets
+import time
+from typing import Dict, List, Optional
+
+from edge_server.config import settings
+from edge_server.database.db import SessionLocal
+from edge_server.database import crud
+from edge_server.services.detection_dedup import BUFFERED, IN_FLIGHT, WRITTEN, DetectionDeduplicator, Track, detection_dedup
+from edge_server.services.detection_tiles import tile_cache
+from edge_server.utils.logger import logger
+from edge_server.utils.metrics import LatencyStats
+
+
+class DetectionWriteError(RuntimeError):
+    """write(): the detection's row was dropped (or the writer stopped) before it was committed."""
+
+
+class DetectionWriter:
+    """
+    Write-behind buffer for detections.
+    Rows are collected in memory and written with one executemany per flush,
+    either when batch_size rows are pending or every flush_interval_ms.
+    submit() waits (backpressure) while max_pending rows are not yet written.
+    A batch whose write fails goes back to the front of the buffer and is tried again after
+    an exponential backoff, up to `retries` times, before it is dropped and counted as failed.
+    Submitted detections pass through the de-duplicator first: repeats of an object only
+    update its row (hits, best score, position), written with the next flush. Repeats of an
+    object whose row is not committed yet change the buffered row; only committed rows get UPDATEs.
+    write() is submit() for one detection that also waits until its object's row is committed.
+    """
+
+    def __init__(self, batch_size: int = 500, flush_interval_ms: int = 250, max_pending: int = 20000,
+                 dedup: Optional[DetectionDeduplicator] = None, retries: int = 5, retry_backoff_ms: int = 100):
+        self.batch_size = batch_size
+        self.retries = retries
+        self.retry_backoff = retry_backoff_ms / 1000
+        self._attempts = 0
+        self.dedup = dedup
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_pending = max_pending
+        self._buffer: List[dict] = []
+        # objects already handed to the database whose row changed since
+        self._merged: Dict[int, Track] = {}
+        self._in_flight = 0
+        # write() callers by track_key, woken once their object's row is committed
+        self._waiters: Dict[int, List[asyncio.Future]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._wake: Optional[asyncio.Event] = None
+        self._space: Optional[asyncio.Condition] = None
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+        self.retried = 0
+        self.merges_written = 0
+        self.flush_time = LatencyStats()
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer) + self._in_flight
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._closing = False
+        self._wake = asyncio.Event()
+        self._space = asyncio.Condition()
+        self._task = asyncio.get_event_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        # flush on shutdown: the loop drains the buffer before it exits
+        self._closing = True
+        self._wake.set()
+        await self._task
+        self._task = None
+        while self._buffer or self._merged:
+            await self.flush()
+        self._settle(list(self._waiters), DetectionWriteError("DetectionWriter stopped"))
+
+    async def submit(self, rows: List[dict], timeout: Optional[float] = None, keys: Optional[List[int]] = None):
+        """keys: see DetectionDeduplicator.merge."""
+        if self._task is None or self._closing:
+            raise RuntimeError("DetectionWriter is not running")
+        async with self._space:
+            # a batch larger than max_pending is still accepted once the buffer is empty
+            await asyncio.wait_for(
+                self._space.wait_for(lambda: self.pending == 0 or self.pending + len(rows) <= self.max_pending),
+                timeout,
+            )
+            if self.dedup is not None:
+                rows, merged = self.dedup.merge(rows, keys)
+                self._merged.update((t.row["track_key"], t) for t in merged)
+            self._buffer.extend(rows)
+        if len(self._buffer) >= self.batch_size:
+            self._wake.set()
+
+    async def write(self, row: dict, timeout: Optional[float] = None) -> int:
+        """
+        Submit one detection and wait until its object's row is committed: inserted, or updated
+        when the detection merged into a stored object. Returns the object's track_key.
+        Raises DetectionWriteError when the row could not be written.
+        """
+        keys: List[int] = []
+        if self.dedup is None:
+            row = dict(row, track_key=secrets.randbits(63), hits=1, last_seen=row.get("created_at"))
+            keys.append(row["track_key"])
+        await self.submit([row], timeout, keys)
+        # no await since the row was accepted, so its flush cannot have settled yet
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(keys[0], []).append(waiter)
+        self._wake.set()
+        await waiter
+        return keys[0]
+
+    def _settle(self, keys: List[Optional[int]], error: Optional[Exception] = None):
+        for key in keys:
+            if error is None and key in self._merged:
+                continue  # changed again meanwhile: settled when that update is committed
+            for waiter in self._waiters.pop(key, ()):
+                if waiter.done():
+                    continue
+                if error is None:
+                    waiter.set_result(None)
+                else:
+                    waiter.set_exception(error)
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            while self._buffer or self._merged:
+                await self.flush()
+                if len(self._buffer) < self.batch_size and not self._closing:
+                    break
+
+    async def flush(self):
+        rows = self._buffer[:self.batch_size]
+        del self._buffer[:self.batch_size]
+        # objects whose insert failed are BUFFERED again; their row already holds the merges
+        merged = [t for t in self._merged.values() if t.state == WRITTEN]
+        self._merged.clear()
+        if not rows and not merged:
+            return
+        merges = [{k: t.row[k] for k in MERGE_FIELDS} for t in merged]
+        # committed and new (lat, lon, score) of each merged object, to move it in the tile cache
+        moves = [(t.row["mission_id"], t.stored, (m["lat"], m["lon"], m["score"])) for t, m in zip(merged, merges)]
+        self._in_flight = len(rows)
+        batch = rows
+        if self.dedup is not None:
+            # later hits on these objects become UPDATEs; the writer thread gets its own copies
+            self.dedup.set_state(rows, IN_FLIGHT)
+            rows = [dict(r) for r in rows]
+        start = time.perf_counter()
+        delay = 0.0
+        try:
+            await asyncio.get_event_loop().run_in_executor(None, _write_rows, rows, merges, moves)
+            self.written += len(rows)
+            self.merges_written += len(merges)
+            self.batches += 1
+            self._attempts = 0
+            if self.dedup is not None:
+                self.dedup.set_state(rows, WRITTEN)
+            for t, (_, _, new) in zip(merged, moves):
+                t.stored = new
+            self._settle([r.get("track_key") for r in rows] + [m["track_key"] for m in merges])
+        except Exception as e:
+            self._attempts += 1
+            if self.dedup is not None:
+                # not in the table: hits until the retry update the buffered rows again
+                self.dedup.set_state(batch, BUFFERED)
+            if self._attempts <= self.retries:
+                # usually a busy database: keep the batch (first in line) and give the other writer time
+                delay = self.retry_backoff * 2 ** (self._attempts - 1)
+                self._buffer[:0] = batch
+                for t in merged:
+                    self._merged.setdefault(t.row["track_key"], t)
+                self.retried += len(batch)
+                logger.warning("DetectionWriter: writing %s detections failed (%s), retry %s of %s in %.2f s",
+                               len(rows), e, self._attempts, self.retries, delay)
+            else:
+                self._attempts = 0
+                self.failed += len(rows)
+                if self.dedup is not None:
+                    self.dedup.discard(batch)
+                self._settle([r.get("track_key") for r in rows] + [m["track_key"] for m in merges],
+                             DetectionWriteError(f"detections could not be written: {e}"))
+                logger.exception("DetectionWriter: dropping %s detections after %s retries", len(rows), self.retries)
+        finally:
+            self._in_flight = 0
+            self.flush_time.observe(time.perf_counter() - start)
+            async with self._space:
+                self._space.notify_all()
+        if delay:
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        return {
+            "pending": self.pending,
+            "written": self.written,
+            "batches": self.batches,
+            "failed": self.failed,
+            "retried": self.retried,
+            "merges_written": self.merges_written,
+            "flush": self.flush_time.as_dict(),
+            "dedup": self.dedup.stats() if self.dedup is not None else None,
+        }
+
+
+MERGE_FIELDS = ("track_key", "lat", "lon", "hits", "score", "last_seen")
+
+
+def _write_rows(rows: List[dict], merges: List[dict], moves: List[tuple]):
+    db = SessionLocal()
+    try:
+        crud.create_detections(db, rows, merges)
+    finally:
+        db.close()
+    # only once committed, so a tile entry built meanwhile is not stored (see TileCache)
+    tile_cache.add_detections(rows)
+    tile_cache.move_detections(moves)
+
+
+detection_writer = DetectionWriter(
+    batch_size=settings.DETECTION_BATCH_SIZE,
+    flush_interval_ms=settings.DETECTION_FLUSH_MS,
+    max_pending=settings.DETECTION_MAX_PENDING,
+    dedup=detection_dedup,
+    retries=settings.DETECTION_WRITE_RETRIES,
+    retry_backoff_ms=settings.DETECTION_RETRY_BACKOFF_MS,
+)
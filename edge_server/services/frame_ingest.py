@@ -0,0 +1,260 @@
+# edge_server/services/frame_ingest.py
+# Camera frames pushed by a drone (WebSocket or chunked HTTP) -> detection engine.
+# Each mission stream keeps at most one frame waiting: a frame that arrives while the
+# previous one is still waiting replaces it, so when inference falls behind frames are
+# skipped (newest kept) instead of queueing. JPEG frames are only decoded once picked for
+# detection, so skipped frames cost nothing to decode.
+import asyncio
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+from edge_server.ai import detect
+from edge_server.ai.preprocess import FORMATS, decode_jpeg, frame_bytes
+from edge_server.config import settings
+from edge_server.services.telemetry_hub import telemetry_hub
+from edge_server.services.telemetry_store import RECENT_POSITIONS, interpolate_position, telemetry_store
+from edge_server.utils.logger import logger
+from edge_server.utils.metrics import Histogram
+
+JPEG = "jpeg"
+INGEST_FORMATS = (JPEG,) + tuple(FORMATS)
+# one slot being filled by the receiver, one holding the waiting frame, one under detection
+RING_SLOTS = 3
+CLOSED_KEPT = 256
+
+
+class IngestBusy(Exception):
+    """Raised when every ring slot of a mission stream is in use (too many concurrent uploads)."""
+
+
+class _Frame:
+    __slots__ = ("buf", "slot", "width", "height", "fmt", "t", "received")
+
+    def __init__(self, buf, slot: Optional[int], width: int, height: int, fmt: str, t: float):
+        self.buf = buf
+        self.slot = slot
+        self.width = width
+        self.height = height
+        self.fmt = fmt
+        self.t = t
+        self.received = time.perf_counter()
+
+
+class FrameStream:
+    """Per-mission ingest state: preallocated frame ring, the waiting frame and the detection task."""
+
+    def __init__(self, mission_id: int, slot_bytes: int, fps_window: float, track_remote: bool,
+                 idle_timeout: float, on_idle: Callable[["FrameStream"], None]):
+        self.mission_id = mission_id
+        self.slot_bytes = slot_bytes
+        self.fps_window = fps_window
+        self.idle_timeout = idle_timeout
+        self.on_idle = on_idle
+        # slots are allocated on first use and then reused for the life of the stream
+        self.ring: List[Optional[bytearray]] = [None] * RING_SLOTS
+        self._free: List[int] = list(range(RING_SLOTS))
+        self._waiting: Optional[_Frame] = None
+        self._ready = asyncio.Event()
+        self.connections = 0
+        self.received = 0
+        self.processed = 0
+        self.skipped = 0
+        self.failed = 0
+        self.bytes = 0
+        self.detections = 0
+        self.untagged = 0
+        self.opened_at = time.time()
+        self._arrivals: deque = deque(maxlen=4096)
+        self.decode_time = Histogram()
+        self.detect_time = Histogram()
+        self.frame_age = Histogram()
+        # positions relayed from the worker that runs the mission (multi-worker setups)
+        self._positions: deque = deque(maxlen=RECENT_POSITIONS)
+        self._tasks = [asyncio.create_task(self._consume())]
+        if track_remote:
+            self._tasks.append(asyncio.create_task(self._track_positions()))
+
+    # receiver side
+
+    def take_slot(self) -> memoryview:
+        """A free ring slot to assemble a frame in (chunked HTTP); hand it over with put(), or release_slot()."""
+        if not self._free:
+            # several concurrent uploads for one mission: recycle the waiting frame's slot
+            self._drop_waiting()
+        if not self._free:
+            raise IngestBusy()
+        i = self._free.pop()
+        if self.ring[i] is None:
+            self.ring[i] = bytearray(self.slot_bytes)
+        return memoryview(self.ring[i])
+
+    def slot_index(self, view: memoryview) -> int:
+        return next(i for i, b in enumerate(self.ring) if view.obj is b)
+
+    def release_slot(self, view: memoryview):
+        self._free.append(self.slot_index(view))
+
+    def put(self, buf, width: int, height: int, fmt: str, t: Optional[float] = None, slot: Optional[memoryview] = None):
+        """Offer a complete frame. buf is referenced, not copied; a frame still waiting is skipped."""
+        now = time.time()
+        self.received += 1
+        self.bytes += len(buf)
+        self._arrivals.append(now)
+        self._drop_waiting()
+        self._waiting = _Frame(buf, None if slot is None else self.slot_index(slot), width, height, fmt,
+                               now if t is None else t)
+        self._ready.set()
+
+    def _drop_waiting(self):
+        frame, self._waiting = self._waiting, None
+        if frame is not None:
+            self.skipped += 1
+            self._recycle(frame)
+
+    def _recycle(self, frame: _Frame):
+        if frame.slot is not None:
+            self._free.append(frame.slot)
+
+    # detection side
+
+    async def _consume(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            while self._waiting is None:
+                self._ready.clear()
+                try:
+                    await asyncio.wait_for(self._ready.wait(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    # HTTP pushes leave no connection open, so streams outlive requests until idle
+                    if self.connections <= 0 and self._waiting is None:
+                        self.on_idle(self)
+                        return
+            frame, self._waiting = self._waiting, None
+            self.frame_age.observe(time.perf_counter() - frame.received)
+            try:
+                buf, fmt, width, height = frame.buf, frame.fmt, frame.width, frame.height
+                if fmt == JPEG:
+                    start = time.perf_counter()
+                    img, fmt = await loop.run_in_executor(None, decode_jpeg, buf)
+                    self.decode_time.observe(time.perf_counter() - start)
+                    height, width = img.shape[:2]
+                    buf = img.data
+                start = time.perf_counter()
+                result = await detect.detect_and_record(self.mission_id, buf, width, height, fmt, frame.t,
+                                                        locate=self.locate)
+                self.detect_time.observe(time.perf_counter() - start)
+                self.processed += 1
+                self.detections += result["detections"]
+                self.untagged += result["untagged"]
+            except asyncio.CancelledError:
+                raise
+            except detect.EngineBusy:
+                self.skipped += 1
+            except Exception as e:
+                self.failed += 1
+                logger.warning("Frame for mission %s failed: %s", self.mission_id, e)
+            finally:
+                self._recycle(frame)
+
+    def locate(self, t: float):
+        pos = telemetry_store.position_at(self.mission_id, t)
+        if pos is None and self._positions:
+            pos = interpolate_position(list(self._positions), t)
+        return pos
+
+    async def _track_positions(self):
+        sub = telemetry_hub.subscribe(self.mission_id)
+        try:
+            while True:
+                msg = (await sub.get()).data
+                if msg.get("type") != "telemetry" or msg.get("lat") is None or msg.get("lon") is None:
+                    continue
+                ts = msg.get("timestamp")
+                t = datetime.fromisoformat(ts).replace(tzinfo=timezone.utc).timestamp() if ts else time.time()
+                if not self._positions or t > self._positions[-1][0]:
+                    self._positions.append((t, float(msg["lat"]), float(msg["lon"]), msg.get("alt")))
+        finally:
+            telemetry_hub.unsubscribe(sub)
+
+    def close(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self._waiting = None
+        self.ring = []
+        self._free = []
+
+    def stats(self) -> dict:
+        now = time.time()
+        window = min(self.fps_window, max(now - self.opened_at, 1e-3))
+        recent = sum(1 for t in self._arrivals if now - t <= window)
+        return {
+            "mission_id": self.mission_id,
+            "connections": self.connections,
+            "received": self.received,
+            "processed": self.processed,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "drop_rate": round(self.skipped / self.received, 4) if self.received else 0.0,
+            "ingest_fps": round(recent / window, 2),
+            "mbytes": round(self.bytes / 1e6, 2),
+            "detections": self.detections,
+            "untagged": self.untagged,
+            "decode": self.decode_time.as_dict(),
+            "detect": self.detect_time.as_dict(),
+            "frame_age": self.frame_age.as_dict(),
+        }
+
+
+class FrameIngest:
+    def __init__(self, slot_bytes: int, fps_window: float = 5.0, idle_timeout: float = 30.0):
+        self.slot_bytes = slot_bytes
+        self.fps_window = fps_window
+        self.idle_timeout = idle_timeout
+        self._streams: Dict[int, FrameStream] = {}
+        # last stats of closed streams, so a reconnecting drone keeps its history visible
+        self._closed: "OrderedDict[int, dict]" = OrderedDict()
+
+    def open(self, mission_id: int, track_remote: bool = False) -> FrameStream:
+        stream = self._streams.get(mission_id)
+        if stream is None:
+            stream = self._streams[mission_id] = FrameStream(mission_id, self.slot_bytes, self.fps_window,
+                                                             track_remote, self.idle_timeout, self._close)
+        stream.connections += 1
+        return stream
+
+    def release(self, stream: FrameStream):
+        stream.connections -= 1
+
+    def _close(self, stream: FrameStream):
+        if self._streams.get(stream.mission_id) is stream:
+            del self._streams[stream.mission_id]
+        stream.close()
+        self._closed[stream.mission_id] = stream.stats()
+        self._closed.move_to_end(stream.mission_id)
+        while len(self._closed) > CLOSED_KEPT:
+            self._closed.popitem(last=False)
+
+    async def stop(self):
+        for stream in list(self._streams.values()):
+            self._close(stream)
+
+    def check(self, fmt: str, width: Optional[int], height: Optional[int]):
+        """Validate a stream's frame format. Raises ValueError."""
+        if fmt not in INGEST_FORMATS:
+            raise ValueError(f"unsupported format {fmt!r}, expected one of {list(INGEST_FORMATS)}")
+        if fmt != JPEG:
+            if not width or not height or width <= 0 or height <= 0:
+                raise ValueError(f"{fmt} frames need width and height")
+            if frame_bytes(width, height, fmt) > self.slot_bytes:
+                raise ValueError(f"{width}x{height} {fmt} exceeds DETECTOR_FRAME_MAX_BYTES={self.slot_bytes}")
+
+    def stats(self, mission_id: int) -> Optional[dict]:
+        stream = self._streams.get(mission_id)
+        return stream.stats() if stream is not None else self._closed.get(mission_id)
+
+
+frame_ingest = FrameIngest(settings.DETECTOR_FRAME_MAX_BYTES, fps_window=settings.FRAME_FPS_WINDOW_S,
+                           idle_timeout=settings.FRAME_IDLE_TIMEOUT_S)
@@ -0,0 +1,278 @@
+# edge_server/services/geofence.py
+# No-fly zones and mission boundaries. The zones (database + optional GEOFENCE_FILE) are
+# compiled into one GeofenceIndex snapshot that is swapped atomically on reload; journeys
+# are checked against it when they are created and live telemetry on every tick, with
+# breach / clear events published on the mission's stream when a zone's state changes.
+import asyncio
+import json
+import math
+import time
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Sequence, Set
+
+import numpy as np
+
+from edge_server.config import settings
+from edge_server.database import crud
+from edge_server.database.db import SessionLocal
+from edge_server.drone.journey_planner import PlanningError, polygon_rings
+from edge_server.services.telemetry_hub import telemetry_hub
+from edge_server.utils.geofence import GeofenceIndex
+from edge_server.utils.logger import logger
+from edge_server.utils.metrics import Histogram
+
+NO_FLY = "no_fly"
+BOUNDARY = "boundary"
+KINDS = (NO_FLY, BOUNDARY)
+
+
+class GeofenceError(ValueError):
+    pass
+
+
+class Zone(NamedTuple):
+    id: int
+    name: str
+    kind: str
+    mission_id: Optional[int]
+    floor_m: Optional[float]
+    ceiling_m: Optional[float]
+    geometry: dict
+
+
+def parse_zones(geojson: dict, kind: str = NO_FLY, mission_id: Optional[int] = None,
+                name: Optional[str] = None) -> List[dict]:
+    """
+    Geofence rows from a FeatureCollection, Feature or bare (Multi)Polygon. Feature properties
+    kind, name, mission_id, floor_m and ceiling_m override the defaults given here.
+    """
+    if geojson.get("type") == "FeatureCollection":
+        features = geojson.get("features") or []
+    elif geojson.get("type") == "Feature":
+        features = [geojson]
+    else:
+        features = [{"type": "Feature", "geometry": geojson, "properties": {}}]
+    rows = []
+    for i, f in enumerate(features):
+        props = f.get("properties") or {}
+        geometry = f.get("geometry") or {}
+        try:
+            polygon_rings(geometry)
+        except PlanningError as e:
+            raise GeofenceError(f"feature {i}: {e}")
+        row = {
+            "name": str(props.get("name") or name or f"zone {i + 1}"),
+            "kind": props.get("kind", kind),
+            "mission_id": props.get("mission_id", mission_id),
+            "floor_m": props.get("floor_m"),
+            "ceiling_m": props.get("ceiling_m"),
+            "geometry": json.dumps({"type": geometry["type"], "coordinates": geometry["coordinates"]}),
+        }
+        try:
+            check_attributes(row["kind"], row["mission_id"], row["floor_m"], row["ceiling_m"])
+        except GeofenceError as e:
+            raise GeofenceError(f"feature {i}: {e}")
+        rows.append(row)
+    return rows
+
+
+def check_attributes(kind, mission_id, floor_m, ceiling_m):
+    """Raise GeofenceError unless the zone attributes have the types GeofenceSet indexes."""
+    if kind not in KINDS:
+        raise GeofenceError(f"kind must be one of {KINDS}")
+    # bool is an int subclass, but never a meaningful id or altitude
+    if mission_id is not None and (isinstance(mission_id, bool) or not isinstance(mission_id, int)):
+        raise GeofenceError("mission_id must be an integer")
+    for key, value in (("floor_m", floor_m), ("ceiling_m", ceiling_m)):
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))
+                                  or not math.isfinite(value)):
+            raise GeofenceError(f"{key} must be a number")
+    if floor_m is not None and ceiling_m is not None and floor_m > ceiling_m:
+        raise GeofenceError("floor_m must not be above ceiling_m")
+
+
+class GeofenceSet:
+    """Immutable snapshot: zones, their index and per-zone attribute arrays."""
+
+    def __init__(self, zones: Sequence[Zone]):
+        self.zones = list(zones)
+        self.index = GeofenceIndex([polygon_rings(z.geometry) for z in self.zones])
+        self.no_fly = np.array([z.kind == NO_FLY for z in self.zones], dtype=bool)
+        self.mission = np.array([-1 if z.mission_id is None else z.mission_id for z in self.zones], dtype=np.int64)
+        self.floor = np.array([-np.inf if z.floor_m is None else z.floor_m for z in self.zones], dtype=np.float64)
+        self.ceiling = np.array([np.inf if z.ceiling_m is None else z.ceiling_m for z in self.zones], dtype=np.float64)
+
+    def applicable(self, mission_id: Optional[int]) -> np.ndarray:
+        return (self.mission == -1) | (self.mission == (-1 if mission_id is None else mission_id))
+
+    def _in_band(self, alt: np.ndarray, zones: np.ndarray) -> np.ndarray:
+        # unknown altitude counts as inside the band
+        return np.isnan(alt) | ((alt >= self.floor[zones]) & (alt <= self.ceiling[zones]))
+
+    def breaches(self, lat, lon, alt=None, mission_id: Optional[int] = None):
+        """(point index, zone index) pairs: inside a no-fly zone, or outside every boundary that applies."""
+        lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))
+        lon = np.atleast_1d(np.asarray(lon, dtype=np.float64))
+        alt = np.full(len(lat), np.nan) if alt is None else np.atleast_1d(np.asarray(alt, dtype=np.float64))
+        applicable = self.applicable(mission_id)
+        p, z = self.index.contains(lat, lon)
+        ok = applicable[z] & self._in_band(alt[p], z)
+        p, z = p[ok], z[ok]
+        nf = self.no_fly[z]
+        out_p, out_z = [p[nf]], [z[nf]]
+        boundaries = np.flatnonzero(applicable & ~self.no_fly)
+        if len(boundaries):
+            contained = np.zeros(len(lat), dtype=bool)
+            contained[p[~nf]] = True
+            outside = np.flatnonzero(~contained)
+            out_p.append(np.repeat(outside, len(boundaries)))
+            out_z.append(np.tile(boundaries, len(outside)))
+        return np.concatenate(out_p), np.concatenate(out_z)
+
+    def leg_breaches(self, lat, lon, alt=None, mission_id: Optional[int] = None):
+        """(leg index, zone index) for legs i -> i + 1 crossing the edge of an applicable zone."""
+        lat, lon = np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)
+        if len(lat) < 2:
+            return np.empty(0, np.int64), np.empty(0, np.int64)
+        leg, z = self.index.crossings(lat[:-1], lon[:-1], lat[1:], lon[1:])
+        keep = self.applicable(mission_id)[z]
+        if alt is not None:
+            # a leg flown entirely above the ceiling or below the floor stays clear of the zone
+            alt = np.asarray(alt, dtype=np.float64)
+            a, b = alt[:-1][leg], alt[1:][leg]
+            above = (a > self.ceiling[z]) & (b > self.ceiling[z])
+            below = (a < self.floor[z]) & (b < self.floor[z])
+            keep &= ~(above | below)
+        return leg[keep], z[keep]
+
+
+class GeofenceService:
+    def __init__(self, path: str = ""):
+        self.path = path
+        self.current: Optional[GeofenceSet] = None
+        self._state: Dict[int, Set[int]] = {}
+        self._broker = None
+        self.checks = 0
+        self.events = 0
+        self.check_time = Histogram()
+        self.loaded_at: Optional[float] = None
+
+    # loading
+
+    def _load(self) -> GeofenceSet:
+        db = SessionLocal()
+        try:
+            zones = []
+            for z in crud.get_geofences(db):
+                try:
+                    # rows written before the API validated them: skip the zone, keep the others
+                    check_attributes(z.kind, z.mission_id, z.floor_m, z.ceiling_m)
+                    geometry = json.loads(z.geometry)
+                    polygon_rings(geometry)
+                except (GeofenceError, PlanningError, ValueError, TypeError) as e:
+                    logger.error("Geofences: skipping zone %s (%s): %s", z.id, z.name, e)
+                    continue
+                zones.append(Zone(z.id, z.name, z.kind, z.mission_id, z.floor_m, z.ceiling_m, geometry))
+        finally:
+            db.close()
+        if self.path:
+            with open(self.path, "rb") as f:
+                rows = parse_zones(json.load(f))
+            # file zones are not in the database; negative ids keep them apart
+            zones += [Zone(-(i + 1), r["name"], r["kind"], r["mission_id"], r["floor_m"], r["ceiling_m"],
+                           json.loads(r["geometry"])) for i, r in enumerate(rows)]
+        return GeofenceSet(zones)
+
+    async def reload(self):
+        start = time.perf_counter()
+        self.current = await asyncio.get_running_loop().run_in_executor(None, self._load)
+        self.loaded_at = time.time()
+        if self.current.zones:
+            logger.info("Geofences: %s zones indexed in %.1f ms", len(self.current.zones),
+                        (time.perf_counter() - start) * 1000)
+
+    async def start(self, broker=None):
+        # no fallback to an empty set: starting without the zones would silently allow every flight
+        await self.reload()
+        if broker is not None and broker.distributed:
+            self._broker = broker
+            loop = asyncio.get_running_loop()
+            broker.subscribe("geofence.reload", lambda channel, data: loop.create_task(self._reload_logged()))
+
+    async def _reload_logged(self):
+        try:
+            await self.reload()
+        except Exception:
+            logger.exception("Geofences: reload failed, keeping the %s zones loaded before",
+                             len(self.current.zones) if self.current else 0)
+
+    async def changed(self):
+        """Zones were added or removed: rebuild here and on the other workers."""
+        await self.reload()
+        if self._broker is not None:
+            self._broker.publish("geofence.reload", "1")
+
+    # checks
+
+    def check_path(self, lat, lon, alt=None, mission_id: Optional[int] = None) -> List[dict]:
+        """Waypoints inside no-fly zones / outside boundaries, and legs crossing zone edges."""
+        gs = self.current
+        if gs is None or not gs.zones:
+            return []
+        out = []
+        p, z = gs.breaches(lat, lon, alt, mission_id)
+        for i, zi in sorted(zip(p.tolist(), z.tolist())):
+            out.append(dict(self._zone_ref(gs.zones[zi]), at="waypoint", index=i))
+        leg, z = gs.leg_breaches(lat, lon, alt, mission_id)
+        for i, zi in sorted(zip(leg.tolist(), z.tolist())):
+            out.append(dict(self._zone_ref(gs.zones[zi]), at="leg", index=i))
+        return out
+
+    def observe(self, mission_id: int, message: dict):
+        """Check one telemetry sample; publish an event for every zone whose breach state changed."""
+        gs = self.current
+        lat, lon = message.get("lat"), message.get("lon")
+        if gs is None or not gs.zones or lat is None or lon is None:
+            return
+        start = time.perf_counter()
+        alt = message.get("alt")
+        _, z = gs.breaches(lat, lon, np.nan if alt is None else alt, mission_id)
+        now = {gs.zones[i].id for i in z.tolist()}
+        self.checks += 1
+        self.check_time.observe(time.perf_counter() - start)
+        before = self._state.get(mission_id, set())
+        if now == before:
+            return
+        self._state[mission_id] = now
+        by_id = {zone.id: zone for zone in gs.zones}
+        for zone_id, state in [(i, "breach") for i in now - before] + [(i, "clear") for i in before - now]:
+            zone = by_id.get(zone_id)
+            if zone is None:
+                continue  # removed by a reload meanwhile
+            self.events += 1
+            telemetry_hub.publish(mission_id, dict(
+                self._zone_ref(zone), type="geofence", state=state, mission_id=mission_id,
+                lat=lat, lon=lon, alt=alt, timestamp=message.get("timestamp") or datetime.utcnow().isoformat(),
+            ))
+
+    def forget(self, mission_id: int):
+        self._state.pop(mission_id, None)
+
+    @staticmethod
+    def _zone_ref(zone: Zone) -> dict:
+        return {"zone_id": zone.id, "zone": zone.name, "kind": zone.kind}
+
+    def stats(self) -> dict:
+        gs = self.current
+        return {
+            "zones": len(gs.zones) if gs else 0,
+            "index": gs.index.stats() if gs else None,
+            "loaded_at": self.loaded_at,
+            "missions_in_breach": sum(1 for s in self._state.values() if s),
+            "checks": self.checks,
+            "events": self.events,
+            "check": self.check_time.as_dict(),
+        }
+
+
+geofence = GeofenceService(settings.GEOFENCE_FILE)
@@ -0,0 +1,560 @@
+# edge_server/services/journey_io.py
+# Bulk journey import and export. Uploads are parsed incrementally as the body arrives:
+# GeoJSON by decoding one feature of the "features" array at a time, GPX and KML with an
+# expat parser whose target only keeps the route being read; checked journeys are spooled
+# and only written once the whole upload is known to be good. Exports are rendered a keyset page
+# of journeys at a time.
+import codecs
+import json
+import pickle
+import tempfile
+from datetime import datetime
+from typing import AsyncIterator, List, NamedTuple, Optional
+from xml.etree.ElementTree import ParseError, XMLParser
+from xml.sax.saxutils import escape, quoteattr
+
+import orjson
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+
+from edge_server.api.serializers import IN_CHUNK, list_journey_rows, waypoint_rows
+from edge_server.database import crud
+from edge_server.database.models import Journey, Waypoint
+from edge_server.services.geofence import geofence
+from edge_server.utils.simplify import alt_array
+
+GEOJSON = "geojson"
+GPX = "gpx"
+KML = "kml"
+EXPORT_FORMATS = (GEOJSON, GPX, KML)
+
+MEDIA_TYPES = {
+    GEOJSON: "application/geo+json",
+    GPX: "application/gpx+xml",
+    KML: "application/vnd.google-earth.kml+xml",
+}
+
+
+class JourneyImportError(ValueError):
+    pass
+
+
+class ParsedJourney(NamedTuple):
+    name: str
+    description: Optional[str]
+    points: list  # (lat, lon, alt) tuples in flight order
+
+
+def _journey(index: int, name, description, points: list) -> ParsedJourney:
+    if len(points) < 2:
+        raise JourneyImportError(f"journey {index + 1} ({name or 'unnamed'}): a journey requires at least 2 points")
+    for lat, lon, _ in points:
+        if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):
+            raise JourneyImportError(f"journey {index + 1} ({name or 'unnamed'}): coordinate out of range ({lat}, {lon})")
+    return ParsedJourney(str(name) if name else f"Imported journey {index + 1}", description or None, points)
+
+
+# GeoJSON
+
+
+def _position(c) -> tuple:
+    if not isinstance(c, (list, tuple)) or len(c) < 2:
+        raise ValueError(f"invalid position {c!r}")
+    return float(c[1]), float(c[0]), (float(c[2]) if len(c) > 2 and c[2] is not None else None)
+
+
+class GeoJSONReader:
+    """
+    Incremental reader for a FeatureCollection (or a single Feature / bare LineString).
+    feed() returns the journeys completed by the data seen so far; each LineString becomes a
+    journey, each part of a MultiLineString another one; other geometries are counted as skipped.
+    """
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._state = "start"
+        self._retry_at = 0  # an incomplete value is decoded again once the buffer has doubled
+        self._top = {}
+        self._array = False
+        self.count = 0
+        self.skipped = 0
+
+    def _skip_ws(self):
+        buf, pos = self._buf, self._pos
+        while pos < len(buf) and buf[pos] in " \t\r\n":
+            pos += 1
+        self._pos = pos
+        return buf[pos] if pos < len(buf) else None
+
+    def _value(self, final: bool):
+        if not final and len(self._buf) < self._retry_at:
+            return None, False
+        try:
+            value, end = self._json.raw_decode(self._buf, self._pos)
+        except json.JSONDecodeError as e:
+            if final:
+                raise JourneyImportError(f"invalid JSON: {e}")
+            self._retry_at = 2 * (len(self._buf) - self._pos) + self._pos
+            return None, False
+        self._pos, self._retry_at = end, 0
+        return value, True
+
+    def _expect(self, ch: str):
+        if self._skip_ws() != ch:
+            raise JourneyImportError(f"invalid GeoJSON: expected {ch!r} at character {self._pos}")
+        self._pos += 1
+
+    def _advance(self, final: bool) -> List[ParsedJourney]:
+        out = []
+        while True:
+            ch = self._skip_ws()
+            if ch is None:
+                break
+            if self._state == "start":
+                if ch == "[":
+                    # a bare array of features
+                    self._pos += 1
+                    self._state, self._array = "features", True
+                    continue
+                self._expect("{")
+                self._state = "key"
+            elif self._state == "key":
+                if ch == "}":
+                    self._pos += 1
+                    self._state = "end"
+                    continue
+                if ch == ",":
+                    self._pos += 1
+                    continue
+                # key, ':' and the whole value must be in the buffer, else start over with more data
+                start = self._pos
+                key, ok = self._value(final)
+                if ok:
+                    ok = self._skip_ws() is not None
+                if ok:
+                    self._expect(":")
+                    ok = self._skip_ws() is not None
+                if not ok:
+                    self._pos = start
+                    break
+                if key == "features":
+                    self._expect("[")
+                    self._state = "features"
+                    continue
+                value, ok = self._value(final)
+                if not ok or (self._pos == len(self._buf) and not final):
+                    # a number at the end of the buffer may continue in the next chunk
+                    self._pos = start
+                    break
+                self._top[key] = value
+            elif self._state == "features":
+                if ch == "]":
+                    self._pos += 1
+                    self._state = "end" if self._array else "key"
+                    continue
+                if ch == ",":
+                    self._pos += 1
+                    continue
+                feature, ok = self._value(final)
+                if not ok:
+                    break
+                out.extend(self._feature(feature))
+            else:
+                raise JourneyImportError(f"invalid GeoJSON: trailing data at character {self._pos}")
+        # keep only what has not been consumed
+        self._buf, self._retry_at = self._buf[self._pos:], max(self._retry_at - self._pos, 0)
+        self._pos = 0
+        return out
+
+    def _feature(self, feature) -> List[ParsedJourney]:
+        if not isinstance(feature, dict):
+            raise JourneyImportError(f"feature {self.count + self.skipped + 1} is not an object")
+        if feature.get("type") == "Feature":
+            props = feature.get("properties") or {}
+            geometry = feature.get("geometry") or {}
+        else:
+            props, geometry = {}, feature
+        return self._geometry(geometry, props.get("name"), props.get("description"))
+
+    def _geometry(self, geometry: dict, name, description) -> List[ParsedJourney]:
+        kind = geometry.get("type")
+        if kind == "GeometryCollection":
+            return [j for g in geometry.get("geometries") or [] for j in self._geometry(g, name, description)]
+        if kind == "LineString":
+            lines = [geometry.get("coordinates") or []]
+        elif kind == "MultiLineString":
+            lines = geometry.get("coordinates") or []
+        else:
+            self.skipped += 1
+            return []
+        out = []
+        for i, line in enumerate(lines):
+            part = name if len(lines) == 1 or not name else f"{name} ({i + 1})"
+            try:
+                points = [_position(c) for c in line]
+            except (ValueError, TypeError) as e:
+                raise JourneyImportError(f"journey {self.count + 1}: {e}")
+            out.append(_journey(self.count, part, description, points))
+            self.count += 1
+        return out
+
+    def feed(self, data: bytes) -> List[ParsedJourney]:
+        self._buf += self._decoder.decode(data)
+        return self._advance(final=False)
+
+    def close(self) -> List[ParsedJourney]:
+        self._buf += self._decoder.decode(b"", final=True)
+        out = self._advance(final=True)
+        if self._state == "start":
+            raise JourneyImportError("empty body")
+        if self._state != "end":
+            raise JourneyImportError("invalid GeoJSON: unexpected end of data")
+        if self._top.get("type") not in (None, "FeatureCollection"):
+            # a single Feature or geometry: its members were collected as top-level keys
+            out.extend(self._feature(self._top))
+        return out
+
+
+# GPX and KML
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+class _RouteTarget:
+    """
+    expat target for GPX (rte / trk, all trkseg of a track joined) and KML (Placemark with
+    LineString or gx:Track). Nothing but the current route is kept.
+    """
+    ROUTES = {"rte", "trk", "Placemark"}
+    POINTS = {"rtept", "trkpt"}
+
+    def __init__(self, reader: "XMLReader"):
+        self.reader = reader
+        self.path: List[str] = []
+        self.text: List[str] = []
+        self.route = None  # [name, description, lines]
+        self.point = None  # [lat, lon, alt]
+
+    def start(self, tag, attrib):
+        tag = _local(tag)
+        self.path.append(tag)
+        self.text = []
+        if tag in self.ROUTES and self.route is None:
+            self.route = [None, None, []]
+            if tag == "trk":
+                self.route[2].append([])
+        elif self.route is not None:
+            if tag in self.POINTS:
+                self.point = [float(attrib["lat"]), float(attrib["lon"]), None]
+            elif tag == "Track":
+                self.route[2].append([])
+
+    def data(self, text):
+        self.text.append(text)
+
+    def end(self, tag):
+        tag = self.path.pop()
+        parent = self.path[-1] if self.path else None
+        route = self.route
+        if route is None:
+            return
+        text = "".join(self.text).strip()
+        self.text = []
+        if tag == "ele" and self.point is not None:
+            self.point[2] = float(text) if text else None
+        elif tag in self.POINTS and self.point is not None:
+            if not route[2]:
+                route[2].append([])
+            route[2][-1].append(tuple(self.point))
+            self.point = None
+        elif tag == "name" and parent in self.ROUTES:
+            route[0] = text
+        elif tag in ("desc", "description") and parent in self.ROUTES:
+            route[1] = text
+        elif tag == "coordinates" and parent == "LineString":
+            route[2].append([_kml_position(c) for c in text.split()])
+        elif tag == "coord" and parent == "Track":
+            lon, lat, *alt = text.split()
+            route[2][-1].append((float(lat), float(lon), float(alt[0]) if alt else None))
+        elif tag in self.ROUTES and parent not in self.ROUTES:
+            self.route = None
+            self.reader.route(tag, *route)
+
+    def close(self):
+        return None
+
+
+def _kml_position(text: str) -> tuple:
+    lon, lat, *alt = text.split(",")
+    return float(lat), float(lon), float(alt[0]) if alt else None
+
+
+class XMLReader:
+    """Incremental GPX / KML reader; feed() returns the journeys completed so far."""
+
+    def __init__(self):
+        self._parser = XMLParser(target=_RouteTarget(self))
+        self._out: List[ParsedJourney] = []
+        self.count = 0
+        self.skipped = 0
+
+    def route(self, tag: str, name, description, lines):
+        lines = [line for line in lines if line]
+        if tag == "trk" and len(lines) > 1:
+            lines = [[p for line in lines for p in line]]
+        if not lines:
+            self.skipped += 1  # e.g. a KML Placemark holding a Point or Polygon
+        for i, line in enumerate(lines):
+            part = name if len(lines) == 1 or not name else f"{name} ({i + 1})"
+            self._out.append(_journey(self.count, part, description, line))
+            self.count += 1
+
+    def _take(self) -> List[ParsedJourney]:
+        out, self._out = self._out, []
+        return out
+
+    def feed(self, data: bytes) -> List[ParsedJourney]:
+        try:
+            self._parser.feed(data)
+        except (ParseError, ValueError, KeyError) as e:
+            raise JourneyImportError(f"invalid GPX/KML: {e}")
+        return self._take()
+
+    def close(self) -> List[ParsedJourney]:
+        try:
+            self._parser.close()
+        except ParseError as e:
+            raise JourneyImportError(f"invalid GPX/KML: {e}")
+        return self._take()
+
+
+class JourneyReader:
+    """Picks the GeoJSON or the XML reader from the first non-blank byte of the body."""
+
+    def __init__(self):
+        self._reader = None
+        self._head = b""
+
+    @property
+    def count(self) -> int:
+        return self._reader.count if self._reader else 0
+
+    @property
+    def skipped(self) -> int:
+        return self._reader.skipped if self._reader else 0
+
+    def feed(self, data: bytes) -> List[ParsedJourney]:
+        if self._reader is None:
+            self._head += data
+            head = self._head.lstrip(b"\xef\xbb\xbf \t\r\n")
+            if not head:
+                return []
+            self._reader = GeoJSONReader() if head[:1] in (b"{", b"[") else XMLReader()
+            data, self._head = head, b""
+        return self._reader.feed(data)
+
+    def close(self) -> List[ParsedJourney]:
+        if self._reader is None:
+            raise JourneyImportError("empty body")
+        return self._reader.close()
+
+
+def insert_journeys(db: Session, owner_id: int, journeys: List[ParsedJourney]) -> List[int]:
+    """Bulk-insert one chunk (the caller commits). Returns the new journey ids."""
+    now = datetime.utcnow()
+    ids = db.execute(
+        Journey.__table__.insert().returning(Journey.id, sort_by_parameter_order=True),
+        [{"name": j.name, "description": j.description, "owner_id": owner_id, "created_at": now} for j in journeys],
+    ).scalars().all()
+    rows = [{"journey_id": jid, "seq": seq, "lat": lat, "lon": lon, "alt": alt}
+            for jid, j in zip(ids, journeys) for seq, (lat, lon, alt) in enumerate(j.points)]
+    db.execute(Waypoint.__table__.insert(), rows)
+    return ids
+
+
+def delete_journeys(db: Session, ids: List[int], chunk: int = IN_CHUNK):
+    """Remove journeys and their waypoints by id (the caller commits)."""
+    for i in range(0, len(ids), chunk):
+        part = ids[i:i + chunk]
+        db.execute(Waypoint.__table__.delete().where(Waypoint.journey_id.in_(part)))
+        db.execute(Journey.__table__.delete().where(Journey.id.in_(part)))
+
+
+class ImportTooLarge(JourneyImportError):
+    pass
+
+
+class JourneyImporter:
+    """
+    Imports in two phases so that no write lock is held while the client is still uploading.
+    feed() / close() only parse the body and check every journey against the geofences like
+    single journeys; the valid ones are pickled `chunk` at a time to a spool (memory up to
+    spool_bytes, then a temporary file). After the first breach the rest of the file is only
+    parsed and checked so that every offending journey is reported. Once the whole file is
+    known to be good, insert() writes the spooled chunks, each in its own short transaction;
+    if one of them fails, the chunks committed before it are deleted again.
+    """
+
+    def __init__(self, owner_id: int, chunk: int = 500, spool_bytes: int = 16 << 20, max_bytes: int = 0):
+        self.owner_id = owner_id
+        self.chunk = chunk
+        self.max_bytes = max_bytes
+        self.reader = JourneyReader()
+        self.spool = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+        self.batches = 0
+        self.received = 0
+        self.pending: List[ParsedJourney] = []
+        self.pending_points = 0
+        self.seen = 0
+        self.rejected: List[dict] = []
+        self.rejected_count = 0
+
+    def _add(self, journeys: List[ParsedJourney]):
+        for j in journeys:
+            index = self.seen
+            self.seen += 1
+            breaches = geofence.check_path([p[0] for p in j.points], [p[1] for p in j.points],
+                                           alt_array([p[2] for p in j.points]))
+            if breaches:
+                self.rejected_count += 1
+                if len(self.rejected) < 100:
+                    self.rejected.append({"index": index, "name": j.name, "breaches": breaches[:10]})
+                self.pending.clear()
+                continue
+            if self.rejected_count:
+                continue
+            self.pending.append(j)
+            self.pending_points += len(j.points)
+            if len(self.pending) >= self.chunk or self.pending_points >= self.chunk * 100:
+                self._spool()
+
+    def _spool(self):
+        if self.pending:
+            pickle.dump(self.pending, self.spool, pickle.HIGHEST_PROTOCOL)
+            self.batches += 1
+            self.pending, self.pending_points = [], 0
+
+    def feed(self, data: bytes):
+        self.received += len(data)
+        if self.max_bytes and self.received > self.max_bytes:
+            raise ImportTooLarge(f"import body exceeds {self.max_bytes} bytes")
+        self._add(self.reader.feed(data))
+
+    def close(self) -> Optional[dict]:
+        """End of the body: the rejection report if any journey breaches a geofence, else None."""
+        self._add(self.reader.close())
+        if self.rejected_count:
+            return {"created": 0, "rejected": self.rejected_count, "journeys": self.rejected}
+        self._spool()
+        return None
+
+    def insert(self, db: Session) -> dict:
+        self.spool.seek(0)
+        ids: List[int] = []
+        waypoints = 0
+        try:
+            for _ in range(self.batches):
+                journeys = pickle.load(self.spool)
+                ids += insert_journeys(db, self.owner_id, journeys)
+                waypoints += sum(len(j.points) for j in journeys)
+                crud.bump_journey_version(db, self.owner_id)
+                db.commit()
+        except Exception:
+            db.rollback()
+            if ids:
+                delete_journeys(db, ids)
+                crud.bump_journey_version(db, self.owner_id)
+                db.commit()
+            raise
+        return {"created": len(ids), "waypoints": waypoints, "skipped": self.reader.skipped}
+
+    def discard(self):
+        self.spool.close()
+
+
+# export
+
+
+def _fmt(v: float) -> str:
+    return repr(float(v))
+
+
+def _geojson_feature(row, wps) -> bytes:
+    jid, name, description, _, created_at = row
+    return orjson.dumps({
+        "type": "Feature",
+        "id": jid,
+        "properties": {"name": name, "description": description, "created_at": created_at},
+        "geometry": {"type": "LineString", "coordinates": [
+            [lon, lat] if alt is None else [lon, lat, alt] for _, _, lat, lon, alt in wps]},
+    })
+
+
+def _gpx_route(row, wps) -> bytes:
+    _, name, description, _, _ = row
+    parts = [f"<rte><name>{escape(name)}</name>"]
+    if description:
+        parts.append(f"<desc>{escape(description)}</desc>")
+    for _, _, lat, lon, alt in wps:
+        ele = "" if alt is None else f"<ele>{_fmt(alt)}</ele>"
+        parts.append(f'<rtept lat="{_fmt(lat)}" lon="{_fmt(lon)}">{ele}</rtept>')
+    parts.append("</rte>\n")
+    return "".join(parts).encode()
+
+
+def _kml_placemark(row, wps) -> bytes:
+    _, name, description, _, _ = row
+    desc = f"<description>{escape(description)}</description>" if description else ""
+    coords = " ".join(f"{_fmt(lon)},{_fmt(lat)}" if alt is None else f"{_fmt(lon)},{_fmt(lat)},{_fmt(alt)}"
+                      for _, _, lat, lon, alt in wps)
+    return (f"<Placemark><name>{escape(name)}</name>{desc}"
+            f"<LineString><coordinates>{coords}</coordinates></LineString></Placemark>\n").encode()
+
+
+_RENDER = {GEOJSON: _geojson_feature, GPX: _gpx_route, KML: _kml_placemark}
+
+
+def header(fmt: str, title: str) -> bytes:
+    if fmt == GEOJSON:
+        return b'{"type":"FeatureCollection","features":['
+    if fmt == GPX:
+        return (f'<?xml version="1.0" encoding="UTF-8"?>\n<gpx version="1.1" creator={quoteattr(title)} '
+                f'xmlns="http://www.topografix.com/GPX/1/1">\n').encode()
+    return (f'<?xml version="1.0" encoding="UTF-8"?>\n<kml xmlns="http://www.opengis.net/kml/2.2">'
+            f'<Document><name>{escape(title)}</name>\n').encode()
+
+
+def footer(fmt: str) -> bytes:
+    return {GEOJSON: b"]}", GPX: b"</gpx>\n", KML: b"</Document></kml>\n"}[fmt]
+
+
+def export_chunk(db: Session, owner_id: int, after_id: Optional[int], fmt: str, first: bool):
+    """(body, last id, journeys) for the next IN_CHUNK journeys of the owner."""
+    rows = list_journey_rows(db, owner_id, after_id, IN_CHUNK)
+    wps = waypoint_rows(db, [r[0] for r in rows])
+    render = _RENDER[fmt]
+    items = [render(r, wps.get(r[0], [])) for r in rows]
+    if fmt == GEOJSON:
+        body = (b"" if first or not items else b",") + b",".join(items)
+    else:
+        body = b"".join(items)
+    return body, (rows[-1][0] if rows else after_id), len(rows)
+
+
+async def iter_export(db: Session, owner_id: int, fmt: str, title: str) -> AsyncIterator[bytes]:
+    """All journeys of the owner as one document, rendered IN_CHUNK journeys at a time."""
+    yield header(fmt, title)
+    after_id, first = None, True
+    while True:
+        body, after_id, n = await run_in_threadpool(export_chunk, db, owner_id, after_id, fmt, first)
+        if body:
+            yield body
+            first = False
+        if n < IN_CHUNK:
+            break
+    yield footer(fmt)
@@ -0,0 +1,159 @@
+# edge_server/services/mission_control.py
+# Routes mission start/stop and operator commands to the worker that runs the mission.
+# With the mock adapter any worker can run a mission and holds a "mission:<id>" lease while
+# it does; with an exclusive link (MAVLink UDP/serial) the worker holding "drone:link" runs
+# all of them. With BROKER_URL=local every call stays in this process.
+# Detections are stored by the mission's worker too, so its de-duplicator sees every repeat
+# of an object, whichever worker received it (a mission nobody runs is handled locally).
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from edge_server.drone.adapter import DroneManager, drone_manager_singleton
+from edge_server.services.cluster import Cluster, ClusterError, cluster
+from edge_server.services.command_queue import CommandDispatcher, CommandQueueFull, command_dispatcher
+from edge_server.services.detection_writer import DetectionWriteError, DetectionWriter, detection_writer
+
+LINK_KEY = "drone:link"
+
+
+def mission_key(mission_id: int) -> str:
+    return f"mission:{mission_id}"
+
+
+class MissionControl:
+    def __init__(self, cluster: Cluster, drones: DroneManager, dispatcher: CommandDispatcher,
+                 writer: DetectionWriter):
+        self.cluster = cluster
+        self.drones = drones
+        self.dispatcher = dispatcher
+        self.writer = writer
+
+    async def start(self):
+        c = self.cluster
+        c.handle("mission.start", self._start_local)
+        c.handle("mission.stop", self._stop_local)
+        c.handle("command.submit", self._submit_local)
+        c.handle("command.get", self._get_local)
+        c.handle("command.stats", self._stats_local)
+        c.handle("detections.submit", self._submit_detections_local)
+        c.handle("detections.write", self._write_detection_local)
+        c.register_error(CommandQueueFull)
+        c.register_error(TimeoutError)  # detection buffer full (asyncio.TimeoutError)
+        c.register_error(DetectionWriteError)
+        if self.drones.exclusive_link:
+            await c.campaign(LINK_KEY, on_acquired=self.drones.open, on_lost=self.drones.close)
+        else:
+            await self.drones.open()
+
+    async def stop(self):
+        await self.dispatcher.stop()
+        await self.drones.close()
+
+    async def owner(self, mission_id: int) -> Optional[str]:
+        """Worker running the mission, or None if nobody is (for the mock adapter)."""
+        key = LINK_KEY if self.drones.exclusive_link else mission_key(mission_id)
+        owner = await self.cluster.owner(key)
+        if owner is None and self.drones.exclusive_link:
+            raise ClusterError("no worker holds the drone link")
+        return owner
+
+    # public API: may run on any worker
+
+    async def start_mission(self, mission_id: int) -> str:
+        """Returns the worker the mission runs on."""
+        return await self.cluster.call(await self.owner(mission_id) or self.cluster.worker_id,
+                                       "mission.start", mission_id=mission_id)
+
+    async def stop_mission(self, mission_id: int):
+        owner = await self.owner(mission_id)
+        if owner is not None:
+            await self.cluster.call(owner, "mission.stop", mission_id=mission_id)
+
+    async def submit_command(self, mission_id: int, command: str, params: Optional[dict], wait: float) -> dict:
+        owner = await self.owner(mission_id) or self.cluster.worker_id
+        return await self.cluster.call(owner, "command.submit", timeout=wait + self.cluster.rpc_timeout,
+                                       mission_id=mission_id, command=command, params=params, wait=wait)
+
+    async def get_command(self, mission_id: int, command_id: int, wait: float) -> Optional[dict]:
+        owner = await self.owner(mission_id) or self.cluster.worker_id
+        return await self.cluster.call(owner, "command.get", timeout=wait + self.cluster.rpc_timeout,
+                                       mission_id=mission_id, command_id=command_id, wait=wait)
+
+    async def submit_detections(self, rows: List[dict], timeout: Optional[float] = None):
+        """DetectionWriter.submit() on the worker of each row's mission."""
+        by_mission: Dict[Optional[int], List[dict]] = {}
+        for row in rows:
+            by_mission.setdefault(row["mission_id"], []).append(row)
+        for mission_id, part in by_mission.items():
+            owner = await self._detections_owner(mission_id)
+            if owner == self.cluster.worker_id:
+                await self.writer.submit(part, timeout)
+            else:
+                await self.cluster.call(owner, "detections.submit", timeout=(timeout or 0) + self.cluster.rpc_timeout,
+                                        rows=part, wait=timeout)
+
+    async def write_detection(self, row: dict, timeout: Optional[float] = None) -> int:
+        """DetectionWriter.write() on the worker of the row's mission; returns the object's track_key."""
+        owner = await self._detections_owner(row["mission_id"])
+        if owner == self.cluster.worker_id:
+            return await self.writer.write(row, timeout)
+        return await self.cluster.call(owner, "detections.write", timeout=(timeout or 0) + self.cluster.rpc_timeout,
+                                       row=row, wait=timeout)
+
+    async def _detections_owner(self, mission_id: Optional[int]) -> str:
+        try:
+            return await self.owner(mission_id) or self.cluster.worker_id
+        except ClusterError:
+            return self.cluster.worker_id  # no link holder, so the mission is not running anywhere
+
+    async def command_stats(self) -> dict:
+        if self.drones.exclusive_link:
+            owner = await self.cluster.owner(LINK_KEY)
+            if owner is not None:
+                return await self.cluster.call(owner, "command.stats")
+        return await self._stats_local()
+
+    # handlers: run on the owning worker
+
+    async def _start_local(self, mission_id: int) -> str:
+        if not self.drones.exclusive_link:
+            owner = await self.cluster.hold(mission_key(mission_id), keep=lambda: self.drones.running(mission_id),
+                                            on_lost=lambda: self._stop_local(mission_id))
+            if owner != self.cluster.worker_id:
+                return owner  # another worker started it first
+        self.drones.start_mission(mission_id)
+        return self.cluster.worker_id
+
+    async def _stop_local(self, mission_id: int):
+        self.drones.stop_mission(mission_id)
+        if not self.drones.exclusive_link:
+            await self.cluster.release(mission_key(mission_id))
+
+    async def _submit_local(self, mission_id: int, command: str, params: Optional[dict], wait: float) -> dict:
+        cmd = self.dispatcher.submit(mission_id, command, params)
+        return (await self.dispatcher.wait(cmd, wait)).as_dict()
+
+    async def _get_local(self, mission_id: int, command_id: int, wait: float) -> Optional[dict]:
+        cmd = self.dispatcher.get(command_id)
+        if cmd is None or cmd.mission_id != mission_id:
+            return None
+        return (await self.dispatcher.wait(cmd, wait)).as_dict()
+
+    async def _stats_local(self) -> dict:
+        return dict(self.dispatcher.stats(), worker=self.cluster.worker_id)
+
+    async def _submit_detections_local(self, rows: List[dict], wait: Optional[float]):
+        await self.writer.submit([_from_wire(r) for r in rows], wait)
+
+    async def _write_detection_local(self, row: dict, wait: Optional[float]) -> int:
+        return await self.writer.write(_from_wire(row), wait)
+
+
+def _from_wire(row: dict) -> dict:
+    """A detection row that went through the RPC (datetimes arrive as ISO strings)."""
+    if isinstance(row.get("created_at"), str):
+        row["created_at"] = datetime.fromisoformat(row["created_at"])
+    return row
+
+
+mission_control = MissionControl(cluster, drone_manager_singleton, command_dispatcher, detection_writer)
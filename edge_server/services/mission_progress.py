@@ -0,0 +1,238 @@
+# edge_server/services/mission_progress.py
+# Live mission progress from telemetry: the journey is projected once into segment arrays,
+# every sample is matched against a few legs around the previous match (a full scan only
+# when the vehicle is off the route), and flown / remaining distance, speed, ETA and the
+# battery left at the finish are updated from running sums, so a sample costs the same
+# whatever the number of waypoints.
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from edge_server.config import settings
+from edge_server.database import crud
+from edge_server.database.db import SessionLocal
+from edge_server.services.telemetry_hub import telemetry_hub
+from edge_server.utils.geo import LocalENU
+from edge_server.utils.logger import logger
+from edge_server.utils.metrics import Histogram
+
+LOOKBEHIND = 1
+LOOKAHEAD = 4
+# the battery drain rate is estimated once this far has been flown since the first reading
+DRAIN_MIN_DISTANCE_M = 100.0
+FINISHED_KEPT = 256
+
+
+class Route:
+    """A journey's waypoints as legs in a local metric plane."""
+
+    def __init__(self, lat: Sequence[float], lon: Sequence[float]):
+        lat, lon = np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)
+        self.enu = LocalENU.around(lat, lon)
+        x, y = self.enu.forward(lat, lon)
+        if len(x) == 1:
+            # a single waypoint: one zero-length leg
+            x, y = np.r_[x, x], np.r_[y, y]
+        self.ax, self.ay = x[:-1], y[:-1]
+        self.dx, self.dy = np.diff(x), np.diff(y)
+        self.length = np.hypot(self.dx, self.dy)
+        self.len2 = np.maximum(self.length ** 2, 1e-9)
+        self.start = np.r_[0.0, np.cumsum(self.length)[:-1]]
+        self.total = float(self.length.sum())
+        self.legs = len(self.length)
+
+    def match(self, x: float, y: float, lo: int, hi: int):
+        """Closest point on legs lo..hi-1: (leg, distance along the route, distance from the route)."""
+        ax, ay, dx, dy = self.ax[lo:hi], self.ay[lo:hi], self.dx[lo:hi], self.dy[lo:hi]
+        t = np.clip(((x - ax) * dx + (y - ay) * dy) / self.len2[lo:hi], 0.0, 1.0)
+        d = np.hypot(ax + t * dx - x, ay + t * dy - y)
+        i = int(np.argmin(d))
+        return lo + i, float(self.start[lo + i] + t[i] * self.length[lo + i]), float(d[i])
+
+
+class ProgressTracker:
+    """Running progress of one mission along its route."""
+
+    def __init__(self, mission_id: int, route: Route, off_route_m: float, tau_s: float):
+        self.mission_id = mission_id
+        self.route = route
+        self.off_route_m = off_route_m
+        self.tau_s = tau_s
+        self.leg = 0
+        self.along = 0.0
+        self.off_route = 0.0
+        self.flown = 0.0
+        self.speed: Optional[float] = None
+        self.battery: Optional[float] = None
+        self._battery_anchor = None  # (smoothed battery, flown) when the battery was first seen
+        self.drain_per_m: Optional[float] = None
+        self.samples = 0
+        self.rescans = 0
+        self.finished = False
+        self._last = None  # (t, x, y)
+        self.updated_at: Optional[float] = None
+
+    def update(self, t: float, lat: float, lon: float, battery: Optional[float] = None):
+        rt = self.route
+        x, y = rt.enu.forward(lat, lon)
+        x, y = float(x), float(y)
+        lo, hi = max(self.leg - LOOKBEHIND, 0), min(self.leg + LOOKAHEAD + 1, rt.legs)
+        leg, along, off = rt.match(x, y, lo, hi)
+        if off > self.off_route_m and hi - lo < rt.legs:
+            # lost the route (skipped legs, rerouted): look at all legs once
+            self.rescans += 1
+            full = rt.match(x, y, 0, rt.legs)
+            if full[2] < off:
+                leg, along, off = full
+        self.leg, self.along, self.off_route = leg, along, off
+        if self._last is not None:
+            t0, x0, y0 = self._last
+            step = math.hypot(x - x0, y - y0)
+            self.flown += step
+            dt = t - t0
+            if dt > 0:
+                a = 1.0 - math.exp(-dt / self.tau_s)
+                v = step / dt
+                self.speed = v if self.speed is None else self.speed + a * (v - self.speed)
+                if battery is not None and self.battery is not None:
+                    self.battery += a * (battery - self.battery)
+        if battery is not None and self.battery is None:
+            self.battery = float(battery)
+            self._battery_anchor = (self.battery, self.flown)
+        if self._battery_anchor is not None:
+            b0, f0 = self._battery_anchor
+            if self.flown - f0 >= DRAIN_MIN_DISTANCE_M:
+                self.drain_per_m = max(b0 - self.battery, 0.0) / (self.flown - f0)
+        self._last = (t, x, y)
+        self.samples += 1
+        self.updated_at = t
+
+    @property
+    def remaining(self) -> float:
+        return max(self.route.total - self.along, 0.0)
+
+    def as_dict(self) -> dict:
+        remaining = self.remaining
+        eta_s = remaining / self.speed if self.speed and self.speed > 0.1 else None
+        battery_at_finish = None
+        if self.battery is not None and self.drain_per_m is not None:
+            battery_at_finish = round(self.battery - self.drain_per_m * remaining, 1)
+        updated = datetime.utcfromtimestamp(self.updated_at) if self.updated_at else None
+        return {
+            "type": "progress",
+            "mission_id": self.mission_id,
+            "leg": self.leg,
+            "legs": self.route.legs,
+            "fraction": round(self.along / self.route.total, 4) if self.route.total else 1.0,
+            "distance_total_m": round(self.route.total, 1),
+            "distance_flown_m": round(self.flown, 1),
+            "distance_remaining_m": round(remaining, 1),
+            "off_route_m": round(self.off_route, 1),
+            "speed_mps": None if self.speed is None else round(self.speed, 2),
+            "eta_s": None if eta_s is None else round(eta_s, 1),
+            "eta": None if eta_s is None or updated is None else (updated + timedelta(seconds=eta_s)).isoformat(),
+            "battery": None if self.battery is None else round(self.battery, 1),
+            "battery_at_finish": battery_at_finish,
+            "finished": self.finished,
+            "timestamp": None if updated is None else updated.isoformat(),
+        }
+
+
+class MissionProgress:
+    def __init__(self, publish_interval_s: float = 1.0, off_route_m: float = 30.0, tau_s: float = 10.0):
+        self.publish_interval_s = publish_interval_s
+        self.off_route_m = off_route_m
+        self.tau_s = tau_s
+        self._trackers: Dict[int, ProgressTracker] = {}
+        self._loading: Dict[int, asyncio.Future] = {}
+        self._finished: "OrderedDict[int, dict]" = OrderedDict()
+        self._published_at: Dict[int, float] = {}
+        self.update_time = Histogram()
+
+    async def start(self, cluster):
+        cluster.handle("progress.get", self._get_local)
+
+    @staticmethod
+    def _load_route(mission_id: int) -> Optional[Route]:
+        db = SessionLocal()
+        try:
+            points = crud.get_mission_waypoints(db, mission_id)
+        finally:
+            db.close()
+        if not points:
+            return None
+        return Route([p[0] for p in points], [p[1] for p in points])
+
+    def _route_loaded(self, mission_id: int, fut: asyncio.Future):
+        if self._loading.get(mission_id) is not fut:
+            return  # the mission ended meanwhile
+        try:
+            route = fut.result()
+        except Exception:
+            logger.exception("Progress: loading the route of mission %s failed", mission_id)
+            route = None
+        if route is None:
+            return  # no waypoints: stays in _loading, so it is not read again until the mission ends
+        del self._loading[mission_id]
+        self._trackers[mission_id] = ProgressTracker(mission_id, route, self.off_route_m, self.tau_s)
+
+    def observe(self, mission_id: int, message: dict, t: float):
+        """Feed one telemetry sample; publishes a progress message at most every publish_interval_s."""
+        lat, lon = message.get("lat"), message.get("lon")
+        if lat is None or lon is None:
+            return
+        tracker = self._trackers.get(mission_id)
+        if tracker is None:
+            if mission_id not in self._loading:
+                # the first samples of a mission go by while its waypoints are read
+                fut = asyncio.get_running_loop().run_in_executor(None, self._load_route, mission_id)
+                fut.add_done_callback(lambda f: self._route_loaded(mission_id, f))
+                self._loading[mission_id] = fut
+            return
+        start = time.perf_counter()
+        tracker.update(t, lat, lon, message.get("battery"))
+        self.update_time.observe(time.perf_counter() - start)
+        if t - self._published_at.get(mission_id, -math.inf) >= self.publish_interval_s:
+            self._published_at[mission_id] = t
+            telemetry_hub.publish(mission_id, tracker.as_dict())
+
+    def forget(self, mission_id: int):
+        """The mission stopped sending: publish and keep its final state."""
+        self._loading.pop(mission_id, None)
+        self._published_at.pop(mission_id, None)
+        tracker = self._trackers.pop(mission_id, None)
+        if tracker is None:
+            return
+        tracker.finished = True
+        final = tracker.as_dict()
+        telemetry_hub.publish(mission_id, final)
+        self._finished[mission_id] = final
+        self._finished.move_to_end(mission_id)
+        while len(self._finished) > FINISHED_KEPT:
+            self._finished.popitem(last=False)
+
+    def get(self, mission_id: int) -> Optional[dict]:
+        tracker = self._trackers.get(mission_id)
+        return tracker.as_dict() if tracker is not None else self._finished.get(mission_id)
+
+    async def _get_local(self, mission_id: int) -> Optional[dict]:
+        return self.get(mission_id)
+
+    def stats(self) -> dict:
+        return {
+            "tracked": len(self._trackers),
+            "loading": sum(1 for f in self._loading.values() if not f.done()),
+            "finished": len(self._finished),
+            "samples": sum(t.samples for t in self._trackers.values()),
+            "rescans": sum(t.rescans for t in self._trackers.values()),
+            "update": self.update_time.as_dict(),
+        }
+
+
+mission_progress = MissionProgress(settings.PROGRESS_PUBLISH_S, settings.PROGRESS_OFF_ROUTE_M,
+                                   settings.PROGRESS_SMOOTHING_S)
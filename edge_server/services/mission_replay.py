@@ -0,0 +1,174 @@
+# edge_server/services/mission_replay.py
+# Replays a recorded mission (raw telemetry chunks + detections) in timestamp order.
+# Both sources are read in small keyset batches through their (mission_id, time)
+# indexes, so memory stays constant and seeking starts at the right chunk directly.
+# Every batch is read in its own short session, so a paced or slowly consumed replay
+# never holds a connection (or an open read transaction) between batches.
+import asyncio
+import heapq
+from datetime import datetime, timezone
+from typing import AsyncIterator, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from edge_server.database.db import ReadSessionLocal
+from edge_server.database.models import Detection, TelemetryChunk
+from edge_server.services.telemetry_store import FIELDS, RAW, unpack
+
+CHUNK_BATCH = 16
+DETECTION_BATCH = 500
+
+
+def _epoch(dt: datetime) -> float:
+    return dt.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _naive_utc(t: float) -> datetime:
+    return datetime.fromtimestamp(t, tz=timezone.utc).replace(tzinfo=None)
+
+
+def _iso(t: float) -> str:
+    return _naive_utc(t).isoformat()
+
+
+def parse_speed(speed: str) -> Optional[float]:
+    """"max" -> None (no pacing), otherwise a positive factor."""
+    if speed == "max":
+        return None
+    value = float(speed)
+    if value <= 0:
+        raise ValueError("speed must be positive")
+    return value
+
+
+def in_read_session(fn, *args):
+    """fn(session, *args) in a read-only session that is closed before returning."""
+    with ReadSessionLocal() as db:
+        return fn(db, *args)
+
+
+async def _read(fn, *args):
+    return await run_in_threadpool(in_read_session, fn, *args)
+
+
+def _chunks_query(mission_id: int):
+    return select(TelemetryChunk.id, TelemetryChunk.t_start, TelemetryChunk.data).where(
+        TelemetryChunk.mission_id == mission_id, TelemetryChunk.resolution == RAW)
+
+
+def first_chunk_start(db: Session, mission_id: int, since: Optional[float]) -> Optional[float]:
+    """t_start of the chunk containing `since` (the last one starting at or before it), via the index."""
+    if since is None:
+        return None
+    return db.execute(
+        select(func.max(TelemetryChunk.t_start)).where(TelemetryChunk.mission_id == mission_id,
+                                                       TelemetryChunk.resolution == RAW,
+                                                       TelemetryChunk.t_start <= since)
+    ).scalar()
+
+
+def telemetry_batch(db: Session, mission_id: int, after: Optional[tuple], start: Optional[float],
+                    until: Optional[float]):
+    """Up to CHUNK_BATCH raw chunks after the (t_start, id) keyset position."""
+    q = _chunks_query(mission_id)
+    if after is not None:
+        t, cid = after
+        q = q.where((TelemetryChunk.t_start > t) | ((TelemetryChunk.t_start == t) & (TelemetryChunk.id > cid)))
+    elif start is not None:
+        q = q.where(TelemetryChunk.t_start >= start)
+    if until is not None:
+        q = q.where(TelemetryChunk.t_start <= until)
+    return db.execute(q.order_by(TelemetryChunk.t_start, TelemetryChunk.id).limit(CHUNK_BATCH)).all()
+
+
+def detection_batch(db: Session, mission_id: int, after: Optional[tuple], since: Optional[datetime],
+                    until: Optional[datetime]):
+    q = select(Detection.id, Detection.created_at, Detection.lat, Detection.lon, Detection.label,
+               Detection.score).where(Detection.mission_id == mission_id)
+    if after is not None:
+        ts, did = after
+        q = q.where((Detection.created_at > ts) | ((Detection.created_at == ts) & (Detection.id > did)))
+    elif since is not None:
+        q = q.where(Detection.created_at >= since)
+    if until is not None:
+        q = q.where(Detection.created_at <= until)
+    return db.execute(q.order_by(Detection.created_at, Detection.id).limit(DETECTION_BATCH)).all()
+
+
+async def _telemetry_events(mission_id: int, since: Optional[float], until: Optional[float]) -> AsyncIterator[tuple]:
+    start = await _read(first_chunk_start, mission_id, since)
+    if since is not None and start is None:
+        start = since
+    after = None
+    while True:
+        rows = await _read(telemetry_batch, mission_id, after, start, until)
+        for cid, t_start, blob in rows:
+            cols = unpack(blob, RAW)
+            for i in range(cols.shape[1]):
+                t = float(cols[0, i])
+                if since is not None and t < since:
+                    continue
+                if until is not None and t > until:
+                    return
+                event = {"type": "telemetry", "mission_id": mission_id, "timestamp": _iso(t)}
+                for j, f in enumerate(FIELDS, 1):
+                    v = float(cols[j, i])
+                    event[f] = None if v != v else v
+                yield t, 0, event
+        if len(rows) < CHUNK_BATCH:
+            return
+        after = (rows[-1][1], rows[-1][0])
+
+
+async def _detection_events(mission_id: int, since: Optional[float], until: Optional[float]) -> AsyncIterator[tuple]:
+    # created_at is naive UTC
+    since_dt = None if since is None else _naive_utc(since)
+    until_dt = None if until is None else _naive_utc(until)
+    after = None
+    while True:
+        rows = await _read(detection_batch, mission_id, after, since_dt, until_dt)
+        for did, created_at, lat, lon, label, score in rows:
+            yield _epoch(created_at), 1, {"type": "detection", "mission_id": mission_id, "lat": lat, "lon": lon,
+                                          "label": label, "score": score, "timestamp": created_at.isoformat()}
+        if len(rows) < DETECTION_BATCH:
+            return
+        after = (rows[-1][1], rows[-1][0])
+
+
+async def _merge(*sources: AsyncIterator[tuple]) -> AsyncIterator[tuple]:
+    """heapq.merge for async iterators of (t, tiebreak, event)."""
+    heap = []
+    for idx, src in enumerate(sources):
+        item = await anext(src, None)
+        if item is not None:
+            heap.append((item[0], item[1], idx, item[2]))
+    heapq.heapify(heap)
+    while heap:
+        t, tie, idx, event = heap[0]
+        yield t, event
+        item = await anext(sources[idx], None)
+        if item is None:
+            heapq.heappop(heap)
+        else:
+            heapq.heapreplace(heap, (item[0], item[1], idx, item[2]))
+
+
+async def replay(mission_id: int, since: Optional[float] = None, until: Optional[float] = None,
+                 speed: Optional[float] = 1.0) -> AsyncIterator[tuple]:
+    """
+    (epoch seconds, event) in timestamp order, paced so that recorded time runs `speed` times faster than
+    wall time (speed None = as fast as the client reads).
+    """
+    loop = asyncio.get_running_loop()
+    origin = None
+    async for t, event in _merge(_telemetry_events(mission_id, since, until),
+                                 _detection_events(mission_id, since, until)):
+        if speed:
+            if origin is None:
+                origin = (t, loop.time())
+            delay = origin[1] + (t - origin[0]) / speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        yield t, event
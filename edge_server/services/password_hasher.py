@@ -0,0 +1,86 @@
+# edge_server/services/password_hasher.py
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+from edge_server.config import settings
+from edge_server.utils import security
+from edge_server.utils.logger import logger
+from edge_server.utils.metrics import LatencyStats
+
+
+class HasherBusy(Exception):
+    """Raised when a hash job could not be queued within the timeout."""
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt in a dedicated process pool so hashing neither blocks the event loop
+    nor competes for the GIL. At most max_pending jobs are admitted at once (running +
+    queued in the pool); further callers wait up to timeout seconds, then get HasherBusy.
+    """
+
+    def __init__(self, workers: int = 1, max_pending: int = 64, timeout: float = 10.0):
+        self.workers = max(1, workers)
+        self.max_pending = max(self.workers, max_pending)
+        self.timeout = timeout
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.pending = 0
+        self.rejected = 0
+        self.latency = LatencyStats()
+
+    def start(self):
+        if self._pool is None:
+            # spawn: forking a process that already runs an event loop and threads is unsafe
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            self._slots = asyncio.Semaphore(self.max_pending)
+            logger.info(f"Password hasher started with {self.workers} worker process(es)")
+
+    def stop(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+            self._slots = None
+
+    async def _run(self, fn, *args):
+        if self._pool is None:
+            self.start()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise HasherBusy()
+        self.pending += 1
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+        finally:
+            self.latency.observe(time.perf_counter() - start)
+            self.pending -= 1
+            self._slots.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(security.get_password_hash, password)
+
+    async def verify_and_update(self, password: str, hashed: Optional[str]) -> Tuple[bool, Optional[str]]:
+        """hashed=None (unknown user) still costs one bcrypt round trip."""
+        if hashed is None:
+            return await self._run(security.dummy_verify)
+        return await self._run(security.verify_and_update, password, hashed)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "rejected": self.rejected,
+            "bcrypt_rounds": settings.BCRYPT_ROUNDS,
+            "latency": self.latency.as_dict(),
+        }
+
+
+password_hasher = PasswordHasher(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_MAX_PENDING,
+                                 settings.PASSWORD_HASH_TIMEOUT)
@@ -0,0 +1,180 @@
+# edge_server/services/telemetry_hub.py
+import asyncio
+import json
+import time
+from collections import deque
+from typing import Dict, Optional, Set
+
+from edge_server.config import settings
+from edge_server.utils import wire
+from edge_server.utils.metrics import LatencyStats
+
+# Queue policies for a subscriber whose queue is full:
+#   drop_oldest     - discard the oldest queued frame
+#   coalesce_latest - like drop_oldest, but a new telemetry (or progress) frame also
+#                     replaces a frame of the same kind that is still waiting in the queue
+DROP_OLDEST = "drop_oldest"
+COALESCE_LATEST = "coalesce_latest"
+
+COALESCE_KINDS = {"telemetry", "progress"}
+
+
+class Frame:
+    """
+    A published message. It is serialized once and the same text is sent to every subscriber;
+    the binary encoding is made on first use and shared the same way.
+    """
+    __slots__ = ("kind", "data", "text", "_binary", "published_at")
+
+    def __init__(self, data: dict, text: Optional[str] = None):
+        self.kind = data.get("type")
+        self.data = data
+        self.text = json.dumps(data, default=str) if text is None else text
+        self._binary = None
+        self.published_at = time.perf_counter()
+
+    @property
+    def binary(self) -> bytes:
+        if self._binary is None:
+            self._binary = wire.encode(self.data)
+        return self._binary
+
+    @classmethod
+    def from_text(cls, text: str) -> "Frame":
+        """A frame published by another worker."""
+        return cls(json.loads(text), text)
+
+
+class Topic:
+    def __init__(self, mission_id: int):
+        self.mission_id = mission_id
+        self.subscribers: Set["Subscriber"] = set()
+        self.published = 0
+        self.dropped = 0
+        self.fanout = LatencyStats()
+        self.delivery = LatencyStats()
+
+    def as_dict(self):
+        return {
+            "mission_id": self.mission_id,
+            "subscribers": len(self.subscribers),
+            "published": self.published,
+            "dropped": self.dropped,
+            "fanout": self.fanout.as_dict(),
+            "delivery": self.delivery.as_dict(),
+        }
+
+
+class Subscriber:
+    def __init__(self, topic: Topic, maxsize: int, policy: str):
+        self.topic = topic
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped = 0
+        self._queue = deque()
+        self._ready = asyncio.Event()
+
+    def offer(self, frame: Frame) -> int:
+        """Queue a frame without ever blocking. Returns the number of frames dropped."""
+        dropped = 0
+        if self.policy == COALESCE_LATEST and frame.kind in COALESCE_KINDS:
+            for i, queued in enumerate(self._queue):
+                if queued.kind == frame.kind:
+                    del self._queue[i]
+                    dropped += 1
+                    break
+        if len(self._queue) >= self.maxsize:
+            self._queue.popleft()
+            dropped += 1
+        self._queue.append(frame)
+        self._ready.set()
+        self.dropped += dropped
+        return dropped
+
+    async def get(self) -> Frame:
+        while not self._queue:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._queue.popleft()
+
+    def delivered(self, frame: Frame):
+        self.topic.delivery.observe(time.perf_counter() - frame.published_at)
+
+
+class TelemetryHub:
+    """
+    In-process pub/sub with one topic per mission; a topic exists while it has subscribers.
+    publish() never awaits, so a slow WebSocket client can only lose its own frames.
+    Must be used from the event loop thread.
+
+    With a distributed broker attached, published frames are also sent on "mission.<id>", and
+    the hub subscribes to that channel while it has local subscribers for the mission, so a
+    WebSocket client sees a mission whichever worker it is connected to.
+    """
+
+    def __init__(self, queue_size: int = 64, policy: str = COALESCE_LATEST):
+        self.queue_size = queue_size
+        self.policy = policy
+        self._topics: Dict[int, Topic] = {}
+        self._broker = None
+
+    def attach(self, broker):
+        self._broker = broker if broker.distributed else None
+        if self._broker is not None:
+            for mission_id, topic in self._topics.items():
+                if topic.subscribers:
+                    self._broker.subscribe(f"mission.{mission_id}", self._on_remote)
+
+    def detach(self):
+        self._broker = None
+
+    def _on_remote(self, channel: str, text: str):
+        topic = self._topics.get(int(channel[len("mission."):]))
+        if topic is not None:
+            self._fanout(topic, Frame.from_text(text))
+
+    def _fanout(self, topic: Topic, frame: Frame):
+        start = time.perf_counter()
+        topic.published += 1
+        for sub in topic.subscribers:
+            topic.dropped += sub.offer(frame)
+        topic.fanout.observe(time.perf_counter() - start)
+
+    def _topic(self, mission_id: int) -> Topic:
+        topic = self._topics.get(mission_id)
+        if topic is None:
+            topic = self._topics[mission_id] = Topic(mission_id)
+        return topic
+
+    def subscribe(self, mission_id: int, maxsize: Optional[int] = None, policy: Optional[str] = None) -> Subscriber:
+        topic = self._topic(mission_id)
+        sub = Subscriber(topic, maxsize or self.queue_size, policy or self.policy)
+        if not topic.subscribers and self._broker is not None:
+            self._broker.subscribe(f"mission.{mission_id}", self._on_remote)
+        topic.subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        topic = sub.topic
+        topic.subscribers.discard(sub)
+        if not topic.subscribers:
+            if self._topics.get(topic.mission_id) is topic:
+                del self._topics[topic.mission_id]
+            if self._broker is not None:
+                self._broker.unsubscribe(f"mission.{topic.mission_id}")
+
+    def publish(self, mission_id: int, message: dict) -> Frame:
+        frame = Frame(message)
+        topic = self._topics.get(mission_id)
+        if topic is not None:
+            self._fanout(topic, frame)
+        if self._broker is not None:
+            self._broker.publish(f"mission.{mission_id}", frame.text)
+        return frame
+
+    def stats(self, mission_id: int) -> Optional[dict]:
+        topic = self._topics.get(mission_id)
+        return topic.as_dict() if topic else None
+
+
+telemetry_hub = TelemetryHub(queue_size=settings.WS_QUEUE_SIZE, policy=settings.WS_QUEUE_POLICY)
@@ -0,0 +1,388 @@
+# edge_server/services/telemetry_store.py
+import asyncio
+import math
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from edge_server.config import settings
+from edge_server.database.db import SessionLocal
+from edge_server.database.models import TelemetryChunk
+from edge_server.utils.logger import logger
+from edge_server.utils.metrics import LatencyStats
+
+FIELDS = ("lat", "lon", "alt", "battery")
+RAW = 0
+ROLLUPS = (1, 10, 60)
+RESOLUTIONS = (RAW,) + ROLLUPS
+
+# Chunk layouts (one float64 column after another, count values each):
+#   raw:    t, lat, lon, alt, battery
+#   rollup: t (bucket start), n, then min/max/mean for every field
+RAW_COLUMNS = ("t",) + FIELDS
+RECENT_POSITIONS = 128
+ROLLUP_COLUMNS = ("t", "n") + tuple(f"{f}_{stat}" for f in FIELDS for stat in ("min", "max", "mean"))
+
+
+def columns(resolution: int) -> Tuple[str, ...]:
+    return RAW_COLUMNS if resolution == RAW else ROLLUP_COLUMNS
+
+
+def pack(cols: np.ndarray) -> bytes:
+    return np.ascontiguousarray(cols, dtype="<f8").tobytes()
+
+
+def unpack(blob: bytes, resolution: int) -> np.ndarray:
+    return np.frombuffer(blob, dtype="<f8").reshape(len(columns(resolution)), -1)
+
+
+def _empty(resolution: int) -> np.ndarray:
+    return np.empty((len(columns(resolution)), 0))
+
+
+def rollup(raw: np.ndarray, res: int) -> np.ndarray:
+    """Raw columns sorted by t -> one rollup row per res-second bucket. NaN values are ignored."""
+    t = raw[0]
+    bucket = np.floor(t / res) * res
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    out = [bucket[starts], np.diff(np.r_[starts, len(t)]).astype(np.float64)]
+    for v in raw[1:]:
+        valid = ~np.isnan(v)
+        n = np.add.reduceat(valid.astype(np.float64), starts)
+        total = np.add.reduceat(np.where(valid, v, 0.0), starts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(n > 0, total / n, np.nan)
+        out += [np.fmin.reduceat(v, starts), np.fmax.reduceat(v, starts), mean]
+    return np.vstack(out)
+
+
+def merge_rollups(rows: np.ndarray) -> np.ndarray:
+    """Sort rollup rows by bucket and combine rows of the same bucket (means weighted by n)."""
+    if rows.shape[1] == 0:
+        return rows
+    rows = rows[:, np.argsort(rows[0], kind="stable")]
+    t = rows[0]
+    starts = np.flatnonzero(np.r_[True, t[1:] != t[:-1]])
+    if len(starts) == len(t):
+        return rows
+    n = rows[1]
+    out = [t[starts], np.add.reduceat(n, starts)]
+    for i in range(len(FIELDS)):
+        mn, mx, mean = rows[2 + 3 * i], rows[3 + 3 * i], rows[4 + 3 * i]
+        w = np.where(np.isnan(mean), 0.0, n)
+        wsum = np.add.reduceat(w, starts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            m = np.where(wsum > 0, np.add.reduceat(np.where(w > 0, mean * w, 0.0), starts) / wsum, np.nan)
+        out += [np.fmin.reduceat(mn, starts), np.fmax.reduceat(mx, starts), m]
+    return np.vstack(out)
+
+
+def interpolate_position(recent: Sequence[tuple], t: float,
+                         max_gap: float = 5.0) -> Optional[Tuple[float, float, Optional[float]]]:
+    """(lat, lon, alt) at time t from time-ordered (t, lat, lon, alt) samples; see TelemetryStore.position_at."""
+    if not recent:
+        return None
+    i = bisect_left(recent, (t,))
+    if i == 0 or i == len(recent):
+        s = recent[0] if i == 0 else recent[-1]
+        return s[1:] if abs(s[0] - t) <= max_gap else None
+    a, b = recent[i - 1], recent[i]
+    if b[0] - a[0] > 2 * max_gap:
+        s = a if t - a[0] <= b[0] - t else b
+        return s[1:] if abs(s[0] - t) <= max_gap else None
+    f = (t - a[0]) / (b[0] - a[0]) if b[0] > a[0] else 0.0
+    alt = None if a[3] is None or b[3] is None else a[3] + (b[3] - a[3]) * f
+    return a[1] + (b[1] - a[1]) * f, a[2] + (b[2] - a[2]) * f, alt
+
+
+class _Chunk:
+    __slots__ = ("mission_id", "resolution", "cols")
+
+    def __init__(self, mission_id: int, resolution: int, cols: np.ndarray):
+        self.mission_id = mission_id
+        self.resolution = resolution
+        self.cols = cols
+
+    def row(self) -> dict:
+        t = self.cols[0]
+        return {"mission_id": self.mission_id, "resolution": self.resolution, "t_start": float(t[0]),
+                "t_end": float(t[-1]), "count": int(self.cols.shape[1]), "data": pack(self.cols)}
+
+
+class _MissionBuffer:
+    __slots__ = ("cols", "last_append", "tails", "done", "done_since", "recent")
+
+    def __init__(self):
+        self.cols: List[list] = [[] for _ in RAW_COLUMNS]
+        # last positions (t, lat, lon, alt) for tagging detections, kept across seals
+        self.recent: deque = deque(maxlen=RECENT_POSITIONS)
+        self.last_append = time.monotonic()
+        # per rollup resolution: the still-open last bucket and completed buckets not yet chunked
+        self.tails: Dict[int, Optional[np.ndarray]] = {res: None for res in ROLLUPS}
+        self.done: Dict[int, List[np.ndarray]] = {res: [] for res in ROLLUPS}
+        self.done_since: Dict[int, float] = {res: time.monotonic() for res in ROLLUPS}
+
+
+class TelemetryStore:
+    """
+    Append-optimized per-mission telemetry. append() only pushes floats onto Python lists;
+    every chunk_seconds (or chunk_max_samples) the samples are sealed into one packed raw
+    chunk and folded into 1 s / 10 s / 60 s rollups, which are chunked rollup_chunk_rows
+    buckets (or rollup_flush_s seconds) at a time. Sealed chunks are written in one
+    executemany per flush_interval_ms by a background task and stay queryable meanwhile.
+    A failed write keeps them for the next flush; beyond max_pending_chunks the oldest are dropped.
+    """
+
+    def __init__(self, chunk_seconds: float = 10.0, chunk_max_samples: int = 1000, rollup_chunk_rows: int = 600,
+                 rollup_flush_s: float = 300.0, flush_interval_ms: int = 1000, max_pending_chunks: int = 2000,
+                 session_factory=SessionLocal):
+        self.chunk_seconds = chunk_seconds
+        self.chunk_max_samples = chunk_max_samples
+        self.rollup_chunk_rows = rollup_chunk_rows
+        self.rollup_flush_s = rollup_flush_s
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_pending_chunks = max_pending_chunks
+        self.session_factory = session_factory
+        self._missions: Dict[int, _MissionBuffer] = {}
+        self._pending: List[_Chunk] = []
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.samples = 0
+        self.chunks_written = 0
+        self.failed = 0
+        self.flush_time = LatencyStats()
+
+    # ingest
+
+    def append(self, mission_id: int, t: float, sample: dict):
+        with self._lock:
+            buf = self._missions.get(mission_id)
+            if buf is None:
+                buf = self._missions[mission_id] = _MissionBuffer()
+            cols = buf.cols
+            cols[0].append(t)
+            for i, f in enumerate(FIELDS, 1):
+                v = sample.get(f)
+                cols[i].append(math.nan if v is None else float(v))
+            buf.last_append = time.monotonic()
+            if sample.get("lat") is not None and sample.get("lon") is not None:
+                buf.recent.append((t, float(sample["lat"]), float(sample["lon"]), sample.get("alt")))
+            self.samples += 1
+            if len(cols[0]) >= self.chunk_max_samples or t - cols[0][0] >= self.chunk_seconds:
+                self._seal(mission_id, buf)
+
+    def position_at(self, mission_id: int, t: float, max_gap: float = 5.0) -> Optional[Tuple[float, float, Optional[float]]]:
+        """
+        (lat, lon, alt) at time t, interpolated between the surrounding samples; None when the
+        nearest sample is more than max_gap seconds away (no fix, or the mission is not live here).
+        """
+        with self._lock:
+            buf = self._missions.get(mission_id)
+            recent = list(buf.recent) if buf is not None else []
+        return interpolate_position(recent, t, max_gap)
+
+    def close(self, mission_id: int):
+        """Seal everything buffered for a mission, including its open rollup buckets."""
+        with self._lock:
+            buf = self._missions.pop(mission_id, None)
+            if buf is not None:
+                self._seal(mission_id, buf, final=True)
+
+    def _seal(self, mission_id: int, buf: _MissionBuffer, final: bool = False):
+        # caller holds the lock
+        if buf.cols[0]:
+            raw = np.array(buf.cols, dtype=np.float64)
+            buf.cols = [[] for _ in RAW_COLUMNS]
+            if np.any(raw[0, 1:] < raw[0, :-1]):
+                raw = raw[:, np.argsort(raw[0], kind="stable")]
+            self._pending.append(_Chunk(mission_id, RAW, raw))
+            for res in ROLLUPS:
+                rows = rollup(raw, res)
+                tail = buf.tails[res]
+                if tail is not None:
+                    if tail[0, 0] == rows[0, 0]:
+                        rows = np.hstack([merge_rollups(np.hstack([tail, rows[:, :1]])), rows[:, 1:]])
+                    else:
+                        buf.done[res].append(tail)
+                buf.tails[res] = rows[:, -1:]
+                if rows.shape[1] > 1:
+                    buf.done[res].append(rows[:, :-1])
+        now = time.monotonic()
+        for res in ROLLUPS:
+            if final and buf.tails[res] is not None:
+                buf.done[res].append(buf.tails[res])
+                buf.tails[res] = None
+            done = buf.done[res]
+            if not done:
+                continue
+            rows_done = sum(d.shape[1] for d in done)
+            if final or rows_done >= self.rollup_chunk_rows or now - buf.done_since[res] >= self.rollup_flush_s:
+                self._pending.append(_Chunk(mission_id, res, np.hstack(done)))
+                buf.done[res] = []
+                buf.done_since[res] = now
+
+    def _seal_idle(self):
+        """Missions that stopped sending keep their samples queryable, but they should reach the DB too."""
+        now = time.monotonic()
+        with self._lock:
+            for mission_id, buf in self._missions.items():
+                if buf.cols[0] and now - buf.last_append >= self.chunk_seconds:
+                    self._seal(mission_id, buf)
+
+    # background writer
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._closing = False
+        self._task = asyncio.get_event_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._closing = True
+        await self._task
+        self._task = None
+        for mission_id in list(self._missions):
+            self.close(mission_id)
+        await self.flush()
+
+    async def _run(self):
+        while not self._closing:
+            await asyncio.sleep(self.flush_interval)
+            self._seal_idle()
+            await self.flush()
+
+    async def flush(self):
+        with self._lock:
+            chunks = list(self._pending)
+        if not chunks:
+            return
+        start = time.perf_counter()
+        try:
+            await asyncio.get_event_loop().run_in_executor(None, self._write, [c.row() for c in chunks])
+            self.chunks_written += len(chunks)
+            # written chunks are served from the DB from now on
+            with self._lock:
+                del self._pending[:len(chunks)]
+        except Exception:
+            # kept (and still queryable) for the next flush, up to max_pending_chunks
+            with self._lock:
+                dropped = max(len(self._pending) - self.max_pending_chunks, 0)
+                del self._pending[:dropped]
+            self.failed += dropped
+            logger.exception("TelemetryStore: failed to write %s chunks, dropped the oldest %s",
+                             len(chunks), dropped)
+        finally:
+            self.flush_time.observe(time.perf_counter() - start)
+
+    def _write(self, rows: List[dict]):
+        db = self.session_factory()
+        try:
+            db.execute(TelemetryChunk.__table__.insert(), rows)
+            db.commit()
+        finally:
+            db.close()
+
+    # query
+
+    def _memory(self, mission_id: int, resolution: int) -> List[np.ndarray]:
+        with self._lock:
+            out = [c.cols for c in self._pending if c.mission_id == mission_id and c.resolution == resolution]
+            buf = self._missions.get(mission_id)
+            if buf is not None:
+                raw = np.array(buf.cols, dtype=np.float64) if buf.cols[0] else None
+                if resolution == RAW:
+                    if raw is not None:
+                        out.append(raw)
+                else:
+                    out.extend(buf.done[resolution])
+                    if buf.tails[resolution] is not None:
+                        out.append(buf.tails[resolution])
+                    if raw is not None:
+                        # samples not sealed yet, so live rollups are current
+                        out.append(rollup(raw[:, np.argsort(raw[0], kind="stable")], resolution))
+            return out
+
+    def query(self, db: Session, mission_id: int, since: Optional[float], until: Optional[float],
+              resolution: int) -> np.ndarray:
+        """Columns (see columns(resolution)) for the window, oldest first."""
+        # memory first: a chunk written meanwhile then shows up in the DB read instead of going missing
+        memory = self._memory(mission_id, resolution)
+        q = select(TelemetryChunk.data).where(TelemetryChunk.mission_id == mission_id,
+                                              TelemetryChunk.resolution == resolution)
+        if since is not None:
+            q = q.where(TelemetryChunk.t_end >= (since if resolution == RAW else since - resolution))
+        if until is not None:
+            q = q.where(TelemetryChunk.t_start <= until)
+        stored = [unpack(blob, resolution) for (blob,) in db.execute(q.order_by(TelemetryChunk.t_start))]
+        stored = np.hstack(stored) if stored else _empty(resolution)
+        # memory only contributes what the DB does not have yet
+        newest = stored[0].max() if stored.shape[1] else -math.inf
+        memory = [m[:, m[0] > newest] for m in memory]
+        cols = np.hstack([stored] + memory) if memory else stored
+        lo = -math.inf if since is None else (since if resolution == RAW else math.floor(since / resolution) * resolution)
+        hi = math.inf if until is None else until
+        cols = cols[:, (cols[0] >= lo) & (cols[0] <= hi)]
+        if resolution == RAW:
+            return cols[:, np.argsort(cols[0], kind="stable")]
+        return merge_rollups(cols)
+
+    def raw_extent(self, db: Session, mission_id: int, since: Optional[float],
+                   until: Optional[float]) -> Tuple[int, Optional[float], Optional[float]]:
+        """(approximate raw sample count, first t, last t) in the window, from chunk metadata."""
+        q = select(func.sum(TelemetryChunk.count), func.min(TelemetryChunk.t_start), func.max(TelemetryChunk.t_end)).where(
+            TelemetryChunk.mission_id == mission_id, TelemetryChunk.resolution == RAW)
+        if since is not None:
+            q = q.where(TelemetryChunk.t_end >= since)
+        if until is not None:
+            q = q.where(TelemetryChunk.t_start <= until)
+        count, first, last = db.execute(q).one()
+        count = count or 0
+        for m in self._memory(mission_id, RAW):
+            count += m.shape[1]
+            first = m[0, 0] if first is None else min(first, m[0, 0])
+            last = m[0, -1] if last is None else max(last, m[0, -1])
+        return count, first, last
+
+    def pick_resolution(self, db: Session, mission_id: int, since: Optional[float], until: Optional[float],
+                        max_points: int) -> int:
+        """Raw if the window holds at most max_points samples, else the finest rollup that fits."""
+        count, first, last = self.raw_extent(db, mission_id, since, until)
+        if count <= max_points:
+            return RAW
+        span = (until if until is not None else last) - (since if since is not None else first)
+        for res in ROLLUPS:
+            if span / res <= max_points:
+                return res
+        return ROLLUPS[-1]
+
+    def stats(self) -> dict:
+        with self._lock:
+            buffered = sum(len(b.cols[0]) for b in self._missions.values())
+            return {
+                "missions": len(self._missions),
+                "samples": self.samples,
+                "buffered_samples": buffered,
+                "pending_chunks": len(self._pending),
+                "chunks_written": self.chunks_written,
+                "failed": self.failed,
+                "flush": self.flush_time.as_dict(),
+            }
+
+
+telemetry_store = TelemetryStore(
+    chunk_seconds=settings.TELEMETRY_CHUNK_SECONDS,
+    chunk_max_samples=settings.TELEMETRY_CHUNK_MAX_SAMPLES,
+    rollup_chunk_rows=settings.TELEMETRY_ROLLUP_CHUNK_ROWS,
+    rollup_flush_s=settings.TELEMETRY_ROLLUP_FLUSH_S,
+    flush_interval_ms=settings.TELEMETRY_FLUSH_MS,
+    max_pending_chunks=settings.TELEMETRY_MAX_PENDING_CHUNKS,
+)
@@ -0,0 +1,118 @@
+# edge_server/utils/geo.py
+# NumPy versions of the geodesic helpers (spherical earth). All functions accept
+# scalars or arrays and broadcast; angles are in degrees, distances in metres.
+import numpy as np
+
+EARTH_RADIUS_M = 6371000.0
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def pairwise_distances(lat_a, lon_a, lat_b=None, lon_b=None):
+    """(len(a), len(b)) distance matrix; b defaults to a."""
+    lat_a, lon_a = np.asarray(lat_a, dtype=np.float64), np.asarray(lon_a, dtype=np.float64)
+    if lat_b is None:
+        lat_b, lon_b = lat_a, lon_a
+    lat_b, lon_b = np.asarray(lat_b, dtype=np.float64), np.asarray(lon_b, dtype=np.float64)
+    return haversine(lat_a[:, None], lon_a[:, None], lat_b[None, :], lon_b[None, :])
+
+
+def consecutive_distances(lat, lon):
+    """Length of each leg of a polyline (n - 1 values)."""
+    lat, lon = np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)
+    return haversine(lat[:-1], lon[:-1], lat[1:], lon[1:])
+
+
+def path_length(lat, lon):
+    """Cumulative distance along a polyline, starting at 0 (n values)."""
+    legs = consecutive_distances(lat, lon)
+    out = np.zeros(len(legs) + 1)
+    np.cumsum(legs, out=out[1:])
+    return out
+
+
+def bearing(lat1, lon1, lat2, lon2):
+    """Initial great-circle bearing from point 1 to point 2 in [0, 360)."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    dlon = lon2 - lon1
+    y = np.sin(dlon) * np.cos(lat2)
+    x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+    return np.degrees(np.arctan2(y, x)) % 360.0
+
+
+def consecutive_bearings(lat, lon):
+    lat, lon = np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)
+    return bearing(lat[:-1], lon[:-1], lat[1:], lon[1:])
+
+
+def destination_point(lat, lon, bearing_deg, distance_m):
+    lat, lon, brg = map(np.radians, (lat, lon, bearing_deg))
+    d = np.asarray(distance_m, dtype=np.float64) / EARTH_RADIUS_M
+    lat2 = np.arcsin(np.sin(lat) * np.cos(d) + np.cos(lat) * np.sin(d) * np.cos(brg))
+    lon2 = lon + np.arctan2(np.sin(brg) * np.sin(d) * np.cos(lat), np.cos(d) - np.sin(lat) * np.sin(lat2))
+    return np.degrees(lat2), (np.degrees(lon2) + 540.0) % 360.0 - 180.0
+
+
+def cross_track_distance(lat, lon, lat1, lon1, lat2, lon2):
+    """Signed distance from points to the great circle through 1 -> 2 (negative = left of track)."""
+    d13 = haversine(lat1, lon1, lat, lon) / EARTH_RADIUS_M
+    t13 = np.radians(bearing(lat1, lon1, lat, lon))
+    t12 = np.radians(bearing(lat1, lon1, lat2, lon2))
+    return np.arcsin(np.clip(np.sin(d13) * np.sin(t13 - t12), -1.0, 1.0)) * EARTH_RADIUS_M
+
+
+def along_track_distance(lat, lon, lat1, lon1, lat2, lon2):
+    """Distance from point 1 along the track 1 -> 2 to the foot of the perpendicular from each point."""
+    d13 = haversine(lat1, lon1, lat, lon) / EARTH_RADIUS_M
+    dxt = cross_track_distance(lat, lon, lat1, lon1, lat2, lon2) / EARTH_RADIUS_M
+    t13 = np.radians(bearing(lat1, lon1, lat, lon))
+    t12 = np.radians(bearing(lat1, lon1, lat2, lon2))
+    sign = np.sign(np.cos(t12 - t13))
+    return sign * np.arccos(np.clip(np.cos(d13) / np.cos(dxt), -1.0, 1.0)) * EARTH_RADIUS_M
+
+
+def segment_distance(lat, lon, lat1, lon1, lat2, lon2):
+    """Unsigned distance from points to the segment 1 -> 2 (clamped to the end points)."""
+    seg = haversine(lat1, lon1, lat2, lon2)
+    at = along_track_distance(lat, lon, lat1, lon1, lat2, lon2)
+    xt = np.abs(cross_track_distance(lat, lon, lat1, lon1, lat2, lon2))
+    return np.where(at < 0, haversine(lat, lon, lat1, lon1),
+                    np.where(at > seg, haversine(lat, lon, lat2, lon2), xt))
+
+
+class LocalENU:
+    """
+    Local east/north/up plane around an origin (equirectangular tangent approximation).
+    Good to well under a metre over a few km, which is the scale of a mission area.
+    """
+
+    def __init__(self, lat0: float, lon0: float, alt0: float = 0.0):
+        self.lat0 = float(lat0)
+        self.lon0 = float(lon0)
+        self.alt0 = float(alt0)
+        self._m_per_deg_lat = np.radians(1.0) * EARTH_RADIUS_M
+        self._m_per_deg_lon = self._m_per_deg_lat * np.cos(np.radians(self.lat0))
+
+    @classmethod
+    def around(cls, lat, lon):
+        """Origin at the centre of the bounding box of the given points."""
+        lat, lon = np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)
+        return cls((lat.min() + lat.max()) / 2, (lon.min() + lon.max()) / 2)
+
+    def forward(self, lat, lon, alt=None):
+        e = (np.asarray(lon, dtype=np.float64) - self.lon0) * self._m_per_deg_lon
+        n = (np.asarray(lat, dtype=np.float64) - self.lat0) * self._m_per_deg_lat
+        if alt is None:
+            return e, n
+        return e, n, np.asarray(alt, dtype=np.float64) - self.alt0
+
+    def inverse(self, e, n, u=None):
+        lat = self.lat0 + np.asarray(n, dtype=np.float64) / self._m_per_deg_lat
+        lon = self.lon0 + np.asarray(e, dtype=np.float64) / self._m_per_deg_lon
+        if u is None:
+            return lat, lon
+        return lat, lon, np.asarray(u, dtype=np.float64) + self.alt0
@@ -0,0 +1,215 @@
+# edge_server/utils/geofence.py
+# Point-in-polygon and segment-crossing tests against many polygons at once.
+# Every polygon edge is bucketed into a uniform grid by its bounding box, and for each
+# (cell, zone) pair the index stores whether the cell centre lies inside the zone. A point
+# is then inside a zone iff centre_inside XOR (the segment point -> cell centre crosses an
+# odd number of that zone's edges in the cell), so a query only looks at the handful of
+# edges in its own cell. Coordinates are planar lon/lat degrees (x = lon, y = lat).
+import math
+from typing import Sequence, Tuple
+
+import numpy as np
+
+TARGET_EDGES_PER_CELL = 4
+MAX_CELLS = 1 << 18
+
+
+def _orient(ax, ay, bx, by, cx, cy):
+    return (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+
+
+def _expand(starts: np.ndarray, cells: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """CSR rows `cells` -> (row position in `cells`, flat index into the CSR values)."""
+    lo, hi = starts[cells], starts[cells + 1]
+    counts = hi - lo
+    owner = np.repeat(np.arange(len(cells)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return owner, np.repeat(lo, counts) + offsets
+
+
+def _csr(keys: np.ndarray, values: np.ndarray, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    order = np.argsort(keys, kind="stable")
+    starts = np.searchsorted(keys[order], np.arange(n + 1))
+    return starts, values[order]
+
+
+def _box_cells(ix0, iy0, ix1, iy1, nx) -> Tuple[np.ndarray, np.ndarray]:
+    """Every (owner, cell) for inclusive cell ranges [ix0, ix1] x [iy0, iy1]."""
+    w = ix1 - ix0 + 1
+    counts = w * (iy1 - iy0 + 1)
+    owner = np.repeat(np.arange(len(ix0)), counts)
+    k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    w = np.repeat(w, counts)
+    cx = np.repeat(ix0, counts) + k % w
+    cy = np.repeat(iy0, counts) + k // w
+    return owner, cy * nx + cx
+
+
+class GeofenceIndex:
+    """
+    zones: per zone, its rings as (n, 2) [lon, lat] arrays (outer rings and holes alike;
+    membership is even-odd over all of a zone's rings).
+    """
+
+    def __init__(self, zones: Sequence[Sequence[np.ndarray]]):
+        x1, y1, x2, y2, owner = [], [], [], [], []
+        for z, rings in enumerate(zones):
+            for ring in rings:
+                ring = np.asarray(ring, dtype=np.float64)[:, :2]
+                if len(ring) and (ring[0] != ring[-1]).any():
+                    ring = np.vstack([ring, ring[:1]])
+                x1.append(ring[:-1, 0])
+                y1.append(ring[:-1, 1])
+                x2.append(ring[1:, 0])
+                y2.append(ring[1:, 1])
+                owner.append(np.full(len(ring) - 1, z, dtype=np.int64))
+        self.zones = len(zones)
+        cat = (lambda parts, dt=np.float64: np.concatenate(parts) if parts else np.empty(0, dtype=dt))
+        self.x1, self.y1, self.x2, self.y2 = cat(x1), cat(y1), cat(x2), cat(y2)
+        self.edge_zone = cat(owner, np.int64)
+        self.edges = len(self.x1)
+        # precomputed edge bounding boxes
+        self.ex0, self.ex1 = np.minimum(self.x1, self.x2), np.maximum(self.x1, self.x2)
+        self.ey0, self.ey1 = np.minimum(self.y1, self.y2), np.maximum(self.y1, self.y2)
+        zb = np.zeros((self.zones, 4))
+        for z in range(self.zones):
+            sel = self.edge_zone == z
+            if sel.any():
+                zb[z] = self.ex0[sel].min(), self.ey0[sel].min(), self.ex1[sel].max(), self.ey1[sel].max()
+        self.zone_bbox = zb
+        self._build_grid()
+
+    # build
+
+    def _build_grid(self):
+        if not self.edges:
+            self.nx = self.ny = 0
+            return
+        x0, y0 = self.ex0.min(), self.ey0.min()
+        w = max(self.ex1.max() - x0, 1e-9)
+        h = max(self.ey1.max() - y0, 1e-9)
+        cells = min(max(self.edges // TARGET_EDGES_PER_CELL, 1), MAX_CELLS)
+        self.nx = max(1, min(int(math.sqrt(cells * w / h)), cells))
+        self.ny = max(1, cells // self.nx)
+        self.x0, self.y0 = x0, y0
+        self.dx, self.dy = w / self.nx * (1 + 1e-12), h / self.ny * (1 + 1e-12)
+        n = self.nx * self.ny
+
+        e, cell = _box_cells(self._ix(self.ex0), self._iy(self.ey0), self._ix(self.ex1), self._iy(self.ey1), self.nx)
+        self.cell_edge_start, self.cell_edges = _csr(cell, e, n)
+
+        # (cell, zone) pairs for every cell a zone's bounding box touches, classified at the cell centre
+        zb = self.zone_bbox
+        z, cell = _box_cells(self._ix(zb[:, 0]), self._iy(zb[:, 1]), self._ix(zb[:, 2]), self._iy(zb[:, 3]), self.nx)
+        cx, cy = self._centre(cell)
+        inside = np.zeros(len(cell), dtype=bool)
+        for zone in range(self.zones):
+            sel = np.flatnonzero(z == zone)
+            if len(sel):
+                inside[sel] = self._ray_cast(cx[sel], cy[sel], np.flatnonzero(self.edge_zone == zone))
+        # keep pairs whose centre is inside, or whose cell holds edges of the zone (status can flip there)
+        edge_key = (np.repeat(np.arange(n), np.diff(self.cell_edge_start)) * self.zones
+                    + self.edge_zone[self.cell_edges])
+        has_edges = np.isin(cell * self.zones + z, edge_key)
+        keep = inside | has_edges
+        self.cell_zone_start, order = _csr(cell[keep], np.arange(int(keep.sum())), n)
+        self.cell_zones = z[keep][order]
+        self.cell_zone_inside = inside[keep][order]
+
+    def _ray_cast(self, px: np.ndarray, py: np.ndarray, edges: np.ndarray, chunk: int = 1 << 20) -> np.ndarray:
+        """Even-odd test of points against one zone's edges (build time only)."""
+        out = np.zeros(len(px), dtype=bool)
+        step = max(1, chunk // max(len(edges), 1))
+        x1, y1, x2, y2 = self.x1[edges], self.y1[edges], self.x2[edges], self.y2[edges]
+        for s in range(0, len(px), step):
+            x, y = px[s:s + step, None], py[s:s + step, None]
+            straddles = (y1 > y) != (y2 > y)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                xi = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+            out[s:s + step] = (straddles & (x < xi)).sum(axis=1) % 2 == 1
+        return out
+
+    def _ix(self, x):
+        return np.clip(np.floor((np.asarray(x) - self.x0) / self.dx), 0, self.nx - 1).astype(np.int64)
+
+    def _iy(self, y):
+        return np.clip(np.floor((np.asarray(y) - self.y0) / self.dy), 0, self.ny - 1).astype(np.int64)
+
+    def _centre(self, cell: np.ndarray):
+        return self.x0 + (cell % self.nx + 0.5) * self.dx, self.y0 + (cell // self.nx + 0.5) * self.dy
+
+    def _in_grid(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        return ((x >= self.x0) & (x <= self.x0 + self.nx * self.dx)
+                & (y >= self.y0) & (y <= self.y0 + self.ny * self.dy))
+
+    # queries
+
+    def contains(self, lat, lon) -> Tuple[np.ndarray, np.ndarray]:
+        """(point index, zone index) for every zone containing a point."""
+        y, x = np.atleast_1d(np.asarray(lat, dtype=np.float64)), np.atleast_1d(np.asarray(lon, dtype=np.float64))
+        if not self.edges:
+            return np.empty(0, np.int64), np.empty(0, np.int64)
+        pts = np.flatnonzero(self._in_grid(x, y))
+        x, y = x[pts], y[pts]
+        cell = self._iy(y) * self.nx + self._ix(x)
+        cx, cy = self._centre(cell)
+
+        # parity of crossings of point -> centre with each zone's edges in the cell
+        p, flat = _expand(self.cell_edge_start, cell)
+        e = self.cell_edges[flat]
+        a1, a2 = x[p], y[p]
+        b1, b2 = cx[p], cy[p]
+        ex1, ey1, ex2, ey2 = self.x1[e], self.y1[e], self.x2[e], self.y2[e]
+        # a vertex lying exactly on the segment counts on the positive side, so the two edges
+        # sharing it are counted consistently (same rule as half-open ray casting)
+        s1 = _orient(a1, a2, b1, b2, ex1, ey1) >= 0
+        s2 = _orient(a1, a2, b1, b2, ex2, ey2) >= 0
+        t1 = _orient(ex1, ey1, ex2, ey2, a1, a2)
+        t2 = _orient(ex1, ey1, ex2, ey2, b1, b2)
+        cross = (s1 != s2) & (((t1 > 0) & (t2 < 0)) | ((t1 < 0) & (t2 > 0)))
+        flip_keys, flip_counts = np.unique(p[cross] * self.zones + self.edge_zone[e[cross]], return_counts=True)
+        odd = flip_keys[flip_counts % 2 == 1]
+
+        q, flat = _expand(self.cell_zone_start, cell)
+        zones = self.cell_zones[flat]
+        inside = self.cell_zone_inside[flat] ^ np.isin(q * self.zones + zones, odd)
+        return pts[q[inside]], zones[inside]
+
+    def crossings(self, lat1, lon1, lat2, lon2) -> Tuple[np.ndarray, np.ndarray]:
+        """(segment index, zone index) for every zone boundary a segment crosses."""
+        ay, ax = np.atleast_1d(np.asarray(lat1, dtype=np.float64)), np.atleast_1d(np.asarray(lon1, dtype=np.float64))
+        by, bx = np.atleast_1d(np.asarray(lat2, dtype=np.float64)), np.atleast_1d(np.asarray(lon2, dtype=np.float64))
+        if not self.edges or not len(ax):
+            return np.empty(0, np.int64), np.empty(0, np.int64)
+        sx0, sx1 = np.minimum(ax, bx), np.maximum(ax, bx)
+        sy0, sy1 = np.minimum(ay, by), np.maximum(ay, by)
+        hits = (sx1 >= self.x0) & (sx0 <= self.x0 + self.nx * self.dx) & (sy1 >= self.y0) & (sy0 <= self.y0 + self.ny * self.dy)
+        segs = np.flatnonzero(hits)
+        s, cell = _box_cells(self._ix(sx0[segs]), self._iy(sy0[segs]), self._ix(sx1[segs]), self._iy(sy1[segs]), self.nx)
+        p, flat = _expand(self.cell_edge_start, cell)
+        seg, e = segs[s[p]], self.cell_edges[flat]
+        # an edge spanning several cells shows up once per cell
+        pair = np.unique(seg * self.edges + e)
+        seg, e = pair // self.edges, pair % self.edges
+        # cheap bounding box rejection before the orientation tests
+        ok = (self.ex1[e] >= sx0[seg]) & (self.ex0[e] <= sx1[seg]) & (self.ey1[e] >= sy0[seg]) & (self.ey0[e] <= sy1[seg])
+        seg, e = seg[ok], e[ok]
+        a1, a2, b1, b2 = ax[seg], ay[seg], bx[seg], by[seg]
+        ex1, ey1, ex2, ey2 = self.x1[e], self.y1[e], self.x2[e], self.y2[e]
+        d1 = _orient(a1, a2, b1, b2, ex1, ey1)
+        d2 = _orient(a1, a2, b1, b2, ex2, ey2)
+        d3 = _orient(ex1, ey1, ex2, ey2, a1, a2)
+        d4 = _orient(ex1, ey1, ex2, ey2, b1, b2)
+        cross = (d1 * d2 <= 0) & (d3 * d4 <= 0) & ~((d1 == 0) & (d2 == 0))
+        pair = np.unique(seg[cross] * self.zones + self.edge_zone[e[cross]])
+        return pair // self.zones, pair % self.zones
+
+    def stats(self) -> dict:
+        return {
+            "zones": self.zones,
+            "edges": self.edges,
+            "grid": [self.nx, self.ny],
+            "cell_edges": int(len(self.cell_edges)) if self.edges else 0,
+            "cell_zones": int(len(self.cell_zones)) if self.edges else 0,
+        }
+
@@ -0,0 +1,65 @@
+# edge_server/utils/metrics.py
+# Small in-process counters used by the stats endpoints.
+
+
+class LatencyStats:
+    __slots__ = ("count", "total", "max", "last")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def as_dict(self):
+        mean = self.total / self.count if self.count else 0.0
+        return {
+            "count": self.count,
+            "mean_ms": round(mean * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+            "last_ms": round(self.last * 1000, 3),
+        }
+
+
+class Histogram:
+    """Latency histogram with fixed log-spaced buckets (ms); percentiles are bucket upper bounds."""
+    BOUNDS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS_MS) + 1)
+        self.stats = LatencyStats()
+
+    def observe(self, seconds: float):
+        self.stats.observe(seconds)
+        ms = seconds * 1000
+        for i, bound in enumerate(self.BOUNDS_MS):
+            if ms <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def percentile(self, q: float) -> float:
+        n = self.stats.count
+        if not n:
+            return 0.0
+        rank, seen = q * n, 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return self.BOUNDS_MS[i] if i < len(self.BOUNDS_MS) else round(self.stats.max * 1000, 3)
+        return round(self.stats.max * 1000, 3)
+
+    def as_dict(self):
+        d = self.stats.as_dict()
+        d.update(p50_ms=self.percentile(0.5), p90_ms=self.percentile(0.9), p99_ms=self.percentile(0.99))
+        d["buckets"] = {f"le_{b:g}ms": c for b, c in zip(self.BOUNDS_MS, self.counts) if c}
+        if self.counts[-1]:
+            d["buckets"]["inf"] = self.counts[-1]
+        return d
@@ -0,0 +1,42 @@
+# edge_server/utils/polyline.py
+# Encoded polyline format (Google / OSRM): zig-zag varints of coordinate deltas in ASCII.
+from typing import List, Sequence, Tuple
+
+
+def encode(lat: Sequence[float], lon: Sequence[float], precision: int = 5) -> str:
+    factor = 10 ** precision
+    out: List[str] = []
+    prev_lat = prev_lon = 0
+    for la, lo in zip(lat, lon):
+        ilat, ilon = int(round(la * factor)), int(round(lo * factor))
+        for delta in (ilat - prev_lat, ilon - prev_lon):
+            v = ~(delta << 1) if delta < 0 else delta << 1
+            while v >= 0x20:
+                out.append(chr((0x20 | (v & 0x1F)) + 63))
+                v >>= 5
+            out.append(chr(v + 63))
+        prev_lat, prev_lon = ilat, ilon
+    return "".join(out)
+
+
+def decode(encoded: str, precision: int = 5) -> List[Tuple[float, float]]:
+    factor = 10 ** precision
+    coords = []
+    index = lat = lon = 0
+    length = len(encoded)
+    while index < length:
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                b = ord(encoded[index]) - 63
+                index += 1
+                result |= (b & 0x1F) << shift
+                shift += 5
+                if b < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lon += deltas[1]
+        coords.append((lat / factor, lon / factor))
+    return coords
@@ -0,0 +1,133 @@
+# edge_server/utils/simplify.py
+# Polyline simplification in metres. Points are projected to a local ENU frame and
+# altitude is used as the third axis, so climbs/descents are kept like turns.
+import heapq
+from typing import Optional
+
+import numpy as np
+
+from edge_server.utils.geo import LocalENU
+
+METHODS = ("dp", "vw")
+
+
+def _enu3(lat, lon, alt=None) -> np.ndarray:
+    lat, lon = np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)
+    e, n = LocalENU.around(lat, lon).forward(lat, lon)
+    if alt is None:
+        u = np.zeros_like(e)
+    else:
+        u = np.asarray(alt, dtype=np.float64)
+        u = np.where(np.isnan(u), 0.0, u)
+    return np.column_stack([e, n, u])
+
+
+def _point_segment_distance(p: np.ndarray, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Distances from points p (k, 3) to segments a -> b (k, 3 or 3)."""
+    ab = b - a
+    denom = (ab * ab).sum(axis=-1)
+    t = np.where(denom > 0, ((p - a) * ab).sum(axis=-1) / np.where(denom > 0, denom, 1.0), 0.0)
+    t = np.clip(t, 0.0, 1.0)
+    return np.linalg.norm(p - (a + t[..., None] * ab), axis=-1)
+
+
+def douglas_peucker(xyz: np.ndarray, tolerance: float) -> np.ndarray:
+    """Indices of the points kept by Douglas-Peucker (iterative, vectorized per span)."""
+    n = len(xyz)
+    if n <= 2:
+        return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2:
+            continue
+        d = _point_segment_distance(xyz[i + 1:j], xyz[i], xyz[j])
+        k = int(np.argmax(d))
+        if d[k] > tolerance:
+            k += i + 1
+            keep[k] = True
+            stack.append((i, k))
+            stack.append((k, j))
+    return np.flatnonzero(keep)
+
+
+def visvalingam(xyz: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Indices kept by Visvalingam-Whyatt. Points are dropped, smallest first, while the triangle
+    they form with their neighbours has an area below tolerance**2.
+    """
+    n = len(xyz)
+    if n <= 2:
+        return np.arange(n)
+    threshold = tolerance * tolerance
+
+    xs, ys, zs = xyz[:, 0].tolist(), xyz[:, 1].tolist(), xyz[:, 2].tolist()
+
+    def area(a, b, c):
+        ux, uy, uz = xs[b] - xs[a], ys[b] - ys[a], zs[b] - zs[a]
+        vx, vy, vz = xs[c] - xs[a], ys[c] - ys[a], zs[c] - zs[a]
+        cx, cy, cz = uy * vz - uz * vy, uz * vx - ux * vz, ux * vy - uy * vx
+        return 0.5 * (cx * cx + cy * cy + cz * cz) ** 0.5
+
+    prev = list(range(-1, n - 1))
+    nxt = list(range(1, n + 1))
+    alive = [True] * n
+    a0 = np.linalg.norm(np.cross(xyz[1:-1] - xyz[:-2], xyz[2:] - xyz[:-2]), axis=1) * 0.5
+    heap = [(float(a), i + 1) for i, a in enumerate(a0)]
+    heapq.heapify(heap)
+    current = [0.0] + a0.tolist() + [0.0]
+    last = 0.0
+    while heap:
+        a, i = heapq.heappop(heap)
+        if not alive[i] or a != current[i]:
+            continue
+        # effective area never decreases, so a point cannot outlive a neighbour removed before it
+        if max(a, last) >= threshold:
+            break
+        last = max(a, last)
+        alive[i] = False
+        p, q = prev[i], nxt[i]
+        nxt[p], prev[q] = q, p
+        for k in (p, q):
+            if 0 < k < n - 1:
+                current[k] = area(prev[k], k, nxt[k])
+                heapq.heappush(heap, (current[k], k))
+    return np.flatnonzero(alive)
+
+
+def max_deviation(xyz: np.ndarray, kept: np.ndarray) -> float:
+    """Largest distance of an original point from the simplified polyline segment that replaces it."""
+    if len(kept) < 2 or len(kept) == len(xyz):
+        return 0.0
+    idx = np.arange(len(xyz))
+    seg = np.clip(np.searchsorted(kept, idx, side="right") - 1, 0, len(kept) - 2)
+    d = _point_segment_distance(xyz, xyz[kept[seg]], xyz[kept[seg + 1]])
+    return float(d.max())
+
+
+def simplify(lat, lon, alt=None, tolerance_m: float = 1.0, method: str = "dp"):
+    """
+    Simplify a route. Returns (kept indices, report) where report has original/simplified
+    point counts and the maximum deviation in metres.
+    """
+    if method not in METHODS:
+        raise ValueError(f"unknown simplification method {method!r}, expected one of {METHODS}")
+    xyz = _enu3(lat, lon, alt)
+    kept = douglas_peucker(xyz, tolerance_m) if method == "dp" else visvalingam(xyz, tolerance_m)
+    report = {
+        "method": method,
+        "tolerance_m": tolerance_m,
+        "original_points": len(xyz),
+        "simplified_points": len(kept),
+        "max_deviation_m": round(max_deviation(xyz, kept), 3),
+    }
+    return kept, report
+
+
+def alt_array(alts) -> Optional[np.ndarray]:
+    """Altitudes with None as NaN, or None when no point has an altitude."""
+    if all(a is None for a in alts):
+        return None
+    return np.array([np.nan if a is None else a for a in alts], dtype=np.float64)
@@ -0,0 +1,230 @@
+# edge_server/utils/wire.py
+# Compact binary encoding of mission stream messages, the alternative to JSON for clients that
+# ask for format=binary. All integers are little endian.
+#
+# Every message starts with a kind byte:
+#   TELEMETRY        mission u32, t ms i64, lat/lon i32 (1e-7 deg), alt i32 (mm),
+#                    battery u8, heading u16 (centidegrees)                       28 bytes
+#   DETECTION        mission u32, t ms i64, lat/lon i32, score u16 (1e-4), bbox flag u8,
+#                    [x1 y1 x2 y2 f32], label length u8, label utf-8
+#   TELEMETRY_BLOCK  mission u32, count u32, then the columns t, lat, lon, alt (first value
+#                    as i64, then the differences, as i16, i32 or i64 after a width byte)
+#                    and battery (u8 each); consecutive samples cost about 11 bytes
+#   JSON             any other message as UTF-8 JSON
+# Missing values use the largest value of the field's type (i32/i64: the smallest).
+# Fixed point keeps 1 cm of position, 1 mm of altitude and 1 ms of time; a stream of
+# several messages (HTTP replay) prefixes each with its length as u32.
+import struct
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, List, Optional, Sequence
+
+import numpy as np
+import orjson
+
+JSON = 0
+TELEMETRY = 1
+DETECTION = 2
+TELEMETRY_BLOCK = 3
+
+MEDIA_TYPE = "application/x-edge-stream"
+
+_TELEMETRY = struct.Struct("<BIqiiiBH")
+_DETECTION = struct.Struct("<BIqiiHB")
+_BBOX = struct.Struct("<4f")
+_BLOCK = struct.Struct("<BII")
+_LENGTH = struct.Struct("<I")
+
+NO_MISSION = 0xFFFFFFFF
+NO_I32 = -(2 ** 31)
+NO_I64 = -(2 ** 63)
+NO_U8 = 0xFF
+NO_U16 = 0xFFFF
+
+DEG = 1e7
+MM = 1e3
+SCORE = 1e4
+CENTIDEG = 1e2
+
+_EPOCH = datetime(1970, 1, 1)
+_MS = timedelta(milliseconds=1)
+
+
+def _fixed(value, scale: float, missing: int) -> int:
+    return missing if value is None else int(round(value * scale))
+
+
+def _float(value: int, scale: float, missing: int) -> Optional[float]:
+    return None if value == missing else value / scale
+
+
+def to_ms(timestamp) -> int:
+    """ISO timestamp (naive = UTC), datetime or epoch seconds -> epoch milliseconds."""
+    if timestamp is None:
+        return NO_I64
+    if isinstance(timestamp, (int, float)):
+        return int(round(timestamp * 1000))
+    dt = datetime.fromisoformat(timestamp) if isinstance(timestamp, str) else timestamp
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return (dt - _EPOCH) // _MS
+
+
+def from_ms(ms: int) -> Optional[str]:
+    return None if ms == NO_I64 else (_EPOCH + ms * _MS).isoformat()
+
+
+# single messages
+
+
+def encode(message: dict) -> bytes:
+    """One stream message; telemetry and detections get their fixed layouts, the rest JSON."""
+    kind = message.get("type")
+    mission = message.get("mission_id")
+    mission = NO_MISSION if mission is None else mission
+    if kind == "telemetry":
+        return _TELEMETRY.pack(
+            TELEMETRY, mission, to_ms(message.get("timestamp")),
+            _fixed(message.get("lat"), DEG, NO_I32), _fixed(message.get("lon"), DEG, NO_I32),
+            _fixed(message.get("alt"), MM, NO_I32), _fixed(message.get("battery"), 1, NO_U8),
+            _fixed(message.get("heading"), CENTIDEG, NO_U16),
+        )
+    if kind == "detection":
+        label = str(message.get("label", "")).encode()[:255]
+        bbox = message.get("bbox")
+        out = _DETECTION.pack(
+            DETECTION, mission, to_ms(message.get("timestamp")),
+            _fixed(message.get("lat"), DEG, NO_I32), _fixed(message.get("lon"), DEG, NO_I32),
+            _fixed(message.get("score"), SCORE, NO_U16), bbox is not None,
+        )
+        if bbox is not None:
+            out += _BBOX.pack(*bbox)
+        return out + bytes((len(label),)) + label
+    return bytes((JSON,)) + orjson.dumps(message, default=str)
+
+
+def _decode_telemetry(buf, offset: int = 0) -> dict:
+    _, mission, t, lat, lon, alt, battery, heading = _TELEMETRY.unpack_from(buf, offset)
+    return {
+        "type": "telemetry",
+        "mission_id": None if mission == NO_MISSION else mission,
+        "lat": _float(lat, DEG, NO_I32),
+        "lon": _float(lon, DEG, NO_I32),
+        "alt": _float(alt, MM, NO_I32),
+        "battery": None if battery == NO_U8 else battery,
+        "heading": _float(heading, CENTIDEG, NO_U16),
+        "timestamp": from_ms(t),
+    }
+
+
+def _decode_detection(buf) -> dict:
+    _, mission, t, lat, lon, score, has_bbox = _DETECTION.unpack_from(buf)
+    offset = _DETECTION.size
+    out = {
+        "type": "detection",
+        "mission_id": None if mission == NO_MISSION else mission,
+        "lat": _float(lat, DEG, NO_I32),
+        "lon": _float(lon, DEG, NO_I32),
+        "score": _float(score, SCORE, NO_U16),
+    }
+    if has_bbox:
+        out["bbox"] = [round(v, 1) for v in _BBOX.unpack_from(buf, offset)]
+        offset += _BBOX.size
+    n = buf[offset]
+    out["label"] = bytes(buf[offset + 1:offset + 1 + n]).decode()
+    out["timestamp"] = from_ms(t)
+    return out
+
+
+def decode(buf) -> List[dict]:
+    """Messages in one encoded message (a block holds several)."""
+    kind = buf[0]
+    if kind == TELEMETRY:
+        return [_decode_telemetry(buf)]
+    if kind == DETECTION:
+        return [_decode_detection(buf)]
+    if kind == TELEMETRY_BLOCK:
+        return decode_telemetry_block(buf)
+    if kind == JSON:
+        return [orjson.loads(bytes(buf[1:]))]
+    raise ValueError(f"unknown message kind {kind}")
+
+
+# telemetry blocks
+
+
+def _column(values: np.ndarray) -> bytes:
+    """First value as i64, then the differences in the narrowest of i16 / i32 / i64 that holds them."""
+    head = struct.pack("<q", int(values[0])) if len(values) else b""
+    diff = np.diff(values)
+    for width, dtype in ((2, "<i2"), (4, "<i4"), (8, "<i8")):
+        info = np.iinfo(dtype)
+        if not len(diff) or (diff.min() >= info.min and diff.max() <= info.max):
+            return head + bytes((width,)) + diff.astype(dtype).tobytes()
+
+
+def _read_column(buf, offset: int, n: int):
+    if not n:
+        return np.empty(0, np.int64), offset + 1
+    first = struct.unpack_from("<q", buf, offset)[0]
+    width = buf[offset + 8]
+    offset += 9
+    diff = np.frombuffer(buf, dtype=f"<i{width}", count=n - 1, offset=offset).astype(np.int64)
+    values = np.empty(n, np.int64)
+    values[0] = first
+    np.cumsum(diff, out=values[1:])
+    values[1:] += first
+    return values, offset + width * (n - 1)
+
+
+def _fixed_array(values, scale: float, missing: int) -> np.ndarray:
+    v = np.asarray(values, dtype=np.float64) * scale
+    return np.where(np.isnan(v), missing, np.round(v)).astype(np.int64)
+
+
+def encode_telemetry_block(mission_id: Optional[int], t: Sequence[float], lat: Sequence[float],
+                           lon: Sequence[float], alt: Sequence[float], battery: Sequence[float]) -> bytes:
+    """Samples of one mission (epoch seconds, NaN = missing) as one delta-encoded message."""
+    t_ms = np.round(np.asarray(t, dtype=np.float64) * 1000).astype(np.int64)
+    battery = _fixed_array(battery, 1, NO_U8)
+    parts = [_BLOCK.pack(TELEMETRY_BLOCK, NO_MISSION if mission_id is None else mission_id, len(t_ms)),
+             _column(t_ms), _column(_fixed_array(lat, DEG, NO_I32)), _column(_fixed_array(lon, DEG, NO_I32)),
+             _column(_fixed_array(alt, MM, NO_I32)), np.clip(battery, 0, NO_U8).astype(np.uint8).tobytes()]
+    return b"".join(parts)
+
+
+def decode_telemetry_columns(buf):
+    """(mission_id, t ms, lat, lon, alt, battery) arrays of a block, fixed point, missing values as sentinels."""
+    _, mission, n = _BLOCK.unpack_from(buf)
+    offset = _BLOCK.size
+    cols = []
+    for _ in range(4):
+        col, offset = _read_column(buf, offset, n)
+        cols.append(col)
+    battery = np.frombuffer(buf, dtype=np.uint8, count=n, offset=offset)
+    return (None if mission == NO_MISSION else mission), *cols, battery
+
+
+def decode_telemetry_block(buf) -> List[dict]:
+    mission, t, lat, lon, alt, battery = decode_telemetry_columns(buf)
+    return [{
+        "type": "telemetry", "mission_id": mission,
+        "lat": _float(la, DEG, NO_I32), "lon": _float(lo, DEG, NO_I32), "alt": _float(al, MM, NO_I32),
+        "battery": None if b == NO_U8 else b, "timestamp": from_ms(ms),
+    } for ms, la, lo, al, b in zip(t.tolist(), lat.tolist(), lon.tolist(), alt.tolist(), battery.tolist())]
+
+
+# length-prefixed streams
+
+
+def frame(message: bytes) -> bytes:
+    return _LENGTH.pack(len(message)) + message
+
+
+def iter_stream(buf) -> Iterator[dict]:
+    """Messages of a length-prefixed stream (e.g. a binary replay body)."""
+    view, offset = memoryview(buf), 0
+    while offset < len(view):
+        (n,) = _LENGTH.unpack_from(view, offset)
+        offset += _LENGTH.size
+        yield from decode(view[offset:offset + n])
+        offset += n